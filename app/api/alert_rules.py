@@ -4,32 +4,82 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, func, desc
 import time
+from loguru import logger
 
 from app.db.database import get_db
 from app.models.alert import AlertRule, AlertEvent, AlertEventHistory
-from app.models.silence import SilenceRule
 from app.models.user import User
 from app.api.auth import get_current_user
-from app.services.silence_matcher import check_silence_match
 from app.services.cache_service import CacheService
+from app.services.eval_stats import eval_stats_registry
 from app.schemas.alert import (
     AlertRuleCreate, AlertRuleUpdate, AlertRuleResponse,
     AlertEventResponse, AlertEventHistoryResponse
 )
-from app.schemas.alert_test import AlertRuleTestRequest, AlertRuleTestResponse, AlertRuleTestMetric
+from app.schemas.alert_test import (
+    AlertRuleTestRequest, AlertRuleTestResponse, AlertRuleTestMetric,
+    AlertRuleBacktestRequest, AlertRuleBacktestResponse
+)
 
 router = APIRouter()
 
 
+async def _analyze_rule_cost(
+    db: AsyncSession,
+    expr: str,
+    eval_interval: int,
+    datasource_id: int,
+    tenant_id: int,
+    probe: bool = True
+) -> Dict[str, Any]:
+    """分析规则查询成本（静态分析 + 可选的 count() 基数探测）
+    
+    数据源按租户过滤加载，不存在或属于其他租户时返回 404，不做任何探测。
+    """
+    from app.models.datasource import DataSource
+    from app.services.promql_analyzer import analyze_rule_cost
+    
+    result = await db.execute(
+        select(DataSource).where(
+            DataSource.id == datasource_id,
+            DataSource.tenant_id == tenant_id
+        )
+    )
+    datasource = result.scalar_one_or_none()
+    if not datasource:
+        raise HTTPException(status_code=404, detail="数据源不存在")
+    
+    cost = await analyze_rule_cost(expr, eval_interval, datasource=datasource if probe else None, probe=probe)
+    
+    if cost["level"] == "heavy":
+        logger.warning(
+            f"高成本告警规则: score={cost['score']}, expr={expr}, "
+            f"eval_interval={eval_interval}s, warnings={cost['warnings']}"
+        )
+    return cost
+
+
 @router.post("/", response_model=AlertRuleResponse, status_code=status.HTTP_201_CREATED)
 async def create_alert_rule(
     rule_data: AlertRuleCreate,
+    probe_cardinality: bool = Query(True, description="保存时是否对数据源做 count() 基数探测"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """创建告警规则"""
+    """创建告警规则
+    
+    保存前对 PromQL 做成本分析，评分写入 cost_score / cost_detail，
+    调度器据此对高成本规则做准入控制和错峰。
+    """
+    cost = await _analyze_rule_cost(
+        db, rule_data.expr, rule_data.eval_interval, rule_data.datasource_id,
+        current_user.tenant_id, probe_cardinality
+    )
+    
     new_rule = AlertRule(
         **rule_data.dict(),
+        cost_score=cost["score"],
+        cost_detail=cost,
         tenant_id=current_user.tenant_id
     )
     
@@ -133,6 +183,7 @@ async def update_alert_rule(
     rule_id: int,
     rule_data: AlertRuleUpdate,
     project_id: int = Query(None, description="项目ID,不传则不校验项目"),
+    probe_cardinality: bool = Query(True, description="保存时是否对数据源做 count() 基数探测"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -156,9 +207,19 @@ async def update_alert_rule(
     new_name = rule_data.name if rule_data.name is not None else old_name
     name_changed = new_name != old_name
     
-    for key, value in rule_data.dict(exclude_unset=True).items():
+    update_fields = rule_data.dict(exclude_unset=True)
+    for key, value in update_fields.items():
         setattr(rule, key, value)
     
+    # 表达式、评估间隔或数据源变化时重新分析查询成本
+    if {'expr', 'eval_interval', 'datasource_id'} & update_fields.keys() or not rule.cost_detail:
+        cost = await _analyze_rule_cost(
+            db, rule.expr, rule.eval_interval, rule.datasource_id,
+            current_user.tenant_id, probe_cardinality
+        )
+        rule.cost_score = cost["score"]
+        rule.cost_detail = cost
+    
     # 如果规则名称变了，同步更新所有关联的告警事件
     if name_changed:
         # 更新当前告警事件
@@ -194,7 +255,6 @@ async def delete_alert_rule(
 ):
     """删除告警规则"""
     from sqlalchemy import text
-    from loguru import logger
     
     conditions = [
         AlertRule.id == rule_id,
@@ -244,6 +304,41 @@ async def delete_alert_rule(
         raise HTTPException(status_code=500, detail=f"删除失败: {str(e)}")
 
 
+@router.get("/eval-stats/top")
+async def list_top_eval_stats(
+    limit: int = Query(10, ge=1, le=100, description="返回规则数"),
+    sort_by: str = Query("load", description="排序字段: load/latency/bytes/series/errors"),
+    project_id: int = Query(None, description="项目ID,不传则统计所有项目"),
+    current_user: User = Depends(get_current_user)
+):
+    """租户内评估开销最大的规则（基于最近 N 次评估的滚动统计）"""
+    if sort_by not in eval_stats_registry.SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"不支持的排序字段: {sort_by}")
+    
+    return await eval_stats_registry.top(current_user.tenant_id, limit, sort_by, project_id)
+
+
+@router.get("/{rule_id}/eval-stats")
+async def get_rule_eval_stats(
+    rule_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取规则最近 N 次评估的统计（耗时、响应大小、序列数、状态转换、错误）"""
+    stmt = select(AlertRule.id).where(
+        AlertRule.id == rule_id,
+        AlertRule.tenant_id == current_user.tenant_id
+    )
+    result = await db.execute(stmt)
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Alert rule not found")
+    
+    stats = await eval_stats_registry.get_rule_stats(current_user.tenant_id, rule_id)
+    if stats is None:
+        return {"rule_id": rule_id, "window": 0, "message": "规则尚未评估"}
+    return stats
+
+
 @router.get("/events/current")
 async def list_current_alerts(
     project_id: int = Query(None, description="项目ID,不传则显示所有项目"),
@@ -273,6 +368,10 @@ async def list_current_alerts(
     if project_id is not None:
         conditions.append(AlertEvent.project_id == project_id)
     
+    # 静默状态由静默调度器维护，读取时不再逐条匹配静默规则
+    if not include_silenced:
+        conditions.append(AlertEvent.is_silenced == False)
+    
     # 获取总数
     count_stmt = select(func.count()).select_from(AlertEvent).where(and_(*conditions))
     total = await db.scalar(count_stmt)
@@ -283,47 +382,6 @@ async def list_current_alerts(
     result = await db.execute(stmt)
     events = result.scalars().all()
     
-    # 如果不包含静默告警，需要过滤
-    if not include_silenced:
-        # 查询所有生效中的静默规则
-        current_time = int(time.time())
-        silence_conditions = [
-            SilenceRule.tenant_id == current_user.tenant_id,
-            SilenceRule.is_enabled == True,
-            SilenceRule.starts_at <= current_time,
-            SilenceRule.ends_at >= current_time
-        ]
-        if project_id is not None:
-            silence_conditions.append(SilenceRule.project_id == project_id)
-        
-        silence_stmt = select(SilenceRule).where(and_(*silence_conditions))
-        silence_result = await db.execute(silence_stmt)
-        active_silence_rules = silence_result.scalars().all()
-        
-        # 获取所有未静默的告警（用于计算准确的total）
-        all_stmt = select(AlertEvent).where(and_(*conditions)).order_by(AlertEvent.started_at.desc())
-        all_result = await db.execute(all_stmt)
-        all_events = all_result.scalars().all()
-        
-        # 过滤被静默的告警
-        filtered_all_events = []
-        for event in all_events:
-            is_silenced = False
-            for rule in active_silence_rules:
-                if check_silence_match(event.labels, rule.matchers):
-                    is_silenced = True
-                    break
-            if not is_silenced:
-                filtered_all_events.append(event)
-        
-        # 应用分页到过滤后的结果
-        filtered_events = filtered_all_events[skip:skip + limit]
-        
-        return {
-            "total": len(filtered_all_events),
-            "alerts": [e.to_dict() for e in filtered_events]
-        }
-    
     result_data = {
         "total": total,
         "alerts": [e.to_dict() for e in events]
@@ -365,41 +423,15 @@ async def list_current_alerts_grouped(
     if project_id is not None:
         conditions.append(AlertEvent.project_id == project_id)
     
+    # 静默状态由静默调度器维护，读取时不再逐条匹配静默规则
+    if not include_silenced:
+        conditions.append(AlertEvent.is_silenced == False)
+    
     stmt = select(AlertEvent).where(and_(*conditions)).order_by(AlertEvent.started_at.desc())
     
     result = await db.execute(stmt)
     all_events = result.scalars().all()
     
-    # 如果不包含静默告警，需要过滤
-    if not include_silenced:
-        # 查询所有生效中的静默规则
-        current_time = int(time.time())
-        silence_conditions = [
-            SilenceRule.tenant_id == current_user.tenant_id,
-            SilenceRule.is_enabled == True,
-            SilenceRule.starts_at <= current_time,
-            SilenceRule.ends_at >= current_time
-        ]
-        if project_id is not None:
-            silence_conditions.append(SilenceRule.project_id == project_id)
-        
-        silence_stmt = select(SilenceRule).where(and_(*silence_conditions))
-        silence_result = await db.execute(silence_stmt)
-        active_silence_rules = silence_result.scalars().all()
-        
-        # 过滤被静默的告警
-        filtered_events = []
-        for event in all_events:
-            is_silenced = False
-            for rule in active_silence_rules:
-                if check_silence_match(event.labels, rule.matchers):
-                    is_silenced = True
-                    break
-            if not is_silenced:
-                filtered_events.append(event)
-        
-        all_events = filtered_events
-    
     # 2. 按规则名称分组（只统计，不返回详细告警列表）
     groups = {}
     for event in all_events:
@@ -409,12 +441,15 @@ async def list_current_alerts_grouped(
                 "rule_name": rule_name,
                 "rule_id": event.rule_id,
                 "count": 0,
+                "flapping_count": 0,
                 "severity": event.severity,
                 "status": event.status,
                 "latest_started_at": event.started_at
             }
         
         groups[rule_name]["count"] += 1
+        if event.is_flapping:
+            groups[rule_name]["flapping_count"] += 1
         
         # 更新最新触发时间和状态
         if event.started_at > groups[rule_name]["latest_started_at"]:
@@ -595,9 +630,16 @@ async def get_current_alerts_stats(
     )
     pending_count = await db.scalar(pending_stmt)
     
+    # 统计抖动中的告警数量
+    flapping_stmt = select(func.count()).select_from(AlertEvent).where(
+        and_(*conditions, AlertEvent.is_flapping == True)
+    )
+    flapping_count = await db.scalar(flapping_stmt)
+    
     result_data = {
         "firing": firing_count or 0,
         "pending": pending_count or 0,
+        "flapping": flapping_count or 0,
         "total": (firing_count or 0) + (pending_count or 0)
     }
     
@@ -695,13 +737,24 @@ async def list_alert_history_grouped(
 async def get_grouping_stats(
     current_user: User = Depends(get_current_user)
 ):
-    """获取告警分组统计信息"""
-    from app.main import alert_manager
+    """获取告警分组统计信息
+    
+    当前进程未运行后台任务（RUN_BACKGROUND_TASKS=false）时，返回各后台任务进程发布到 Redis 的统计。
+    """
+    from app.worker import alert_manager
+    from app.services.alert_manager import AlertManager
     
     if not alert_manager:
-        raise HTTPException(status_code=503, detail="Alert manager not initialized")
+        try:
+            stats = await AlertManager.load_published_stats()
+        except Exception as e:
+            logger.warning(f"读取后台任务进程分组统计失败: {str(e)}")
+            stats = {"workers": {}}
+        if not stats["workers"]:
+            raise HTTPException(status_code=503, detail="Alert manager not initialized")
+        return stats
     
-    stats = alert_manager.get_grouping_stats()
+    stats = await alert_manager.get_grouping_stats()
     return stats
 
 
@@ -713,16 +766,17 @@ async def test_alert_rule(
 ):
     """测试告警规则的 PromQL 表达式
     
-    限流：每个用户每分钟最多 10 次
+    查询走异步连接池并带硬超时，不会阻塞事件循环；
+    相同数据源 + 表达式的并发测试会合并为一次查询，结果短时缓存。
+    传入 range_seconds 时执行范围查询，每个序列按 max_points 做 LTTB 降采样。
     """
-    import time
-    from prometheus_api_client import PrometheusConnect
     from app.models.datasource import DataSource
+    from app.services.datasource_client import DatasourceClient, DatasourceQueryError
+    from app.services.downsample import downsample_values
+    from app.services.rule_backtest import resolve_step
     
-    # 简单的速率限制（基于内存，实际应使用 Redis）
-    # 这里为演示简化处理
-    rate_limit_key = f"test_rate_limit:{current_user.id}"
-    # TODO: 使用 Redis 实现分布式限流
+    # 测试查询硬超时（秒）
+    test_query_timeout = 10
     
     # 获取数据源
     datasource = await db.get(DataSource, test_data.datasource_id)
@@ -737,18 +791,24 @@ async def test_alert_rule(
     try:
         start_time = time.time()
         
-        # 创建 Prometheus 客户端
-        headers = datasource.auth_config.get('headers', {})
-        disable_ssl = datasource.http_config.get('verify_ssl', True) is False
-        
-        prom = PrometheusConnect(
-            url=datasource.url,
-            headers=headers,
-            disable_ssl=disable_ssl
-        )
-        
-        # 执行查询（设置超时 5 秒）
-        result = prom.custom_query(query=test_data.expr)
+        client = DatasourceClient()
+        if test_data.range_seconds:
+            # 范围查询：结束时间按步长对齐，同一时间段内的相同请求可以合并
+            step = resolve_step(0, test_data.range_seconds, test_data.step)
+            end = int(time.time()) // step * step
+            start = end - test_data.range_seconds
+            result = await client.query_range_cached(
+                datasource,
+                test_data.expr,
+                start, end, step,
+                timeout=test_query_timeout
+            )
+        else:
+            result = await client.query_cached(
+                datasource,
+                test_data.expr,
+                timeout=test_query_timeout
+            )
         
         query_time = time.time() - start_time
         
@@ -767,12 +827,20 @@ async def test_alert_rule(
         results = []
         for item in result[:10]:
             metric_labels = item.get('metric', {})
-            value = item.get('value', [])
             
-            results.append(AlertRuleTestMetric(
-                metric=metric_labels,
-                value=value
-            ))
+            if test_data.range_seconds:
+                # 范围查询按点数预算降采样，value 取最后一个样本
+                values = downsample_values(item.get('values', []), test_data.max_points)
+                results.append(AlertRuleTestMetric(
+                    metric=metric_labels,
+                    value=values[-1] if values else [],
+                    values=values
+                ))
+            else:
+                results.append(AlertRuleTestMetric(
+                    metric=metric_labels,
+                    value=item.get('value', [])
+                ))
         
         return AlertRuleTestResponse(
             success=True,
@@ -782,19 +850,103 @@ async def test_alert_rule(
             timestamp=int(time.time())
         )
         
+    except DatasourceQueryError as e:
+        return AlertRuleTestResponse(
+            success=False,
+            error=e.message,
+            error_type=e.error_type
+        )
     except Exception as e:
-        # 解析错误类型
+        # 数据源配置异常、结果格式不符等非查询错误，同样返回结构化的测试错误
         error_msg = str(e)
-        error_type = 'execution'
-        
-        if 'parse error' in error_msg.lower() or 'syntax' in error_msg.lower():
-            error_type = 'syntax'
-        elif 'connection' in error_msg.lower() or 'timeout' in error_msg.lower():
-            error_type = 'connection'
-        
         return AlertRuleTestResponse(
             success=False,
             error=error_msg,
-            error_type=error_type
+            error_type=DatasourceClient.classify_error(error_msg)
         )
 
+
+
+@router.post("/test/backtest", response_model=AlertRuleBacktestResponse)
+async def backtest_alert_rule(
+    backtest_data: AlertRuleBacktestRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """回测告警规则
+    
+    使用 query_range 拉取历史窗口数据，计算每个序列何时进入 pending、
+    何时 firing（满足 for_duration）以及何时恢复，并统计通知次数。
+    """
+    from app.models.datasource import DataSource
+    from app.services.datasource_client import DatasourceClient, DatasourceQueryError
+    from app.services.rule_backtest import (
+        resolve_step, count_steps, check_backtest_size, probe_backtest_series,
+        compute_backtest, BacktestTooLargeError
+    )
+    
+    # 回测窗口上限 30 天，查询硬超时 30 秒
+    max_window = 30 * 86400
+    backtest_query_timeout = 30
+    
+    end = backtest_data.end or int(time.time())
+    start = backtest_data.start or end - 3600
+    if start >= end:
+        raise HTTPException(status_code=400, detail="开始时间必须早于结束时间")
+    if end - start > max_window:
+        raise HTTPException(status_code=400, detail="回测窗口不能超过 30 天")
+    
+    # 获取数据源
+    datasource = await db.get(DataSource, backtest_data.datasource_id)
+    if not datasource:
+        raise HTTPException(status_code=404, detail="数据源不存在")
+    
+    # 检查权限：数据源必须属于用户的租户
+    if datasource.tenant_id != current_user.tenant_id:
+        raise HTTPException(status_code=403, detail="无权限访问该数据源")
+    
+    step = resolve_step(start, end, backtest_data.step)
+    
+    # 拉取完整结果前先探测序列数，超过矩阵上限直接拒绝
+    series_count = await probe_backtest_series(
+        datasource, backtest_data.expr, start, end, step, timeout=backtest_query_timeout
+    )
+    if series_count is not None:
+        try:
+            check_backtest_size(series_count, count_steps(start, end, step))
+        except BacktestTooLargeError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    
+    try:
+        query_start = time.time()
+        series = await DatasourceClient().query_range_cached(
+            datasource, backtest_data.expr, start, end, step,
+            timeout=backtest_query_timeout
+        )
+        query_time = time.time() - query_start
+    except DatasourceQueryError as e:
+        return AlertRuleBacktestResponse(
+            success=False,
+            error=e.message,
+            error_type=e.error_type
+        )
+    
+    try:
+        summary = compute_backtest(
+            series,
+            start=start,
+            end=end,
+            step=step,
+            for_duration=backtest_data.for_duration,
+            repeat_interval=backtest_data.repeat_interval,
+            max_series=backtest_data.max_series,
+            max_points=backtest_data.max_points
+        )
+    except BacktestTooLargeError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    return AlertRuleBacktestResponse(
+        success=True,
+        query_time=round(query_time, 3),
+        **summary
+    )
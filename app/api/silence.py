@@ -8,7 +8,8 @@ from app.models.silence import SilenceRule
 from app.models.alert import AlertEvent
 from app.models.user import User
 from app.api.auth import get_current_user
-from app.services.silence_matcher import validate_matchers, check_silence_match
+from app.services.silence_matcher import validate_matchers
+from app.services.silence_engine import CompiledSilence, silence_engine
 from app.services.cache_service import CacheService
 import time
 
@@ -49,8 +50,9 @@ async def create_silence_rule(
     await db.commit()
     await db.refresh(new_rule)
     
-    # 清除缓存
+    # 清除缓存，通知各进程重新加载静默规则快照
     await CacheService.delete_pattern(f"silence:list:tenant:{current_user.tenant_id}:*")
+    await silence_engine.notify_changed(current_user.tenant_id)
     
     return new_rule.to_dict()
 
@@ -124,8 +126,9 @@ async def update_silence_rule(
     await db.commit()
     await db.refresh(rule)
     
-    # 清除缓存
+    # 清除缓存，通知各进程重新加载静默规则快照
     await CacheService.delete_pattern(f"silence:list:tenant:{current_user.tenant_id}:*")
+    await silence_engine.notify_changed(current_user.tenant_id)
     await CacheService.delete(f"silence:detail:{rule_id}")
     
     return rule.to_dict()
@@ -156,8 +159,9 @@ async def delete_silence_rule(
     await db.delete(rule)
     await db.commit()
     
-    # 清除缓存
+    # 清除缓存，通知各进程重新加载静默规则快照
     await CacheService.delete_pattern(f"silence:list:tenant:{current_user.tenant_id}:*")
+    await silence_engine.notify_changed(current_user.tenant_id)
     await CacheService.delete(f"silence:detail:{rule_id}")
     
     return {"message": "Silence rule deleted"}
@@ -204,10 +208,11 @@ async def get_silenced_alerts(
     result = await db.execute(stmt)
     all_alerts = result.scalars().all()
     
-    # 过滤出被该规则匹配的告警
+    # 过滤出被该规则匹配的告警（匹配器只编译一次）
+    compiled = CompiledSilence.from_rule(rule)
     silenced_alerts = []
     for alert in all_alerts:
-        if check_silence_match(alert.labels, rule.matchers):
+        if compiled and compiled.matches(alert.labels or {}):
             silenced_alerts.append({
                 "id": alert.id,
                 "fingerprint": alert.fingerprint,
@@ -35,6 +35,10 @@ class Settings(BaseSettings):
     # 日志配置
     LOG_LEVEL: str = "INFO"
     
+    # 后台任务配置（环境变量）：API 进程设置为 false 时不运行告警评估调度器和分组工作器，
+    # 由独立的后台任务进程（python -m app.worker）运行
+    RUN_BACKGROUND_TASKS: bool = True
+    
     @property
     def database_url(self) -> str:
         """获取数据库连接字符串（MySQL）"""
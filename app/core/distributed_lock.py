@@ -1,7 +1,7 @@
 """分布式锁实现"""
 import asyncio
 import uuid
-from typing import Optional
+from typing import List, Optional, Set
 from loguru import logger
 import redis.asyncio as redis
 
@@ -148,11 +148,77 @@ class DistributedLock:
         await self.release()
 
 
+class DedupTokens:
+    """基于 Redis 的批量去重令牌
+    
+    一次 Lua 调用原子地认领一批标识：每个标识 SET NX EX，返回认领成功的部分。
+    令牌不主动释放，到期自动失效，因此不存在释放失败或忘记释放导致的长期占用，
+    也没有阻塞等待；调用开销与批次数成正比，与告警数无关。
+    """
+    
+    # KEYS: 令牌键；ARGV[1]: 令牌值，ARGV[2]: 过期时间（秒）
+    # 返回与 KEYS 一一对应的 0/1 列表
+    CLAIM_SCRIPT = """
+local claimed = {}
+for i, key in ipairs(KEYS) do
+    if redis.call('SET', key, ARGV[1], 'NX', 'EX', ARGV[2]) then
+        claimed[i] = 1
+    else
+        claimed[i] = 0
+    end
+end
+return claimed
+"""
+    
+    def __init__(self, redis_client: redis.Redis, namespace: str, owner: Optional[str] = None):
+        """
+        初始化去重令牌
+        
+        Args:
+            redis_client: Redis 客户端
+            namespace: 令牌命名空间
+            owner: 令牌值（标识持有者，便于排查），默认随机生成
+        """
+        self.redis = redis_client
+        self.prefix = f"dedup:{namespace}"
+        self.owner = owner or str(uuid.uuid4())
+        self._claim_script = self.redis.register_script(self.CLAIM_SCRIPT)
+    
+    def _key(self, token: str) -> str:
+        return f"{self.prefix}:{token}"
+    
+    async def claim(self, tokens: List[str], ttl: int) -> Set[str]:
+        """
+        批量认领令牌（一次往返）
+        
+        Args:
+            tokens: 待认领的标识列表
+            ttl: 令牌有效期（秒）
+        
+        Returns:
+            认领成功的标识集合
+        """
+        tokens = list(dict.fromkeys(tokens))
+        if not tokens:
+            return set()
+        
+        results = await self._claim_script(
+            keys=[self._key(token) for token in tokens],
+            args=[self.owner, max(int(ttl), 1)]
+        )
+        return {token for token, ok in zip(tokens, results) if ok}
+    
+    async def is_claimed(self, token: str) -> bool:
+        """检查令牌是否已被认领"""
+        return await self.redis.exists(self._key(token)) > 0
+
+
 class AlertLockManager:
     """告警锁管理器 - 防止重复发送告警"""
     
     def __init__(self, redis_client: redis.Redis):
         self.redis = redis_client
+        self.alert_tokens = DedupTokens(redis_client, "alert")
     
     def get_alert_lock(self, fingerprint: str, timeout: int = 60) -> DistributedLock:
         """
@@ -182,7 +248,7 @@ class AlertLockManager:
     
     async def is_alert_sending(self, fingerprint: str) -> bool:
         """
-        检查告警是否正在发送
+        检查告警是否正在发送（已被认领且令牌未过期）
         
         Args:
             fingerprint: 告警指纹
@@ -190,6 +256,19 @@ class AlertLockManager:
         Returns:
             是否正在发送
         """
-        lock_key = f"lock:alert:{fingerprint}"
-        return await self.redis.exists(lock_key) > 0
-
+        return await self.alert_tokens.is_claimed(fingerprint)
+    
+    async def claim_alerts(self, fingerprints: List[str], ttl: int = 30) -> Set[str]:
+        """
+        批量认领告警（一次 Lua 调用）
+        
+        认领成功的告警由当前实例处理；认领令牌不主动释放，在 ttl 秒后过期。
+        
+        Args:
+            fingerprints: 告警指纹列表
+            ttl: 认领令牌过期时间（秒）
+        
+        Returns:
+            认领成功的指纹集合
+        """
+        return await self.alert_tokens.claim(fingerprints, ttl)
@@ -0,0 +1,18 @@
+"""日志配置"""
+import sys
+from loguru import logger
+
+from app.core.config import settings
+
+
+LOG_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+)
+
+
+def setup_logging():
+    """按配置的日志级别输出到标准错误（API 进程和后台任务进程共用）"""
+    logger.remove()  # 移除默认处理器
+    logger.add(sys.stderr, level=settings.LOG_LEVEL, format=LOG_FORMAT)
+    logger.info(f"日志级别已设置为: {settings.LOG_LEVEL}")
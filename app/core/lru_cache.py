@@ -0,0 +1,146 @@
+"""有界 LRU 缓存
+
+同时按条目数、估算字节数和 TTL 限制的进程内缓存，用于长期运行的后台进程：
+键空间不断变化（如标签值轮换）时，内存占用仍保持在上限之内。
+"""
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """按条目数 / 字节数 / TTL 限制的 LRU 缓存
+    
+    - get 命中时把条目移到队尾，超过上限时从队首（最久未使用）淘汰
+    - 每个条目记录写入时间，读取时发现过期即删除
+    - 字节数由调用方在写入时给出（没有时使用 sizeof 估算），只用于容量控制，不要求精确
+    
+    Attributes:
+        max_entries: 最大条目数
+        max_bytes: 最大估算字节数
+        ttl: 条目有效期（秒），0 表示不过期
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 0,
+        sizeof: Optional[Callable[[Any], int]] = None
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof or sys.getsizeof
+        # key -> (value, 写入时间, 字节数)
+        self._data: "OrderedDict[Hashable, Tuple[Any, float, int]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return self.peek(key) is not None
+    
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl > 0 and now - stored_at >= self.ttl
+    
+    def _remove(self, key: Hashable):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """读取条目（计入命中率，命中时刷新 LRU 顺序）"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        
+        if self._expired(entry[1], time.time()):
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+        
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+    
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """读取条目（不计入命中率、不刷新 LRU 顺序）"""
+        entry = self._data.get(key)
+        if entry is None or self._expired(entry[1], time.time()):
+            return default
+        return entry[0]
+    
+    def set(self, key: Hashable, value: Any, size: Optional[int] = None):
+        """写入条目，超出条目数或字节数上限时淘汰最久未使用的条目"""
+        if size is None:
+            size = self._sizeof(value)
+        
+        self._remove(key)
+        # 单个条目超过字节上限时不缓存
+        if size > self.max_bytes:
+            return
+        
+        self._data[key] = (value, time.time(), size)
+        self.bytes += size
+        self._evict()
+    
+    def add_size(self, key: Hashable, delta: int):
+        """条目被就地修改后调整其字节数（不刷新写入时间）"""
+        entry = self._data.get(key)
+        if entry is None:
+            return
+        self._data[key] = (entry[0], entry[1], entry[2] + delta)
+        self.bytes += delta
+        self._evict()
+    
+    def _evict(self):
+        while self._data and (len(self._data) > self.max_entries or self.bytes > self.max_bytes):
+            _, (_, _, size) = self._data.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+    
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """删除条目并返回其值"""
+        entry = self._data.get(key)
+        self._remove(key)
+        return default if entry is None else entry[0]
+    
+    def purge_expired(self) -> int:
+        """清理所有过期条目，返回清理数量"""
+        if self.ttl <= 0:
+            return 0
+        now = time.time()
+        expired = [key for key, (_, stored_at, _) in self._data.items() if self._expired(stored_at, now)]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        return len(expired)
+    
+    def clear(self):
+        """清空缓存（保留统计计数）"""
+        self._data.clear()
+        self.bytes = 0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,219 @@
+"""分组槽位租约
+
+分组键按 CRC32 映射到固定数量的槽位，每个分组工作器只处理自己持有租约的槽位：
+- 工作器定期在成员集合（ZSET: 工作器 ID -> 心跳时间）中登记心跳，超过租约时间未心跳的成员被移除
+- 每个槽位按最高随机权重（Rendezvous Hashing）分配给一个存活的工作器，每个工作器最多
+  ceil(槽位数 / 工作器数) 个槽位；成员变化时大部分槽位保持原持有者，只迁移少量槽位
+- 槽位租约以 SET NX EX 持有、按周期续期；离开的工作器主动释放，崩溃时租约到期后由新的持有者接管
+"""
+import hashlib
+import math
+import os
+import socket
+import time
+import uuid
+import zlib
+from typing import Any, Dict, List, Optional, Set
+from loguru import logger
+import redis.asyncio as redis
+
+
+# 分组槽位数（部署后修改需要重建到期索引）
+DEFAULT_SLOTS = 64
+
+
+def slot_of(key: str, num_slots: int = DEFAULT_SLOTS) -> int:
+    """计算键所属的槽位"""
+    return zlib.crc32(key.encode("utf-8")) % num_slots
+
+
+class SlotLeaseManager:
+    """基于 Redis 的槽位租约管理
+    
+    Attributes:
+        worker_id: 当前工作器 ID
+        num_slots: 槽位总数
+        lease_ttl: 租约和成员心跳的有效期（秒）
+        owned_slots: 当前持有租约的槽位
+    """
+    
+    # KEYS: 槽位租约键；ARGV[1]: 工作器 ID，ARGV[2]: 租约时间（秒）
+    # 未被持有时认领，已由自己持有时续期；返回与 KEYS 一一对应的 0/1 列表
+    CLAIM_SCRIPT = """
+local owned = {}
+for i, key in ipairs(KEYS) do
+    local holder = redis.call('GET', key)
+    if not holder then
+        redis.call('SET', key, ARGV[1], 'EX', ARGV[2])
+        owned[i] = 1
+    elseif holder == ARGV[1] then
+        redis.call('EXPIRE', key, ARGV[2])
+        owned[i] = 1
+    else
+        owned[i] = 0
+    end
+end
+return owned
+"""
+
+    # KEYS: 槽位租约键；ARGV[1]: 工作器 ID。只释放自己持有的租约
+    RELEASE_SCRIPT = """
+local released = 0
+for _, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then
+        redis.call('DEL', key)
+        released = released + 1
+    end
+end
+return released
+"""
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        num_slots: int = DEFAULT_SLOTS,
+        lease_ttl: int = 30,
+        worker_id: Optional[str] = None,
+        namespace: str = "alert:group"
+    ):
+        """
+        初始化槽位租约管理
+        
+        Args:
+            redis_client: Redis 客户端
+            num_slots: 槽位总数（所有实例必须一致）
+            lease_ttl: 租约有效期（秒），每 lease_ttl / 3 续期一次
+            worker_id: 工作器 ID，默认由主机名、进程号和随机串组成
+            namespace: Redis 键前缀
+        """
+        self.redis = redis_client
+        self.num_slots = num_slots
+        self.lease_ttl = lease_ttl
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.members_key = f"{namespace}:workers"  # ZSET: 工作器 ID -> 最近心跳时间
+        self.lease_prefix = f"{namespace}:slot"
+        self.renew_interval = max(lease_ttl / 3, 1)
+        self.retry_interval = 2  # 目标槽位仍被其他工作器持有时的重试间隔（秒）
+        
+        self.owned_slots: Set[int] = set()
+        self.workers: List[str] = []
+        self.rebalances = 0
+        self._next_refresh_at = 0.0
+        self._refreshed_at = 0.0
+        
+        self._claim_script = self.redis.register_script(self.CLAIM_SCRIPT)
+        self._release_script = self.redis.register_script(self.RELEASE_SCRIPT)
+    
+    def _lease_key(self, slot: int) -> str:
+        return f"{self.lease_prefix}:{slot}"
+    
+    @staticmethod
+    def _weight(worker: str, slot: int) -> int:
+        return int.from_bytes(hashlib.md5(f"{worker}:{slot}".encode("utf-8")).digest()[:8], "big")
+    
+    def _assign(self, workers: List[str]) -> Dict[int, str]:
+        """
+        计算槽位分配（所有实例按同一成员列表得到相同结果）
+        
+        每个槽位按权重从高到低选择尚未达到容量上限的工作器。
+        """
+        capacity = math.ceil(self.num_slots / len(workers))
+        load = dict.fromkeys(workers, 0)
+        assignment = {}
+        for slot in range(self.num_slots):
+            for worker in sorted(workers, key=lambda w: self._weight(w, slot), reverse=True):
+                if load[worker] < capacity:
+                    assignment[slot] = worker
+                    load[worker] += 1
+                    break
+        return assignment
+    
+    async def refresh(self) -> Set[int]:
+        """
+        心跳、按存活成员重新计算目标槽位，认领 / 续期目标槽位并释放不再属于自己的槽位
+        
+        Returns:
+            当前持有租约的槽位
+        """
+        now = time.time()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(self.members_key, {self.worker_id: now})
+            pipe.zremrangebyscore(self.members_key, "-inf", now - self.lease_ttl)
+            pipe.zrange(self.members_key, 0, -1)
+            _, _, workers = await pipe.execute()
+        
+        workers = sorted(workers) or [self.worker_id]
+        target = sorted(slot for slot, worker in self._assign(workers).items() if worker == self.worker_id)
+        
+        owned = set()
+        if target:
+            results = await self._claim_script(
+                keys=[self._lease_key(slot) for slot in target],
+                args=[self.worker_id, self.lease_ttl]
+            )
+            owned = {slot for slot, ok in zip(target, results) if ok}
+        
+        released = sorted(self.owned_slots - set(target))
+        if released:
+            await self._release_script(
+                keys=[self._lease_key(slot) for slot in released],
+                args=[self.worker_id]
+            )
+        
+        if owned != self.owned_slots or workers != self.workers:
+            self.rebalances += 1
+            logger.info(
+                f"分组槽位重新分配: worker={self.worker_id}, 工作器数={len(workers)}, "
+                f"持有={len(owned)}/{len(target)}, 释放={len(released)}"
+            )
+        
+        self.owned_slots = owned
+        self.workers = workers
+        self._refreshed_at = now
+        # 目标槽位尚未全部拿到（原持有者还未释放）时提前重试
+        wait = self.retry_interval if len(owned) < len(target) else self.renew_interval
+        self._next_refresh_at = now + wait
+        return owned
+    
+    async def maintain(self) -> Set[int]:
+        """
+        到达续期时间时刷新租约，返回当前持有的槽位
+        
+        Redis 不可用时保留已持有的槽位直到租约到期，之后视为未持有任何槽位。
+        """
+        if time.time() < self._next_refresh_at:
+            return self.owned_slots
+        
+        try:
+            return await self.refresh()
+        except Exception as e:
+            logger.warning(f"刷新分组槽位租约失败: {str(e)}")
+            if time.time() - self._refreshed_at >= self.lease_ttl:
+                self.owned_slots = set()
+            return self.owned_slots
+    
+    async def release(self):
+        """释放全部租约并退出成员集合（其他工作器下次刷新时接管）"""
+        slots = sorted(self.owned_slots)
+        self.owned_slots = set()
+        self._next_refresh_at = 0.0
+        try:
+            if slots:
+                await self._release_script(
+                    keys=[self._lease_key(slot) for slot in slots],
+                    args=[self.worker_id]
+                )
+            await self.redis.zrem(self.members_key, self.worker_id)
+            logger.info(f"分组槽位租约已释放: worker={self.worker_id}, 槽位数={len(slots)}")
+        except Exception as e:
+            logger.warning(f"释放分组槽位租约失败: {str(e)}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """租约统计"""
+        return {
+            "worker_id": self.worker_id,
+            "workers": len(self.workers),
+            "num_slots": self.num_slots,
+            "owned_slots": len(self.owned_slots),
+            "rebalances": self.rebalances,
+        }
@@ -0,0 +1,76 @@
+"""哈希时间轮
+
+定时任务按到期时间散列到环形槽位中，登记和取消都是 O(1)，
+每次推进只扫描经过的槽位；到期时间超过一圈的任务留在槽位中，等到对应的那一圈再取出。
+"""
+import time
+from typing import Dict, Hashable, List, Optional
+
+
+class TimerWheel:
+    """哈希时间轮
+    
+    Attributes:
+        tick: 每个槽位的时间跨度（秒）
+        size: 槽位数，一圈覆盖 tick * size 秒
+    """
+    
+    def __init__(self, tick: float = 1.0, size: int = 3600, start: Optional[float] = None):
+        self.tick = tick
+        self.size = size
+        self._slots: List[Dict[Hashable, float]] = [{} for _ in range(size)]  # 键 -> 到期时间
+        self._next_tick = int((start if start is not None else time.time()) // tick)  # 下一个待处理的刻度
+        self._count = 0
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def schedule(self, key: Hashable, due: float) -> bool:
+        """
+        登记定时任务（同一个键在同一刻度内只登记一次）
+        
+        Args:
+            key: 任务键，到期时原样返回
+            due: 到期时间戳，已过期的任务在下一次推进时取出
+        
+        Returns:
+            是否新登记
+        """
+        tick = max(int(due // self.tick), self._next_tick)
+        slot = self._slots[tick % self.size]
+        if key in slot:
+            return False
+        slot[key] = due
+        self._count += 1
+        return True
+    
+    def cancel(self, key: Hashable, due: float) -> bool:
+        """取消定时任务（需提供登记时的到期时间）"""
+        tick = max(int(due // self.tick), self._next_tick)
+        if self._slots[tick % self.size].pop(key, None) is None:
+            return False
+        self._count -= 1
+        return True
+    
+    def advance(self, now: Optional[float] = None) -> List[Hashable]:
+        """
+        推进到当前时间，返回已到期的任务键（按槽位顺序）
+        """
+        target = int((now if now is not None else time.time()) // self.tick)
+        if target < self._next_tick:
+            return []
+        
+        expired = []
+        # 跨度超过一圈时每个槽位只需扫描一次
+        last = min(target, self._next_tick + self.size - 1)
+        for tick in range(self._next_tick, last + 1):
+            slot = self._slots[tick % self.size]
+            if not slot:
+                continue
+            for key, due in list(slot.items()):
+                if int(due // self.tick) <= target:
+                    del slot[key]
+                    expired.append(key)
+        self._count -= len(expired)
+        self._next_tick = target + 1
+        return expired
@@ -1,6 +1,4 @@
 """应用入口"""
-import asyncio
-import sys
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -8,6 +6,7 @@ from fastapi.responses import JSONResponse
 from loguru import logger
 
 from app.core.config import settings
+from app.core.logger import setup_logging
 from app.core.exceptions import AlertSystemException
 from app.db.database import engine
 from app.db.redis_client import RedisClient
@@ -15,31 +14,19 @@ from app.models.base import Base
 from app.api import auth, alert_rules, datasources, notifications, silence, users, audit
 from app.api import settings as settings_api
 from app.api import projects
-from app.services.evaluator import AlertEvaluationScheduler
-from app.services.alert_manager import AlertManager
+from app.services.datasource_client import DatasourceClient
+from app.services.silence_engine import silence_engine
 from app.db.database import AsyncSessionLocal
+from app.worker import start_background_tasks, stop_background_tasks
 
 
 # 配置日志级别
-logger.remove()  # 移除默认处理器
-logger.add(
-    sys.stderr,
-    level=settings.LOG_LEVEL,
-    format="<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
-)
-logger.info(f"日志级别已设置为: {settings.LOG_LEVEL}")
-
-
-# 全局调度器和告警管理器
-scheduler = None
-alert_manager = None
+setup_logging()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
-    global scheduler, alert_manager
-    
     # 启动时
     logger.info("应用启动中...")
     
@@ -54,26 +41,17 @@ async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     
+    # 订阅静默规则变更（各进程的静默规则快照据此重新加载）
+    await silence_engine.start()
+    
     # 创建后台任务专用的数据库会话
     # db_session = AsyncSessionLocal()  # 不再创建单一会话
     
-    # 启动告警评估调度器（不传入会话，让调度器自己管理）
-    scheduler = AlertEvaluationScheduler()
-    
-    # 创建全局告警管理器并启动分组工作器（自动检测使用 Redis 或内存分组器）
-    # 不再传入会话，让 AlertManager 自己管理会话
-    alert_manager = AlertManager()
-    
-    # 配置告警分组参数
-    alert_manager.configure_grouper(
-        group_wait=10,       # 分组等待时间 10 秒
-        group_interval=30,   # 分组间隔 30 秒
-        repeat_interval=3600 # 重复发送间隔 1 小时
-    )
-    
-    # 在后台任务中启动调度器和分组工作器
-    asyncio.create_task(scheduler.start())
-    asyncio.create_task(alert_manager.start_grouping_worker())
+    # 启动告警评估调度器和分组工作器；拆分部署时由独立的后台任务进程（python -m app.worker）运行
+    if settings.RUN_BACKGROUND_TASKS:
+        await start_background_tasks()
+    else:
+        logger.info("后台任务已禁用（RUN_BACKGROUND_TASKS=false），由独立的后台任务进程运行")
     
     logger.info("应用启动完成")
     
@@ -81,13 +59,14 @@ async def lifespan(app: FastAPI):
     
     # 关闭时
     logger.info("应用关闭中...")
-    if scheduler:
-        await scheduler.stop()
-    if alert_manager:
-        await alert_manager.stop_grouping_worker()
+    await stop_background_tasks()
+    await silence_engine.stop()
     # await db_session.close()  # 不再需要关闭单一会话
     await engine.dispose()
     
+    # 关闭数据源连接池
+    await DatasourceClient.close()
+    
     # 关闭 Redis 连接
     await RedisClient.close()
     
@@ -33,6 +33,10 @@ class AlertRule(BaseModel):
     #   "notification_channels": [1, 2, 3]     # 通知渠道ID列表
     # }
     
+    # 查询成本（保存规则时由 PromQL 静态分析 + 基数探测得出，调度器据此准入和错峰）
+    cost_score = Column(Float, default=0, comment="查询成本评分")
+    cost_detail = Column(JSON, default={}, comment="查询成本分析详情")
+    
     # 状态
     is_enabled = Column(Boolean, default=True, nullable=False, comment="是否启用")
     
@@ -68,6 +72,13 @@ class AlertEvent(BaseModel):
     status = Column(String(20), default="firing", nullable=False, comment="状态")  # pending, firing, resolved
     severity = Column(String(20), nullable=False, comment="告警等级")
     
+    # 是否被生效中的静默规则匹配（由静默调度器在静默生效 / 结束时批量更新）
+    is_silenced = Column(Boolean, default=False, nullable=False, index=True, comment="是否被静默")
+    
+    # 抖动状态（抖动期间告警保持 firing，不发送恢复通知）
+    is_flapping = Column(Boolean, default=False, nullable=False, comment="是否抖动")
+    flap_rate = Column(Float, default=0, comment="状态变化率")
+    
     # 时间戳
     started_at = Column(BigInteger, nullable=False, comment="开始时间")
     last_eval_at = Column(BigInteger, nullable=False, comment="最后评估时间")
@@ -36,6 +36,8 @@ class AlertRuleResponse(AlertRuleBase):
     id: int
     tenant_id: int
     project_id: int
+    cost_score: Optional[float] = Field(None, description="查询成本评分")
+    cost_detail: Optional[Dict[str, Any]] = Field(None, description="查询成本分析详情")
     created_at: int
     updated_at: int
 
@@ -51,6 +53,9 @@ class AlertEventResponse(BaseModel):
     rule_name: str
     status: str
     severity: str
+    is_silenced: bool = False
+    is_flapping: bool = False
+    flap_rate: Optional[float] = 0.0
     started_at: int
     last_eval_at: int
     last_sent_at: int
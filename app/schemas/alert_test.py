@@ -8,12 +8,16 @@ class AlertRuleTestRequest(BaseModel):
     datasource_id: int = Field(..., description="数据源ID")
     expr: str = Field(..., min_length=1, description="PromQL 表达式")
     for_duration: Optional[int] = Field(None, description="持续时间（秒）")
+    range_seconds: Optional[int] = Field(None, ge=60, le=7 * 86400, description="范围查询窗口（秒），为空时执行 instant query")
+    step: Optional[int] = Field(None, ge=1, description="范围查询步长（秒）")
+    max_points: int = Field(200, ge=3, le=2000, description="范围查询每个序列最多返回的点数（LTTB 降采样）")
 
 
 class AlertRuleTestMetric(BaseModel):
     """测试结果中的指标"""
     metric: Dict[str, str] = Field(default_factory=dict, description="指标标签")
     value: List[Any] = Field(default_factory=list, description="[时间戳, 值]")
+    values: Optional[List[List[Any]]] = Field(None, description="范围查询降采样后的 [[时间戳, 值], ...]")
 
 
 class AlertRuleTestResponse(BaseModel):
@@ -26,3 +30,51 @@ class AlertRuleTestResponse(BaseModel):
     error: Optional[str] = Field(None, description="错误信息")
     error_type: Optional[str] = Field(None, description="错误类型: syntax/connection/execution")
     message: Optional[str] = Field(None, description="提示消息")
+
+
+class AlertRuleBacktestRequest(BaseModel):
+    """告警规则回测请求"""
+    datasource_id: int = Field(..., description="数据源ID")
+    expr: str = Field(..., min_length=1, description="PromQL 表达式")
+    for_duration: int = Field(0, ge=0, description="持续时间（秒）")
+    repeat_interval: int = Field(0, ge=0, description="重复发送间隔（秒），0 表示不重复")
+    start: Optional[int] = Field(None, description="开始时间戳，默认结束时间前 1 小时")
+    end: Optional[int] = Field(None, description="结束时间戳，默认当前时间")
+    step: Optional[int] = Field(None, ge=1, description="步长（秒），默认 15 秒并按窗口自动放大")
+    max_series: int = Field(50, ge=1, le=500, description="返回明细的最大序列数")
+    max_points: int = Field(0, ge=0, le=2000, description="每个序列返回的曲线点数（LTTB 降采样），0 表示不返回")
+
+
+class AlertRuleBacktestInterval(BaseModel):
+    """回测中的单个告警区间"""
+    pending_at: int = Field(..., description="进入 pending 的时间戳")
+    firing_at: Optional[int] = Field(None, description="进入 firing 的时间戳，未触发为空")
+    resolved_at: Optional[int] = Field(None, description="恢复时间戳，窗口结束时仍在告警为空")
+
+
+class AlertRuleBacktestSeries(BaseModel):
+    """回测中的单个序列"""
+    metric: Dict[str, str] = Field(default_factory=dict, description="指标标签")
+    pending_count: int = Field(0, description="pending 次数")
+    firing_count: int = Field(0, description="firing 次数")
+    notification_count: int = Field(0, description="通知次数（触发+重复+恢复）")
+    firing_seconds: int = Field(0, description="firing 总时长（秒）")
+    intervals: List[AlertRuleBacktestInterval] = Field(default_factory=list, description="告警区间")
+    points: Optional[List[List[Any]]] = Field(None, description="降采样后的 [[时间戳, 值], ...]")
+
+
+class AlertRuleBacktestResponse(BaseModel):
+    """告警规则回测响应"""
+    success: bool = Field(..., description="是否成功")
+    start: Optional[int] = Field(None, description="开始时间戳")
+    end: Optional[int] = Field(None, description="结束时间戳")
+    step: Optional[int] = Field(None, description="实际步长（秒）")
+    series_count: int = Field(0, description="序列总数")
+    pending_count: int = Field(0, description="pending 区间总数")
+    firing_count: int = Field(0, description="firing 区间总数")
+    resolved_count: int = Field(0, description="恢复区间总数")
+    notifications: Dict[str, int] = Field(default_factory=dict, description="通知次数统计")
+    series: List[AlertRuleBacktestSeries] = Field(default_factory=list, description="按触发次数排序的序列明细")
+    query_time: Optional[float] = Field(None, description="查询耗时（秒）")
+    error: Optional[str] = Field(None, description="错误信息")
+    error_type: Optional[str] = Field(None, description="错误类型: syntax/connection/execution")
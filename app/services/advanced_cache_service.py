@@ -309,19 +309,22 @@ class AdvancedCacheService:
         logger.info(f"消息已发布到频道 {channel}: {message_str[:100]}")
     
     @staticmethod
-    async def subscribe_messages(channel: str, callback: Callable):
+    async def subscribe_messages(channel: str, callback: Callable, on_subscribed: Optional[Callable] = None):
         """
         订阅Redis频道消息
         
         Args:
             channel: 频道名称
             callback: 消息处理回调函数
+            on_subscribed: 订阅建立后调用（用于区分连接失败和订阅中断）
         """
         redis = await get_redis()
         pubsub = redis.pubsub()
         
         await pubsub.subscribe(channel)
         logger.info(f"已订阅频道: {channel}")
+        if on_subscribed is not None:
+            on_subscribed()
         
         try:
             async for message in pubsub.listen():
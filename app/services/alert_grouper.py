@@ -1,51 +1,136 @@
 """告警分组器 - 实现类似 Alertmanager 的告警合并功能"""
-import asyncio
+import heapq
+import itertools
 import time
-from typing import Dict, List, Set, Optional
+from typing import Dict, List, Optional, Tuple
 from collections import defaultdict
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.alert import AlertEvent, AlertRule
+from app.services.alert_snapshot import AlertSnapshot, intern_labels
+from app.services.notification_priority import group_priority, rule_priority
+
+
+def resolve_group_timing(
+    rule: Optional[AlertRule],
+    group_wait: int,
+    group_interval: int,
+    repeat_interval: int
+) -> Tuple[int, int, int]:
+    """
+    解析分组的发送时间参数
+    
+    优先级：规则 route_config 中的 group_wait / group_interval / repeat_interval
+    > 规则的 repeat_interval 字段 > 分组器全局配置。
+    
+    返回: (group_wait, group_interval, repeat_interval)
+    """
+    if rule is None:
+        return group_wait, group_interval, repeat_interval
+    
+    if rule.repeat_interval and rule.repeat_interval > 0:
+        repeat_interval = rule.repeat_interval
+    
+    route_config = rule.route_config or {}
+    timing = [group_wait, group_interval, repeat_interval]
+    for i, name in enumerate(("group_wait", "group_interval", "repeat_interval")):
+        value = route_config.get(name)
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            continue
+        # group_wait 允许为 0（立即发送），其余间隔必须为正数
+        if value > 0 or (name == "group_wait" and value == 0):
+            timing[i] = value
+    return timing[0], timing[1], timing[2]
 
 
 class AlertGroup:
-    """告警分组"""
+    """告警分组
+    
+    组内保存告警快照（AlertSnapshot）而非 ORM 对象，按指纹去重；
+    规则只保留 ID 和名称，发送时再查询规则。
+    """
+    
+    __slots__ = (
+        'group_key', 'group_labels', 'alerts', 'rule_id', 'rule_name',
+        'created_at', 'last_updated_at', 'last_sent_at', 'sent',
+        'group_wait', 'group_interval', 'repeat_interval', 'due_at', 'rule_priority',
+    )
     
     def __init__(self, group_key: str, group_labels: Dict[str, str]):
         self.group_key = group_key
-        self.group_labels = group_labels
-        self.alerts: List[AlertEvent] = []
-        self.rule: Optional[AlertRule] = None
+        self.group_labels = intern_labels(group_labels)
+        self.alerts: Dict[str, AlertSnapshot] = {}  # 指纹 -> 快照（按加入顺序）
+        self.rule_id: Optional[int] = None
+        self.rule_name: Optional[str] = None
         self.created_at = time.time()
         self.last_updated_at = time.time()
+        self.last_sent_at = 0.0
         self.sent = False
+        # 分组发送时间参数（按所属规则解析，见 resolve_group_timing）
+        self.group_wait = 10
+        self.group_interval = 30
+        self.repeat_interval = 3600
+        self.due_at: Optional[float] = None  # 已登记到到期堆中的到期时间
+        self.rule_priority: Optional[str] = None  # 规则 route_config 中配置的通知优先级
     
-    def add_alert(self, alert: AlertEvent):
-        """添加告警到组"""
-        self.alerts.append(alert)
-        self.last_updated_at = time.time()
+    def add_alert(self, alert: AlertEvent) -> bool:
+        """添加告警到组（同一指纹只保留一份，已存在时刷新快照）
+        
+        Returns:
+            bool: 是否为新加入的告警
+        """
+        is_new = alert.fingerprint not in self.alerts
+        self.alerts[alert.fingerprint] = AlertSnapshot.from_alert(alert)
+        if is_new:
+            self.last_updated_at = time.time()
+        return is_new
     
-    def get_alerts(self) -> List[AlertEvent]:
+    def remove_alert(self, fingerprint: str) -> bool:
+        """从组中移除告警"""
+        return self.alerts.pop(fingerprint, None) is not None
+    
+    def get_alerts(self) -> List[AlertSnapshot]:
         """获取组内所有告警"""
-        return self.alerts
+        return list(self.alerts.values())
+    
+    @property
+    def priority(self) -> str:
+        """通知优先级（规则配置优先，否则取组内告警的最高等级）"""
+        return group_priority((alert.severity for alert in self.alerts.values()), self.rule_priority)
     
     def mark_sent(self):
         """标记为已发送"""
         self.sent = True
+        self.last_sent_at = time.time()
 
 
 class AlertGrouper:
-    """告警分组器"""
+    """告警分组器
+    
+    分组按下次到期时间登记在最小堆中（惰性失效：到期时间变化时压入新条目，
+    旧条目在弹出时与分组当前的 due_at 比对后丢弃），就绪检查只弹出已到期的分组。
+    
+    所有修改分组的方法在临界区内都不含 await，在事件循环中天然互斥，
+    因此不再使用全局锁，评估协程添加告警不会与分组工作器的检查互相等待。
+    """
+    
+    # 堆中失效条目超过有效分组数的倍数时重建堆
+    HEAP_COMPACT_FACTOR = 2
     
     def __init__(self):
         from app.db.database import AsyncSessionLocal
         self.SessionLocal = AsyncSessionLocal
         self.groups: Dict[str, AlertGroup] = {}  # firing 告警分组
         self.recovery_groups: Dict[str, AlertGroup] = {}  # resolved 告警分组
+        self._fingerprint_index: Dict[str, str] = {}  # 指纹 -> firing 分组键
         self.group_wait = 10  # 分组等待时间（秒）
         self.group_interval = 30  # 分组间隔时间（秒）
         self.repeat_interval = 3600  # 重复发送间隔（秒）
-        self._lock = asyncio.Lock()
+        # 到期堆: (到期时间, 序号, 是否恢复分组, 分组键)
+        self._due_heap: List[Tuple[float, int, bool, str]] = []
+        self._heap_seq = itertools.count()
     
     def _generate_group_key(
         self, 
@@ -80,30 +165,98 @@ class AlertGrouper:
         
         return group_key, group_labels
     
+    def _schedule(self, group: AlertGroup, is_recovery: bool):
+        """到期时间变化时把分组重新登记到到期堆"""
+        due_at = self._group_due_time(group)
+        if due_at == group.due_at:
+            return
+        group.due_at = due_at
+        heapq.heappush(self._due_heap, (due_at, next(self._heap_seq), is_recovery, group.group_key))
+        
+        if len(self._due_heap) > self.HEAP_COMPACT_FACTOR * (len(self.groups) + len(self.recovery_groups)) + 64:
+            self._compact_heap()
+    
+    def _compact_heap(self):
+        """丢弃失效条目并重建到期堆"""
+        self._due_heap = [
+            entry for entry in self._due_heap
+            if self._lookup_valid(entry) is not None
+        ]
+        heapq.heapify(self._due_heap)
+    
+    def _lookup_valid(self, entry: Tuple[float, int, bool, str]) -> Optional[AlertGroup]:
+        """返回堆条目对应的分组（分组已删除、为空或到期时间已变化时返回 None）"""
+        due_at, _, is_recovery, group_key = entry
+        group = (self.recovery_groups if is_recovery else self.groups).get(group_key)
+        if group is None or not group.alerts or group.due_at != due_at:
+            return None
+        return group
+    
+    def _bind_rule(self, group: AlertGroup, rule: AlertRule):
+        """关联规则并按规则刷新分组的发送时间参数"""
+        group.rule_id = rule.id
+        group.rule_name = rule.name
+        group.rule_priority = rule_priority(rule)
+        group.group_wait, group.group_interval, group.repeat_interval = resolve_group_timing(
+            rule, self.group_wait, self.group_interval, self.repeat_interval
+        )
+    
     async def add_alert(self, alert: AlertEvent, rule: AlertRule) -> str:
         """
         添加告警到分组
         
         返回: group_key
         """
-        async with self._lock:
+        group_key, group_labels = self._generate_group_key(alert, rule)
+        
+        # 检查是否已存在该分组
+        if group_key not in self.groups:
+            # 创建新分组
+            group = AlertGroup(group_key, group_labels)
+            self.groups[group_key] = group
+            logger.info(f"创建新的告警分组: {group_key}")
+        else:
+            group = self.groups[group_key]
+        
+        # 添加告警到分组
+        self._bind_rule(group, rule)
+        group.add_alert(alert)
+        self._fingerprint_index[alert.fingerprint] = group_key
+        self._schedule(group, False)
+        logger.debug(f"告警添加到分组: {group_key}, 当前告警数: {len(group.alerts)}")
+        
+        return group_key
+    
+    async def add_alerts_batch(self, alerts_with_rules: List[tuple]) -> List[str]:
+        """
+        批量添加告警到分组
+        
+        参数:
+            alerts_with_rules: List[(alert, rule)]
+        
+        返回: List[group_key]
+        """
+        group_keys = []
+        for alert, rule in alerts_with_rules:
             group_key, group_labels = self._generate_group_key(alert, rule)
             
-            # 检查是否已存在该分组
-            if group_key not in self.groups:
-                # 创建新分组
+            group = self.groups.get(group_key)
+            if group is None:
                 group = AlertGroup(group_key, group_labels)
-                group.rule = rule
                 self.groups[group_key] = group
                 logger.info(f"创建新的告警分组: {group_key}")
-            else:
-                group = self.groups[group_key]
             
-            # 添加告警到分组
+            self._bind_rule(group, rule)
             group.add_alert(alert)
-            logger.debug(f"告警添加到分组: {group_key}, 当前告警数: {len(group.alerts)}")
-            
-            return group_key
+            self._fingerprint_index[alert.fingerprint] = group_key
+            if group_key not in group_keys:
+                group_keys.append(group_key)
+        
+        for group_key in group_keys:
+            self._schedule(self.groups[group_key], False)
+        
+        logger.debug(f"批量添加 {len(alerts_with_rules)} 个告警到 {len(group_keys)} 个分组")
+        return group_keys
     
     async def add_recovery_alert(self, alert: AlertEvent, rule: AlertRule) -> str:
         """
@@ -111,93 +264,103 @@ class AlertGrouper:
         
         返回: group_key
         """
-        async with self._lock:
-            group_key, group_labels = self._generate_group_key(alert, rule)
-            # 恢复告警使用单独的 key
-            recovery_key = f"recovery:{group_key}"
-            
-            # 检查是否已存在该恢复分组
-            if recovery_key not in self.recovery_groups:
-                # 创建新恢复分组
-                group = AlertGroup(recovery_key, group_labels)
-                group.rule = rule
-                self.recovery_groups[recovery_key] = group
-                logger.info(f"创建新的恢复告警分组: {recovery_key}")
-            else:
-                group = self.recovery_groups[recovery_key]
-            
-            # 添加恢复告警到分组
-            group.add_alert(alert)
-            logger.debug(f"恢复告警添加到分组: {recovery_key}, 当前告警数: {len(group.alerts)}")
-            
-            return recovery_key
+        group_key, group_labels = self._generate_group_key(alert, rule)
+        # 恢复告警使用单独的 key
+        recovery_key = f"recovery:{group_key}"
+        
+        # 检查是否已存在该恢复分组
+        if recovery_key not in self.recovery_groups:
+            # 创建新恢复分组
+            group = AlertGroup(recovery_key, group_labels)
+            self.recovery_groups[recovery_key] = group
+            logger.info(f"创建新的恢复告警分组: {recovery_key}")
+        else:
+            group = self.recovery_groups[recovery_key]
+        
+        # 添加恢复告警到分组
+        self._bind_rule(group, rule)
+        group.add_alert(alert)
+        self._schedule(group, True)
+        logger.debug(f"恢复告警添加到分组: {recovery_key}, 当前告警数: {len(group.alerts)}")
+        
+        return recovery_key
     
     async def get_ready_groups(self) -> List[tuple]:
         """
-        获取准备好发送的分组
+        获取准备好发送的分组（只弹出到期堆中已到期的条目）
+        
+        就绪分组会以原到期时间重新入堆：发送成功后 mark_group_sent / clear_sent_group
+        使该条目失效；发送失败时下一轮仍会返回该分组。
         
         返回: List[tuple(group, is_recovery)]
         """
-        async with self._lock:
-            ready_groups = []
-            current_time = time.time()
-            
-            logger.debug(f"🔍 检查分组: firing={len(self.groups)}, recovery={len(self.recovery_groups)}")
-            
-            # 检查 firing 告警分组
-            for group_key, group in list(self.groups.items()):
-                wait_time = current_time - group.created_at
-                logger.debug(f"🔍 检查firing分组 {group_key}: wait_time={wait_time:.1f}s, group_wait={self.group_wait}s, sent={group.sent}")
-                if self._is_group_ready(group, current_time):
-                    ready_groups.append((group, False))
-                    logger.info(f"✅ firing 分组等待时间已到: {group_key}, 告警数: {len(group.alerts)}")
-            
-            # 检查 recovery 告警分组
-            for group_key, group in list(self.recovery_groups.items()):
-                wait_time = current_time - group.created_at
-                logger.debug(f"🔍 检查recovery分组 {group_key}: wait_time={wait_time:.1f}s, group_wait={self.group_wait}s, sent={group.sent}")
-                if self._is_group_ready(group, current_time):
-                    ready_groups.append((group, True))
-                    logger.info(f"✅ recovery 分组等待时间已到: {group_key}, 告警数: {len(group.alerts)}")
-            
-            return ready_groups
+        ready_groups = []
+        current_time = time.time()
+        
+        while self._due_heap and self._due_heap[0][0] <= current_time:
+            entry = heapq.heappop(self._due_heap)
+            group = self._lookup_valid(entry)
+            if group is None:
+                continue
+            is_recovery = entry[2]
+            ready_groups.append((entry, group, is_recovery))
+            status_text = "recovery" if is_recovery else "firing"
+            logger.info(f"✅ {status_text} 分组等待时间已到: {group.group_key}, 告警数: {len(group.alerts)}")
+        
+        for entry, _, _ in ready_groups:
+            heapq.heappush(self._due_heap, entry)
+        
+        return [(group, is_recovery) for _, group, is_recovery in ready_groups]
     
-    def _is_group_ready(self, group: AlertGroup, current_time: float) -> bool:
-        """检查分组是否准备好发送"""
-        # 跳过空分组
-        if not group.alerts:
-            return False
-        
-        # 检查是否已发送
-        if group.sent:
-            # 使用规则中配置的重复发送间隔
-            repeat_interval = self.repeat_interval
-            if hasattr(group, 'rule') and group.rule:
-                repeat_interval = group.rule.repeat_interval
-            
-            # 检查是否需要重复发送
-            if (current_time - group.last_updated_at) >= repeat_interval:
-                logger.debug(f"分组达到重复发送间隔({repeat_interval}s): {group.group_key}")
-                return True
-            return False
+    def _group_due_time(self, group: AlertGroup) -> float:
+        """
+        计算分组下次到期时间（与 Redis 分组器的 next_due 一致）
         
-        # 检查等待时间
-        wait_time = current_time - group.created_at
-        return wait_time >= self.group_wait
+        - 未发送：created_at + group_wait
+        - 已发送且之后有新告警加入：last_sent_at + group_interval
+        - 已发送且无变化：last_sent_at + repeat_interval
+        """
+        if not group.sent:
+            return group.created_at + group.group_wait
+        if group.last_updated_at > group.last_sent_at:
+            return group.last_sent_at + group.group_interval
+        return group.last_sent_at + group.repeat_interval
+    
+    async def get_next_due_time(self) -> Optional[float]:
+        """获取最早到期的分组时间，无分组时返回 None"""
+        # 丢弃堆顶的失效条目
+        while self._due_heap and self._lookup_valid(self._due_heap[0]) is None:
+            heapq.heappop(self._due_heap)
+        return self._due_heap[0][0] if self._due_heap else None
+    
+    async def mark_group_sent(self, group_key: str, is_recovery: bool = False):
+        """标记分组为已发送（分组保留，按 group_interval / repeat_interval 再次发送）"""
+        groups_dict = self.recovery_groups if is_recovery else self.groups
+        group = groups_dict.get(group_key)
+        if group is not None:
+            group.mark_sent()
+            self._schedule(group, is_recovery)
     
     async def clear_sent_group(self, group_key: str, is_recovery: bool = False):
         """清除已发送的分组"""
-        async with self._lock:
-            groups_dict = self.recovery_groups if is_recovery else self.groups
-            if group_key in groups_dict:
-                del groups_dict[group_key]
-                logger.debug(f"清除已发送分组: {group_key}")
+        groups_dict = self.recovery_groups if is_recovery else self.groups
+        group = groups_dict.pop(group_key, None)
+        if group is not None:
+            if not is_recovery:
+                for fingerprint in group.alerts:
+                    if self._fingerprint_index.get(fingerprint) == group_key:
+                        del self._fingerprint_index[fingerprint]
+            logger.debug(f"清除已发送分组: {group_key}")
     
     async def remove_alert_from_groups(self, fingerprint: str):
-        """从所有分组中移除指定的告警（用于告警恢复）"""
-        async with self._lock:
-            for group in self.groups.values():
-                group.alerts = [a for a in group.alerts if a.fingerprint != fingerprint]
+        """从所属 firing 分组中移除指定的告警（用于告警恢复，按指纹索引定位），分组为空时删除分组"""
+        group_key = self._fingerprint_index.pop(fingerprint, None)
+        group = self.groups.get(group_key) if group_key else None
+        if group is None:
+            return
+        group.remove_alert(fingerprint)
+        if not group.alerts:
+            del self.groups[group_key]
     
     def get_group_stats(self) -> Dict[str, int]:
         """获取分组统计信息"""
@@ -2,17 +2,21 @@
 
 负责管理告警的生命周期、静默检查、通知发送和告警分组。
 """
+import json
 import time
 import asyncio
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
 
 from app.models.alert import AlertEvent, AlertEventHistory, AlertRule
-from app.models.silence import SilenceRule
 from app.services.notifier import NotificationService
-from app.services.alert_grouper import AlertGrouper
+from app.services.alert_grouper import AlertGrouper, resolve_group_timing
+from app.services.group_dispatcher import GroupDispatcher
+from app.services.storm_detector import StormDetector
+from app.services.silence_engine import silence_engine
+from app.services.alert_snapshot import AlertSnapshot
 from app.db.database import DatabaseSessionManager
 
 
@@ -28,11 +32,38 @@ class AlertManager:
     Attributes:
         db_manager: 数据库会话管理器
         notifier: 通知服务
+        storm_detector: 告警风暴检测器，风暴期间分组通知合并为摘要定期发送
         grouper: 告警分组器（内存版本）
         _grouping_enabled: 是否启用告警分组
         _use_redis: 是否使用 Redis 分组器
+        _group_wakeup: 有告警加入分组时唤醒分组工作器
+        dispatcher: 就绪分组的并发派发器
+        _notification_queue: Redis 模式下的分组通知队列（Redis Streams，多实例共同消费）
+        _slot_leases: Redis 模式下的分组槽位租约，分组工作器只处理持有租约的槽位
     """
     
+    # 分组工作器休眠上下限（秒）：按最早到期分组计算休眠时间，
+    # 上限用于兜底其他实例写入的分组
+    GROUPING_MIN_SLEEP = 0.2
+    GROUPING_MAX_SLEEP = 5
+    
+    # 同时发送的分组数上限
+    MAX_CONCURRENT_GROUP_SENDS = 20
+    
+    # 批量更新 last_sent_at 时每条 UPDATE 的指纹数
+    LAST_SENT_UPDATE_CHUNK = 500
+    
+    # 告警去重令牌的有效期（秒），令牌不主动释放
+    ALERT_CLAIM_TTL = 30
+    
+    # 通知队列每次读取的消息数
+    NOTIFY_CONSUME_BATCH = 20
+    
+    # 分组统计发布到 Redis（HASH: 工作器 ID -> 统计 JSON），供未运行后台任务的 API 进程查询
+    WORKER_STATS_KEY = "alert:group:worker_stats"
+    WORKER_STATS_PUBLISH_INTERVAL = 10
+    WORKER_STATS_TTL = 60
+    
     def __init__(self, use_redis: bool = True):
         """初始化告警管理器
         
@@ -40,16 +71,27 @@ class AlertManager:
             use_redis: 是否使用 Redis 分组器，默认 True
         """
         self.db_manager = DatabaseSessionManager()
-        self.notifier = NotificationService()
+        self.storm_detector = StormDetector()
+        self.notifier = NotificationService(storm_detector=self.storm_detector)
+        self._storm_flush_task = None
         self._grouping_enabled = True  # 是否启用告警分组
         self._grouping_task = None
         self._use_redis = use_redis
         self._redis_grouper = None
         self._lock_manager = None
+        self._notification_queue = None
+        self._consumer_task = None
+        self._claim_refresh_task = None
+        self._delivered_channels: Dict[tuple, Set[int]] = {}  # 内存模式：(分组键, 是否恢复) -> 已发送成功的渠道
+        self._slot_leases = None
         self._redis_init_pending = use_redis  # 标记 Redis 初始化待处理
+        self._group_wakeup = asyncio.Event()
+        self._next_wake_at = 0.0  # 分组工作器计划的下次唤醒时间
+        self._stats_published_at = 0.0
         
         # 初始化分组器（内存版本作为后备）
         self.grouper = AlertGrouper()
+        self.dispatcher = GroupDispatcher(max_concurrent=self.MAX_CONCURRENT_GROUP_SENDS)
     
     
     async def _init_redis_components(self):
@@ -64,6 +106,8 @@ class AlertManager:
             from app.db.redis_client import RedisClient
             from app.services.optimized_alert_grouper import OptimizedAlertGrouper
             from app.core.distributed_lock import AlertLockManager
+            from app.services.notification_queue import NotificationStreamQueue
+            from app.core.slot_lease import SlotLeaseManager
             
             # 异步获取 Redis 客户端
             redis_client = await RedisClient.get_client()
@@ -71,8 +115,25 @@ class AlertManager:
             
             # 初始化优化的 Redis 分组器和锁管理器
             self._redis_grouper = OptimizedAlertGrouper(redis_client, max_concurrent=100)
+            self._redis_grouper.configure(
+                self.grouper.group_wait,
+                self.grouper.group_interval,
+                self.grouper.repeat_interval
+            )
+            await self._redis_grouper.rebuild_due_index()
             self._lock_manager = AlertLockManager(redis_client)
             
+            # 就绪分组通过 Stream 消费者组分发给所有实例
+            self._notification_queue = NotificationStreamQueue(redis_client)
+            await self._notification_queue.ensure_group()
+            
+            # 分组键按槽位分片，各实例的分组工作器只处理自己持有租约的槽位
+            self._slot_leases = SlotLeaseManager(
+                redis_client,
+                num_slots=self._redis_grouper.num_slots,
+                worker_id=self._notification_queue.consumer_name
+            )
+            
             self._redis_init_pending = False
             logger.info(f"✅ Redis 分组器和分布式锁已启用 (grouper={self._redis_grouper}, lock={self._lock_manager})")
         except Exception as e:
@@ -91,65 +152,70 @@ class AlertManager:
         return grouper
     
     async def send_alert(self, alert: AlertEvent, rule: AlertRule):
-        """发送告警通知（支持分布式锁）"""
+        """发送告警通知（单条告警按批量路径处理，去重令牌一次往返）"""
+        await self.send_alerts_batch([alert], rule)
+    
+    async def send_alerts_batch(self, alerts: List[AlertEvent], rule: AlertRule):
+        """批量发送同一规则的告警（评估器一次提交本轮所有 pending → firing 的告警）
+        
+        与逐条调用 send_alert 相比：
+        - 静默规则只查询一次，在内存中逐条匹配
+        - 分布式去重一次往返认领整批告警
+        - 分组模式下每个受影响的分组只做一次 Redis 写入
+        """
+        if not alerts:
+            return
+        
         try:
-            # 检查是否被静默
-            if await self.is_silenced(alert):
-                logger.info(f"告警被静默: fingerprint={alert.fingerprint}")
+            alerts = await self.filter_silenced(alerts)
+            if not alerts:
                 return
             
-            # 使用分布式锁防止重复发送
+            # 分布式去重：只处理本实例认领成功的告警
             if self._lock_manager:
-                # 检查是否正在发送
-                if await self._lock_manager.is_alert_sending(alert.fingerprint):
-                    logger.debug(f"告警正在发送中（分布式锁保护）: {alert.fingerprint}")
+                claimed = await self._lock_manager.claim_alerts(
+                    [alert.fingerprint for alert in alerts],
+                    ttl=self.ALERT_CLAIM_TTL
+                )
+                skipped = len(alerts) - len(claimed)
+                if skipped:
+                    logger.debug(f"{skipped} 个告警已被其他实例认领，跳过")
+                alerts = [alert for alert in alerts if alert.fingerprint in claimed]
+                if not alerts:
                     return
-                
-                # 获取锁
-                lock = self._lock_manager.get_alert_lock(alert.fingerprint, timeout=60)
-                if not await lock.acquire(blocking=False):
-                    logger.debug(f"无法获取告警锁，跳过: {alert.fingerprint}")
+            
+            enable_grouping = rule.route_config.get('enable_grouping', True)
+            if self._grouping_enabled and enable_grouping:
+                current_time = int(time.time())
+                group_wait = resolve_group_timing(
+                    rule, self.active_grouper.group_wait, self.active_grouper.group_interval, self.active_grouper.repeat_interval
+                )[0]
+                window = group_wait + 5
+                to_group = [
+                    alert for alert in alerts
+                    if not (alert.last_sent_at > 0 and (current_time - alert.last_sent_at) < window)
+                ]
+                if not to_group:
                     return
                 
-                try:
-                    await self._send_alert_internal(alert, rule)
-                finally:
-                    await lock.release()
+                await self.active_grouper.add_alerts_batch([(alert, rule) for alert in to_group])
+                self._wake_grouping_worker(group_wait)
+                logger.info(f"{len(to_group)} 个告警已批量添加到分组器: rule={rule.name}")
+                
+                # 标记为已处理（随调用方会话一起提交）
+                for alert in to_group:
+                    alert.last_sent_at = current_time
             else:
-                await self._send_alert_internal(alert, rule)
+                # 直接发送（不分组）
+                for alert in alerts:
+                    if not self.should_send_notification(alert):
+                        logger.debug(f"未到通知间隔: fingerprint={alert.fingerprint}")
+                        continue
+                    await self.notifier.send_notification(alert, rule, is_recovery=False)
+                    alert.last_sent_at = int(time.time())
             
         except Exception as e:
-            logger.error(f"发送告警失败: fingerprint={alert.fingerprint}, error={str(e)}")
-    
-    async def _send_alert_internal(self, alert: AlertEvent, rule: AlertRule):
-        """内部发送告警逻辑"""
-        # 检查是否启用告警分组
-        enable_grouping = rule.route_config.get('enable_grouping', True)
-        if self._grouping_enabled and enable_grouping:
-            # 使用分组模式
-            current_time = int(time.time())
-            if alert.last_sent_at > 0 and (current_time - alert.last_sent_at) < self.active_grouper.group_wait + 5:
-                logger.debug(f"告警已在分组中，跳过: {alert.fingerprint}")
-                return
-            
-            # 添加到分组器
-            await self.active_grouper.add_alert(alert, rule)
-            logger.info(f"告警已添加到分组器: {alert.fingerprint}")
-            
-            # 标记为已处理（避免重复添加）
-            async with self.db_manager.session() as db:
-                alert.last_sent_at = current_time
-        else:
-            # 直接发送（不分组）
-            if not self.should_send_notification(alert):
-                logger.debug(f"未到通知间隔: fingerprint={alert.fingerprint}")
-                return
-            
-            await self.notifier.send_notification(alert, rule, is_recovery=False)
-            
-            # 更新最后发送时间
-            async with self.db_manager.session() as db:
-                alert.last_sent_at = int(time.time())
+            logger.error(f"批量发送告警失败: rule={rule.name}, count={len(alerts)}, error={str(e)}")
     
     async def send_recovery(self, alert: AlertEvent, rule: AlertRule):
         """发送恢复通知"""
@@ -164,6 +230,9 @@ class AlertManager:
             if self._grouping_enabled and enable_grouping and enable_recovery_grouping:
                 # 添加到恢复告警分组器
                 await self.active_grouper.add_recovery_alert(alert, rule)
+                self._wake_grouping_worker(resolve_group_timing(
+                    rule, self.active_grouper.group_wait, self.active_grouper.group_interval, self.active_grouper.repeat_interval
+                )[0])
                 logger.info(f"恢复告警已添加到分组器: {alert.fingerprint}")
             else:
                 # 直接发送恢复通知
@@ -174,29 +243,22 @@ class AlertManager:
     
     async def is_silenced(self, alert: AlertEvent) -> bool:
         """检查告警是否被静默"""
-        from app.services.silence_matcher import check_silence_match
-        
-        current_time = int(time.time())
-        
-        # 使用独立会话查询生效的静默规则
-        async with self.db_manager.session(auto_commit=False) as db:
-            # 查询生效的静默规则
-            stmt = select(SilenceRule).where(
-                SilenceRule.tenant_id == alert.tenant_id,
-                SilenceRule.is_enabled == True,
-                SilenceRule.starts_at <= current_time,
-                SilenceRule.ends_at >= current_time
-            )
-            result = await db.execute(stmt)
-            silence_rules = result.scalars().all()
-        
-        # 检查是否匹配静默规则（使用新的匹配逻辑）
-        for rule in silence_rules:
-            if check_silence_match(alert.labels, rule.matchers):
-                logger.info(f"告警匹配静默规则: fingerprint={alert.fingerprint}, silence_rule={rule.name}")
-                return True
+        return not await self.filter_silenced([alert])
+    
+    async def filter_silenced(self, alerts: List[AlertEvent]) -> List[AlertEvent]:
+        """过滤掉被静默的告警（使用静默引擎的内存快照，不查询数据库）
         
-        return False
+        Returns:
+            List[AlertEvent]: 未被静默的告警
+        """
+        remaining = []
+        for alert in alerts:
+            matched = await silence_engine.match(alert.tenant_id, alert.labels or {})
+            if matched:
+                logger.info(f"告警匹配静默规则: fingerprint={alert.fingerprint}, silence_rule={matched.name}")
+            else:
+                remaining.append(alert)
+        return remaining
     
     @staticmethod
     def should_send_notification(alert: AlertEvent, min_interval: int = 300) -> bool:
@@ -258,17 +320,29 @@ class AlertManager:
             await self._init_redis_components()
         
         self._grouping_task = asyncio.create_task(self._grouping_worker())
+        if self._notification_queue:
+            self._consumer_task = asyncio.create_task(self._notification_consumer())
+            self._claim_refresh_task = asyncio.create_task(self._notification_queue.run_claim_refresher())
         logger.info("告警分组工作器已启动")
     
     async def stop_grouping_worker(self):
-        """停止告警分组工作器"""
+        """停止告警分组工作器（未确认的队列消息由其他实例接管）"""
         if self._grouping_task:
-            self._grouping_task.cancel()
-            try:
-                await self._grouping_task
-            except asyncio.CancelledError:
-                pass
+            for task in (self._grouping_task, self._consumer_task, self._claim_refresh_task, self._storm_flush_task):
+                if task is None:
+                    continue
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
             self._grouping_task = None
+            self._consumer_task = None
+            self._claim_refresh_task = None
+            self._storm_flush_task = None
+            if self._slot_leases:
+                await self._slot_leases.release()
+            await self.dispatcher.close()
             logger.info("告警分组工作器已停止")
     
     async def _grouping_worker(self):
@@ -276,20 +350,24 @@ class AlertManager:
         告警分组工作器（定期检查并发送准备好的分组）
         
         参考 Alertmanager 的逻辑：
-        1. 每隔一段时间检查分组
+        1. 休眠到最早到期的分组（有新告警加入分组时提前唤醒）
         2. group_wait: 首次等待时间
         3. group_interval: 已发送分组的重复间隔
         4. repeat_interval: 持续告警的重复发送间隔
         """
         logger.info("🚀 告警分组工作器开始运行")
         iteration = 0
+        last_heartbeat = time.time()
         
         while True:
             try:
                 iteration += 1
+                # 先清除唤醒标记，处理期间加入的告警会让下一次等待立即返回
+                self._group_wakeup.clear()
                 
-                # 每10次迭代输出一次心跳（50秒）
-                if iteration % 10 == 0:
+                # 每分钟输出一次心跳
+                if time.time() - last_heartbeat >= 60:
+                    last_heartbeat = time.time()
                     logger.info(f"💓 分组工作器心跳检查 (迭代: {iteration})")
                 
                 # 获取分组统计
@@ -297,26 +375,46 @@ class AlertManager:
                 logger.debug(f"🔍 当前分组统计: {stats}")
                 if stats.get('total_groups', 0) > 0:
                     logger.info(f"📊 分组统计: {stats}")
+                if time.time() - self._stats_published_at >= self.WORKER_STATS_PUBLISH_INTERVAL:
+                    await self._publish_grouping_stats(stats)
                 
                 # 获取准备好发送的分组
-                ready_groups = await self.active_grouper.get_ready_groups()
+                checked_at = time.time()
+                queue = self._notification_queue if self._use_redis and self._redis_grouper else None
+                if queue:
+                    # Redis 模式：只处理持有租约的槽位，带租约取出并发布到通知队列，由所有实例的消费者发送
+                    slots = await self._slot_leases.maintain()
+                    ready_groups = await self._redis_grouper.get_ready_groups(lease=queue.publish_lease, slots=slots)
+                    await queue.publish(ready_groups)
+                    await self._redis_grouper.reconcile_stats_if_due()
+                else:
+                    ready_groups = await self.active_grouper.get_ready_groups()
                 
                 if ready_groups:
                     logger.info(f"🎯 检测到 {len(ready_groups)} 个准备好的分组")
                 
-                # 发送每个准备好的分组
-                for group, is_recovery in ready_groups:
-                    try:
-                        await self._send_alert_group(group, is_recovery)
-                    except Exception as e:
-                        # 兼容对象和字典格式
-                        group_key = group.get('group_key') if isinstance(group, dict) else getattr(group, 'group_key', 'unknown')
-                        logger.error(f"❌ 发送告警分组失败: group={group_key}, is_recovery={is_recovery}, error={str(e)}")
-                        import traceback
-                        logger.error(f"详细错误: {traceback.format_exc()}")
+                # 内存模式：交给派发器并发发送（同一分组键串行，不阻塞工作器）
+                # 派发器按通知优先级分配发送槽位，critical 分组不会排在大量 info 分组之后
+                for group, is_recovery in ([] if queue else ready_groups):
+                    # 兼容对象和字典格式
+                    if isinstance(group, dict):
+                        group_key, priority = group.get('group_key'), group.get('priority')
+                    else:
+                        group_key, priority = getattr(group, 'group_key', 'unknown'), group.priority
+                    self.dispatcher.dispatch(
+                        group_key,
+                        is_recovery,
+                        lambda group=group, group_key=group_key, is_recovery=is_recovery: self._send_memory_group(group, group_key, is_recovery),
+                        ready_at=checked_at,
+                        priority=priority
+                    )
                 
-                # 每隔5秒检查一次（类似 Alertmanager 的 check interval）
-                await asyncio.sleep(5)
+                # 后台发送到期的告警风暴摘要（不阻塞分组处理）
+                if self._storm_flush_task is None or self._storm_flush_task.done():
+                    self._storm_flush_task = asyncio.create_task(self.notifier.flush_storm_summaries())
+                
+                # 休眠到最早到期的分组，或被新加入的告警唤醒
+                await self._wait_next_due(checked_at)
                 
             except asyncio.CancelledError:
                 logger.info("🛑 告警分组工作器被取消")
@@ -327,100 +425,272 @@ class AlertManager:
                 logger.error(f"详细错误: {traceback.format_exc()}")
                 await asyncio.sleep(5)  # 发生错误时等待后重试
     
-    async def _send_alert_group(self, group, is_recovery: bool = False):
+    async def _notification_consumer(self):
+        """通知队列消费者：读取分组消息，经派发器发送，成功后确认
+        
+        只在派发器有空闲名额时读取，积压留在按优先级分开的 Stream 中，
+        新到的 critical 分组不会排在已读入的大量低优先级分组之后。
+        """
+        queue = self._notification_queue
+        logger.info(f"📬 通知队列消费者开始运行: {queue.consumer_name}")
+        
+        while True:
+            try:
+                await self.dispatcher.wait_for_capacity()
+                count = min(self.NOTIFY_CONSUME_BATCH, self.dispatcher.free_slots)
+                entries = await queue.consume(count=count)
+                for entry_id, group, is_recovery, priority in entries:
+                    # 排队和发送期间定期刷新消息空闲时间，避免被其他消费者重复接管
+                    queue.hold(entry_id, priority)
+                    dispatched = self.dispatcher.dispatch(
+                        group['group_key'],
+                        is_recovery,
+                        lambda entry_id=entry_id, group=group, is_recovery=is_recovery, priority=priority: self._send_and_ack(entry_id, group, is_recovery, priority),
+                        ready_at=queue.entry_time(entry_id),
+                        priority=priority
+                    )
+                    if not dispatched:
+                        # 同一分组已在本实例发送中，重复消息直接确认
+                        queue.release(entry_id, priority)
+                        await queue.ack([entry_id], priority)
+                
+            except asyncio.CancelledError:
+                logger.info("🛑 通知队列消费者被取消")
+                break
+            except Exception as e:
+                logger.error(f"❌ 通知队列消费者错误: {str(e)}")
+                await asyncio.sleep(5)  # 发生错误时等待后重试
+    
+    async def _send_and_ack(self, entry_id: str, group: dict, is_recovery: bool, priority: str) -> bool:
+        """发送队列中的分组，所有渠道成功后确认消息
+        
+        有渠道失败时消息保留，超时后被接管重试；已成功的渠道记录在消息上，重试时跳过。
+        """
+        queue = self._notification_queue
+        try:
+            delivered = await queue.get_delivered(entry_id)
+            previously = set(delivered)
+            success = await self._send_alert_group(group, is_recovery, delivered)
+            if success:
+                await queue.ack([entry_id], priority)
+            else:
+                await queue.add_delivered(entry_id, delivered - previously)
+            return success
+        finally:
+            queue.release(entry_id, priority)
+    
+    async def _send_memory_group(self, group, group_key: str, is_recovery: bool) -> bool:
+        """内存模式发送分组：失败的分组下一轮重试，已成功的渠道跳过"""
+        key = (group_key, is_recovery)
+        delivered = self._delivered_channels.setdefault(key, set())
+        success = await self._send_alert_group(group, is_recovery, delivered)
+        if success or not delivered:
+            self._delivered_channels.pop(key, None)
+        return success
+    
+    def _wake_grouping_worker(self, group_wait: Optional[int] = None):
+        """新分组的到期时间早于工作器计划唤醒时间时，提前唤醒工作器
+        
+        Args:
+            group_wait: 新分组的等待时间（按规则解析），默认使用分组器全局配置
+        """
+        if group_wait is None:
+            group_wait = self.active_grouper.group_wait
+        if time.time() + group_wait < self._next_wake_at:
+            self._group_wakeup.set()
+    
+    async def _wait_next_due(self, checked_at: float):
+        """等待到最早到期分组的时间（有新告警加入分组时提前返回）
+        
+        Args:
+            checked_at: 本轮就绪检查的时间。早于该时间到期却仍未清除的分组说明
+                本轮发送失败，按休眠上限重试，避免空转
+        """
+        try:
+            grouper = self.active_grouper
+            if grouper is self._redis_grouper and self._slot_leases:
+                next_due = await grouper.get_next_due_time(slots=self._slot_leases.owned_slots)
+            else:
+                next_due = await grouper.get_next_due_time()
+        except Exception as e:
+            logger.debug(f"获取分组到期时间失败: {str(e)}")
+            next_due = None
+        
+        if next_due is None or next_due <= checked_at:
+            timeout = self.GROUPING_MAX_SLEEP
+        else:
+            timeout = min(max(next_due - time.time(), self.GROUPING_MIN_SLEEP), self.GROUPING_MAX_SLEEP)
+        self._next_wake_at = time.time() + timeout
+        
+        try:
+            await asyncio.wait_for(self._group_wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def _load_rule(self, rule_id: Optional[int]) -> Optional[AlertRule]:
+        """查询分组关联的规则（独立会话，发送期间不占用数据库连接）"""
+        if rule_id is None:
+            return None
+        async with self.db_manager.session() as db:
+            result = await db.execute(select(AlertRule).where(AlertRule.id == rule_id))
+            return result.scalar_one_or_none()
+    
+    async def _update_last_sent_at(self, fingerprints: List[str], sent_at: int) -> int:
+        """按指纹批量更新告警的最后发送时间
+        
+        每 LAST_SENT_UPDATE_CHUNK 个指纹执行一条 UPDATE ... WHERE fingerprint IN (...)，
+        已恢复或归档的告警不在表中，自然不会被更新。
+        
+        Returns:
+            int: 更新的行数
+        """
+        updated = 0
+        async with self.db_manager.session() as db:
+            for i in range(0, len(fingerprints), self.LAST_SENT_UPDATE_CHUNK):
+                chunk = fingerprints[i:i + self.LAST_SENT_UPDATE_CHUNK]
+                result = await db.execute(
+                    update(AlertEvent)
+                    .where(AlertEvent.fingerprint.in_(chunk))
+                    .values(last_sent_at=sent_at)
+                    .execution_options(synchronize_session=False)
+                )
+                updated += result.rowcount or 0
+        return updated
+    
+    async def _filter_firing_fingerprints(self, fingerprints: List[str]) -> set:
+        """返回仍处于 firing 状态且未被静默的指纹（按 LAST_SENT_UPDATE_CHUNK 分块查询）"""
+        firing = set()
+        async with self.db_manager.session(auto_commit=False) as db:
+            for i in range(0, len(fingerprints), self.LAST_SENT_UPDATE_CHUNK):
+                chunk = fingerprints[i:i + self.LAST_SENT_UPDATE_CHUNK]
+                result = await db.execute(
+                    select(AlertEvent.fingerprint).where(
+                        AlertEvent.fingerprint.in_(chunk),
+                        AlertEvent.status == 'firing',
+                        AlertEvent.is_silenced == False
+                    )
+                )
+                firing.update(result.scalars().all())
+        return firing
+    
+    async def _send_alert_group(
+        self,
+        group,
+        is_recovery: bool = False,
+        delivered: Optional[Set[int]] = None
+    ) -> bool:
         """发送告警分组（支持对象和字典格式）
         
+        Redis 分组直接使用分组中保存的告警快照发送，不再逐条回查数据库；
+        发送后按指纹分块批量更新 last_sent_at。
+        
+        firing 分组发送后保留，按规则的 group_interval / repeat_interval 重复发送，
+        其中的告警恢复时被移出；恢复分组发送后即删除。
+        
+        有渠道发送失败时不更新发送状态，分组留待重试；成功的渠道加入 delivered，重试时跳过。
+        
         Args:
             group: 告警分组对象或字典
             is_recovery: 是否为恢复告警
+            delivered: 此前已发送成功的渠道 ID（就地更新）
+        
+        Returns:
+            bool: 是否所有渠道都发送成功
         """
-        # 使用独立的数据库会话
-        async with self.db_manager.session() as db:
-            try:
-                # 兼容对象和字典两种格式
-                if isinstance(group, dict):
-                    # Redis 分组器返回字典
-                    alerts_data = group.get('alerts', [])
-                    group_key = group.get('group_key')
-                    rule_id = group.get('rule_id')
-                    
-                    if not alerts_data:
-                        logger.warning(f"分组为空: {group_key}")
-                        return
-                    
-                    # 查询规则对象
-                    stmt = select(AlertRule).where(AlertRule.id == rule_id)
-                    result = await db.execute(stmt)
-                    rule = result.scalar_one_or_none()
-                    
-                    if not rule:
-                        logger.warning(f"分组没有关联的规则: {group_key}")
-                        return
-                    
-                    # 将字典数据转换为 AlertEvent 对象列表（用于发送）
-                    alerts = []
-                    for alert_data in alerts_data:
-                        # 从数据库查询完整的 AlertEvent 对象
-                        stmt = select(AlertEvent).where(AlertEvent.fingerprint == alert_data['fingerprint'])
-                        result = await db.execute(stmt)
-                        alert_obj = result.scalar_one_or_none()
-                        if alert_obj:
-                            alerts.append(alert_obj)
-                    
-                else:
-                    # 内存分组器返回对象
-                    alerts = group.get_alerts()
-                    group_key = group.group_key
-                    rule = group.rule
-                    
-                    if not alerts:
-                        logger.warning(f"分组为空: {group_key}")
-                        return
-                    
-                    if not rule:
-                        logger.warning(f"分组没有关联的规则: {group_key}")
-                        return
-                
-                status_text = "恢复" if is_recovery else "告警"
-                logger.info(f"⭐ 发送{status_text}分组: {group_key}, 告警数: {len(alerts)}")
+        try:
+            # 兼容对象和字典两种格式
+            if isinstance(group, dict):
+                # Redis 分组器返回字典，成员为告警快照
+                alerts_data = group.get('alerts', [])
+                group_key = group.get('group_key')
+                rule_id = group.get('rule_id')
                 
-                # 批量发送告警
-                await self.notifier.send_batch_notification(alerts, rule, is_recovery=is_recovery)
+                if not alerts_data:
+                    logger.warning(f"分组为空: {group_key}")
+                    return False
                 
-                # 更新所有告警的最后发送时间（仅更新仍存在的告警）
-                current_time = int(time.time())
-                updated_count = 0
-                for alert in alerts:
-                    try:
-                        # 重新查询对象以确保在当前会话中
-                        stmt = select(AlertEvent).where(AlertEvent.fingerprint == alert.fingerprint)
-                        result = await db.execute(stmt)
-                        db_alert = result.scalar_one_or_none()
-                        if db_alert:
-                            db_alert.last_sent_at = current_time
-                            updated_count += 1
-                        else:
-                            logger.debug(f"告警已不存在（可能已恢复或归档）: {alert.fingerprint}")
-                    except Exception as e:
-                        logger.warning(f"更新告警发送时间失败: {alert.fingerprint}, error={str(e)}")
+                rule = await self._load_rule(rule_id)
+                if not rule:
+                    logger.warning(f"分组没有关联的规则: {group_key}")
+                    return False
                 
-                logger.debug(f"更新了 {updated_count}/{len(alerts)} 个告警的发送时间")
+                # 旧版本快照缺少的字段按分组信息补齐
+                status = 'resolved' if is_recovery else 'firing'
+                alerts = [
+                    AlertSnapshot.from_dict(alert_data, rule_id=rule_id, status=status)
+                    for alert_data in alerts_data
+                ]
                 
-                logger.info(f"✅ {status_text}分组发送成功: {group_key}")
+            else:
+                # 内存分组器返回对象，成员为告警快照
+                alerts = group.get_alerts()
+                group_key = group.group_key
                 
-                # 标记分组为已发送（对象格式才需要）
-                if not isinstance(group, dict) and hasattr(group, 'mark_sent'):
-                    group.mark_sent()
+                if not alerts:
+                    logger.warning(f"分组为空: {group_key}")
+                    return False
                 
-                # 清理已发送的分组
+                rule = await self._load_rule(group.rule_id)
+                if not rule:
+                    logger.warning(f"分组没有关联的规则: {group_key}")
+                    return False
+            
+            # 重复发送前剔除已不再 firing 或已被静默的告警（如规则被删除或禁用、首次发送后新建了静默）
+            already_sent = group.get('sent') if isinstance(group, dict) else group.sent
+            if already_sent and not is_recovery:
+                firing = await self._filter_firing_fingerprints([alert.fingerprint for alert in alerts])
+                for alert in alerts:
+                    if alert.fingerprint not in firing:
+                        await self.active_grouper.remove_alert_from_groups(alert.fingerprint)
+                alerts = [alert for alert in alerts if alert.fingerprint in firing]
+                if not alerts:
+                    await self.active_grouper.clear_sent_group(group_key, is_recovery)
+                    logger.info(f"分组中的告警已全部失效，删除分组: {group_key}")
+                    return True
+            
+            status_text = "恢复" if is_recovery else "告警"
+            logger.info(f"⭐ 发送{status_text}分组: {group_key}, 告警数: {len(alerts)}")
+            
+            # 批量发送告警（跳过此前已成功的渠道）
+            if delivered is None:
+                delivered = set()
+            results = await self.notifier.send_batch_notification(
+                alerts, rule, is_recovery=is_recovery, new_group=not already_sent,
+                skip_channels=delivered
+            )
+            delivered.update(channel_id for channel_id, ok in results.items() if ok)
+            failed = [channel_id for channel_id, ok in results.items() if not ok]
+            if failed:
+                logger.warning(f"⚠️ {status_text}分组部分渠道发送失败，等待重试: {group_key}, channels={failed}")
+                return False
+            
+            # 批量更新告警的最后发送时间（恢复告警已归档，无需更新）
+            if not is_recovery:
+                current_time = int(time.time())
+                fingerprints = list(dict.fromkeys(alert.fingerprint for alert in alerts))
+                try:
+                    updated_count = await self._update_last_sent_at(fingerprints, current_time)
+                    logger.debug(f"更新了 {updated_count}/{len(fingerprints)} 个告警的发送时间")
+                except Exception as e:
+                    logger.warning(f"更新告警发送时间失败: group={group_key}, error={str(e)}")
+            
+            logger.info(f"✅ {status_text}分组发送成功: {group_key}")
+            
+            if is_recovery:
+                # 恢复分组只发送一次
                 await self.active_grouper.clear_sent_group(group_key, is_recovery)
-                
-            except Exception as e:
-                group_key = group.get('group_key') if isinstance(group, dict) else getattr(group, 'group_key', 'unknown')
-                logger.error(f"❌ 发送告警分组失败: {group_key}, error={str(e)}")
-                import traceback
-                logger.error(f"详细错误: {traceback.format_exc()}")
-                # 不再重新抛出异常，避免中断分组工作器
+            else:
+                # firing 分组保留，等待下一次重复发送
+                await self.active_grouper.mark_group_sent(group_key, is_recovery)
+            return True
+            
+        except Exception as e:
+            group_key = group.get('group_key') if isinstance(group, dict) else getattr(group, 'group_key', 'unknown')
+            logger.error(f"❌ 发送告警分组失败: {group_key}, error={str(e)}")
+            import traceback
+            logger.error(f"详细错误: {traceback.format_exc()}")
+            # 不再重新抛出异常，避免中断分组工作器
+            return False
     
     def configure_grouper(
         self, 
@@ -438,15 +708,56 @@ class AlertManager:
         self._grouping_enabled = enabled
         logger.info(f"告警分组已{'启用' if enabled else '禁用'}")
     
-    async def get_grouping_stats(self) -> Dict[str, int]:
-        """获取告警分组统计信息"""
+    async def _publish_grouping_stats(self, stats: Dict[str, Any]):
+        """Redis 模式下把本实例的分组统计写入 Redis"""
+        self._stats_published_at = time.time()
+        if not (self._slot_leases and self._use_redis):
+            return
+        
+        try:
+            from app.db.redis_client import RedisClient
+            
+            redis_client = await RedisClient.get_client()
+            payload = json.dumps({**stats, "published_at": self._stats_published_at})
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.hset(self.WORKER_STATS_KEY, self._slot_leases.worker_id, payload)
+                pipe.expire(self.WORKER_STATS_KEY, self.WORKER_STATS_TTL)
+                await pipe.execute()
+        except Exception as e:
+            logger.debug(f"发布分组统计失败: {str(e)}")
+    
+    @classmethod
+    async def load_published_stats(cls) -> Dict[str, Any]:
+        """读取各后台任务进程发布的分组统计（忽略超过 WORKER_STATS_TTL 未更新的进程）"""
+        from app.db.redis_client import RedisClient
+        
+        redis_client = await RedisClient.get_client()
+        data = await redis_client.hgetall(cls.WORKER_STATS_KEY)
+        
+        now = time.time()
+        workers = {}
+        for worker_id, raw in data.items():
+            stats = json.loads(raw)
+            if now - stats.get("published_at", 0) < cls.WORKER_STATS_TTL:
+                workers[worker_id] = stats
+        return {"workers": workers}
+    
+    async def get_grouping_stats(self) -> Dict[str, Any]:
+        """获取告警分组统计信息（含派发器统计）"""
         try:
             if self._use_redis and self._redis_grouper:
-                return await self.active_grouper.get_group_stats()
+                stats = await self.active_grouper.get_group_stats()
             else:
-                return self.grouper.get_group_stats()
+                stats = self.grouper.get_group_stats()
         except Exception as e:
             logger.debug(f"获取分组统计失败，使用默认值: {str(e)}")
             # 回退到内存分组器
-            return self.grouper.get_group_stats()
+            stats = self.grouper.get_group_stats()
+        
+        stats = {**stats, "dispatch": self.dispatcher.get_stats(), "storm": self.storm_detector.get_stats()}
+        if self._notification_queue and self._use_redis:
+            stats["queue"] = await self._notification_queue.get_stats()
+        if self._slot_leases and self._use_redis:
+            stats["slots"] = self._slot_leases.get_stats()
+        return stats
 
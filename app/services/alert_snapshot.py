@@ -0,0 +1,85 @@
+"""告警快照
+
+分组中保存的是告警在加入分组时的快照，而不是数据库中的 AlertEvent 行：
+- 发送分组时直接使用快照构造通知，不需要逐条回查数据库
+- 恢复告警在加入分组后会被归档删除，只有快照还保留着发送所需的内容
+
+快照提供通知服务读取的全部字段，可以直接替代 AlertEvent 传给 NotificationService。
+内存分组器也用快照保存组内告警：使用 __slots__，标签键值和常见枚举字段做字符串驻留，
+大量告警共享相同的标签字符串。
+"""
+import sys
+from typing import Any, Dict, Optional
+
+
+def _intern(value: Any) -> Any:
+    """字符串驻留（非字符串原样返回）"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def intern_labels(labels: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """驻留标签的键和值，相同标签在所有告警间共享同一个字符串对象"""
+    if not labels:
+        return {}
+    return {_intern(key): _intern(value) for key, value in labels.items()}
+
+
+class AlertSnapshot:
+    """告警快照（与 AlertEvent 字段同名，只读用途）"""
+    
+    __slots__ = (
+        'fingerprint', 'rule_id', 'rule_name', 'status', 'severity', 'value',
+        'labels', 'annotations', 'started_at', 'last_eval_at', 'last_sent_at',
+        'expr', 'tenant_id',
+    )
+    
+    def __init__(
+        self,
+        fingerprint: str,
+        rule_id: Optional[int] = None,
+        rule_name: str = "",
+        status: str = "firing",
+        severity: str = "warning",
+        value: Optional[float] = None,
+        labels: Optional[Dict[str, str]] = None,
+        annotations: Optional[Dict[str, str]] = None,
+        started_at: Optional[int] = None,
+        last_eval_at: Optional[int] = None,
+        last_sent_at: Optional[int] = None,
+        expr: str = "",
+        tenant_id: Optional[int] = None
+    ):
+        self.fingerprint = fingerprint
+        self.rule_id = rule_id
+        self.rule_name = _intern(rule_name)
+        self.status = _intern(status)
+        self.severity = _intern(severity)
+        self.value = value
+        self.labels = intern_labels(labels)
+        self.annotations = annotations or {}
+        self.started_at = started_at
+        self.last_eval_at = last_eval_at
+        self.last_sent_at = last_sent_at
+        self.expr = _intern(expr)
+        self.tenant_id = tenant_id
+    
+    @classmethod
+    def from_alert(cls, alert) -> "AlertSnapshot":
+        """从 AlertEvent（或另一个快照）生成快照"""
+        return cls(**{field: getattr(alert, field, None) for field in cls.__slots__})
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], **defaults) -> "AlertSnapshot":
+        """从分组中保存的字典生成快照
+        
+        旧版本快照缺少 rule_id / status 等字段，由 defaults 补齐。
+        """
+        values = {**defaults, **{k: v for k, v in data.items() if k in cls.__slots__ and v is not None}}
+        return cls(**values)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可 JSON 序列化的字典"""
+        return {field: getattr(self, field) for field in self.__slots__}
+    
+    def __repr__(self):
+        return f"<AlertSnapshot(fingerprint='{self.fingerprint}', status='{self.status}')>"
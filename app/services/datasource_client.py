@@ -0,0 +1,279 @@
+"""数据源查询客户端
+
+封装 Prometheus / VictoriaMetrics HTTP API（instant query 与 range query），
+供规则评估器和规则测试接口共用。
+
+- 进程内共享 httpx 连接池，避免每次查询重新建连
+- 所有查询带硬超时，慢查询不会无限占用事件循环上的协程
+- 相同查询合并执行（single-flight），结果短时缓存
+"""
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+from loguru import logger
+
+from app.models.datasource import DataSource
+
+
+class DatasourceQueryError(Exception):
+    """数据源查询异常
+    
+    Attributes:
+        message: 错误消息
+        error_type: 错误类型（syntax/connection/execution）
+    """
+    
+    def __init__(self, message: str, error_type: str = "execution"):
+        self.message = message
+        self.error_type = error_type
+        super().__init__(message)
+
+
+class DatasourceClient:
+    """数据源查询客户端
+    
+    Attributes:
+        _clients: 按 verify_ssl 区分的共享连接池
+        _inflight: 正在执行的查询任务（用于合并相同查询）
+        _result_cache: 短 TTL 的查询结果缓存 {key: (expire_at, result)}
+    """
+    
+    # 连接池配置
+    MAX_CONNECTIONS = 100
+    MAX_KEEPALIVE_CONNECTIONS = 20
+    
+    # 结果缓存
+    CACHE_PREFIX = "datasource:query"
+    RESULT_CACHE_TTL = 2  # 秒
+    
+    _clients: Dict[bool, httpx.AsyncClient] = {}
+    _inflight: Dict[str, asyncio.Task] = {}
+    _result_cache: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+    
+    @classmethod
+    def get_http_client(cls, verify_ssl: bool = True) -> httpx.AsyncClient:
+        """获取共享的 httpx 客户端（连接池）"""
+        client = cls._clients.get(verify_ssl)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                verify=verify_ssl,
+                limits=httpx.Limits(
+                    max_connections=cls.MAX_CONNECTIONS,
+                    max_keepalive_connections=cls.MAX_KEEPALIVE_CONNECTIONS
+                )
+            )
+            cls._clients[verify_ssl] = client
+        return client
+    
+    @classmethod
+    async def close(cls):
+        """关闭所有共享连接池"""
+        for client in cls._clients.values():
+            await client.aclose()
+        cls._clients.clear()
+        cls._result_cache.clear()
+    
+    @staticmethod
+    def build_auth(datasource: DataSource) -> Tuple[Dict[str, str], Optional[Tuple[str, str]]]:
+        """构建请求头和认证信息
+        
+        Returns:
+            (headers, auth)
+        """
+        headers = dict((datasource.http_config or {}).get('headers', {}) or {})
+        auth = None
+        
+        auth_config = datasource.auth_config or {}
+        auth_type = auth_config.get('type')
+        if auth_type == 'token':
+            token = auth_config.get('token', '')
+            if token and not token.startswith('Bearer '):
+                headers['Authorization'] = f'Bearer {token}'
+            else:
+                headers['Authorization'] = token
+        elif auth_type == 'basic':
+            auth = (
+                auth_config.get('username', ''),
+                auth_config.get('password', '')
+            )
+        
+        return headers, auth
+    
+    @staticmethod
+    def build_api_url(datasource: DataSource, endpoint: str) -> str:
+        """构建 API 地址，兼容 base_url 是否已带 /api/v1"""
+        base_url = datasource.url.rstrip('/')
+        if base_url.endswith('/api/v1'):
+            return f"{base_url}/{endpoint}"
+        return f"{base_url}/api/v1/{endpoint}"
+    
+    @staticmethod
+    def classify_error(message: str) -> str:
+        """根据错误信息判断错误类型"""
+        lowered = message.lower()
+        if 'parse error' in lowered or 'syntax' in lowered:
+            return 'syntax'
+        if 'connection' in lowered or 'timeout' in lowered or 'timed out' in lowered:
+            return 'connection'
+        return 'execution'
+    
+    async def _request(
+        self,
+        datasource: DataSource,
+        endpoint: str,
+        params: Dict[str, Any],
+        timeout: Optional[float] = None,
+        meta: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """发送查询请求并返回 data.result
+        
+        Args:
+            meta: 传入字典时写入响应信息（response_bytes），供评估统计使用
+        """
+        headers, auth = self.build_auth(datasource)
+        url = self.build_api_url(datasource, endpoint)
+        http_config = datasource.http_config or {}
+        verify_ssl = http_config.get('verify_ssl', True)
+        if timeout is None:
+            timeout = http_config.get('timeout', 30)
+        
+        logger.info(f"查询数据源: url={url}, query={params.get('query')}")
+        
+        client = self.get_http_client(verify_ssl)
+        try:
+            # 硬超时：httpx 的 timeout 只约束单次读写，这里约束整个请求
+            response = await asyncio.wait_for(
+                client.get(url, params=params, headers=headers, auth=auth, timeout=timeout),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            raise DatasourceQueryError(f"query timeout after {timeout}s", 'connection')
+        except httpx.TimeoutException as e:
+            raise DatasourceQueryError(f"query timeout: {str(e) or 'timed out'}", 'connection')
+        except httpx.HTTPError as e:
+            raise DatasourceQueryError(f"connection error: {str(e)}", 'connection')
+        
+        if meta is not None:
+            meta['response_bytes'] = len(response.content)
+        
+        try:
+            result = response.json()
+        except ValueError:
+            raise DatasourceQueryError(
+                f"invalid response: status={response.status_code}, text={response.text[:200]}"
+            )
+        
+        if response.status_code != 200 or result.get('status') != 'success':
+            error_msg = result.get('error') or f"status={response.status_code}"
+            error_type = 'syntax' if result.get('errorType') == 'bad_data' else self.classify_error(error_msg)
+            raise DatasourceQueryError(error_msg, error_type)
+        
+        return result.get('data', {}).get('result', [])
+    
+    async def query(
+        self,
+        datasource: DataSource,
+        query: str,
+        timeout: Optional[float] = None,
+        meta: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Instant query（/api/v1/query）"""
+        return await self._request(datasource, 'query', {"query": query}, timeout, meta)
+    
+    async def query_range(
+        self,
+        datasource: DataSource,
+        query: str,
+        start: int,
+        end: int,
+        step: int,
+        timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """Range query（/api/v1/query_range）"""
+        params = {"query": query, "start": start, "end": end, "step": step}
+        return await self._request(datasource, 'query_range', params, timeout)
+    
+    @classmethod
+    def _make_cache_key(cls, datasource: DataSource, endpoint: str, params: Dict[str, Any]) -> str:
+        """生成查询缓存键（数据源 + 接口 + 参数）"""
+        raw = json.dumps({"ds": datasource.id, "ep": endpoint, "params": params}, sort_keys=True)
+        return f"{cls.CACHE_PREFIX}:{hashlib.md5(raw.encode()).hexdigest()}"
+    
+    async def _cached_request(
+        self,
+        datasource: DataSource,
+        endpoint: str,
+        params: Dict[str, Any],
+        timeout: Optional[float],
+        ttl: int
+    ) -> List[Dict[str, Any]]:
+        """带合并执行和短 TTL 缓存的查询
+        
+        1. 进程内结果缓存命中直接返回
+        2. 相同查询正在执行时等待同一个任务
+        3. 否则查询 Redis 缓存，未命中再请求数据源，并写回两级缓存
+        """
+        from app.services.cache_service import CacheService
+        
+        cls = type(self)
+        cache_key = self._make_cache_key(datasource, endpoint, params)
+        
+        cached = cls._result_cache.get(cache_key)
+        if cached and cached[0] > time.time():
+            return cached[1]
+        
+        task = cls._inflight.get(cache_key)
+        if task is None:
+            async def run() -> List[Dict[str, Any]]:
+                try:
+                    result = await CacheService.get(cache_key)
+                    if result is None:
+                        result = await self._request(datasource, endpoint, params, timeout)
+                        await CacheService.set(cache_key, result, ttl)
+                    cls._result_cache[cache_key] = (time.time() + ttl, result)
+                    return result
+                finally:
+                    cls._inflight.pop(cache_key, None)
+                    # 顺带清理过期的进程内缓存
+                    now = time.time()
+                    for key in [k for k, (expire_at, _) in cls._result_cache.items() if expire_at <= now]:
+                        cls._result_cache.pop(key, None)
+            
+            task = asyncio.ensure_future(run())
+            cls._inflight[cache_key] = task
+        else:
+            logger.debug(f"合并相同查询: {params.get('query')}")
+        
+        # shield：单个请求方取消（如客户端断开）不影响其他等待者
+        return await asyncio.shield(task)
+    
+    async def query_cached(
+        self,
+        datasource: DataSource,
+        query: str,
+        timeout: Optional[float] = None,
+        ttl: int = RESULT_CACHE_TTL,
+        eval_time: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Instant query（合并相同查询 + 短 TTL 缓存），eval_time 为查询时间点（默认当前时间）"""
+        params = {"query": query}
+        if eval_time is not None:
+            params["time"] = eval_time
+        return await self._cached_request(datasource, 'query', params, timeout, ttl)
+    
+    async def query_range_cached(
+        self,
+        datasource: DataSource,
+        query: str,
+        start: int,
+        end: int,
+        step: int,
+        timeout: Optional[float] = None,
+        ttl: int = RESULT_CACHE_TTL
+    ) -> List[Dict[str, Any]]:
+        """Range query（合并相同查询 + 短 TTL 缓存）"""
+        params = {"query": query, "start": start, "end": end, "step": step}
+        return await self._cached_request(datasource, 'query_range', params, timeout, ttl)
@@ -0,0 +1,80 @@
+"""时序数据降采样
+
+实现 Largest-Triangle-Three-Buckets (LTTB) 算法，用于规则测试 / 回测接口
+返回的 range 序列，按客户端给定的点数预算压缩数据，保留曲线形状（峰谷）。
+"""
+from typing import Any, List, Sequence
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """计算 LTTB 保留的采样点下标
+    
+    首尾两点固定保留，中间 n-2 个点均分为 threshold-2 个桶，每个桶选出与
+    「上一个已选点」和「下一个桶均值点」构成三角形面积最大的点。
+    桶均值一次性用 reduceat 计算，桶内面积在数组上整体计算。
+    
+    Args:
+        x: 时间戳数组（升序）
+        y: 值数组
+        threshold: 目标点数
+    
+    Returns:
+        np.ndarray: 保留点的下标（升序）
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    
+    num_buckets = threshold - 2
+    # 中间点 [1, n-1) 的桶边界，桶大小 >= 1
+    edges = np.floor(np.linspace(1, n - 1, num_buckets + 1)).astype(np.int64)
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    avg_y = np.add.reduceat(y[:n - 1], edges[:-1]) / counts
+    
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    
+    prev = 0
+    for bucket in range(num_buckets):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        if bucket + 1 < num_buckets:
+            next_x, next_y = avg_x[bucket + 1], avg_y[bucket + 1]
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        
+        prev_x, prev_y = x[prev], y[prev]
+        areas = np.abs(
+            (prev_x - next_x) * (y[lo:hi] - prev_y)
+            - (prev_x - x[lo:hi]) * (next_y - prev_y)
+        )
+        prev = lo + int(np.argmax(areas))
+        selected[bucket + 1] = prev
+    
+    return selected
+
+
+def downsample_values(values: Sequence[Sequence[Any]], max_points: int) -> List[List[Any]]:
+    """对 Prometheus range 结果中的 values 做 LTTB 降采样
+    
+    非数值样本（NaN/Inf）会被丢弃，保留的样本保持原始格式 [时间戳, "值"]。
+    
+    Args:
+        values: [[timestamp, "value"], ...]
+        max_points: 每个序列最多保留的点数
+    
+    Returns:
+        List: 降采样后的 values
+    """
+    if not values:
+        return []
+    
+    samples = np.asarray(values, dtype=np.float64).reshape(-1, 2)
+    finite = np.flatnonzero(np.isfinite(samples[:, 1]))
+    if len(finite) <= max_points:
+        return [list(values[i]) for i in finite.tolist()]
+    
+    keep = lttb_indices(samples[finite, 0], samples[finite, 1], max_points)
+    return [list(values[i]) for i in finite[keep].tolist()]
@@ -0,0 +1,315 @@
+"""规则评估统计
+
+评估器为每条规则维护一个定长环形缓冲区，记录最近 N 次评估的查询耗时、
+响应字节数、序列数、状态转换数和错误。汇总结果定期写入 Redis，
+API 进程（可能与评估进程分离）据此提供单规则统计和租户内「最耗资源规则」排行。
+"""
+import json
+import time
+from array import array
+from typing import Any, Dict, List, Optional
+from loguru import logger
+
+
+class RuleEvalStats:
+    """单条规则的评估统计（定长环形缓冲区）
+    
+    各指标使用 array 紧凑存储，每条规则固定占用约 capacity × 27 字节。
+    """
+    
+    __slots__ = (
+        'rule_id', 'tenant_id', 'project_id', 'rule_name', 'capacity',
+        '_timestamps', '_latency_ms', '_response_bytes', '_series', '_transitions', '_errors',
+        '_pos', '_count', 'total_evals', 'total_errors', 'last_error',
+    )
+    
+    def __init__(self, rule_id: int, tenant_id: int, project_id: Optional[int], rule_name: str, capacity: int = 60):
+        self.rule_id = rule_id
+        self.tenant_id = tenant_id
+        self.project_id = project_id
+        self.rule_name = rule_name
+        self.capacity = capacity
+        self._timestamps = array('d', bytes(8 * capacity))
+        self._latency_ms = array('f', bytes(4 * capacity))
+        self._response_bytes = array('I', bytes(4 * capacity))
+        self._series = array('I', bytes(4 * capacity))
+        self._transitions = array('H', bytes(2 * capacity))
+        self._errors = array('B', bytes(capacity))
+        self._pos = 0
+        self._count = 0
+        self.total_evals = 0
+        self.total_errors = 0
+        self.last_error: Optional[str] = None
+    
+    def record(
+        self,
+        latency: float,
+        response_bytes: int,
+        series_count: int,
+        transitions: int,
+        error: Optional[str] = None
+    ):
+        """记录一次评估"""
+        pos = self._pos
+        self._timestamps[pos] = time.time()
+        self._latency_ms[pos] = latency * 1000
+        self._response_bytes[pos] = min(int(response_bytes), 0xFFFFFFFF)
+        self._series[pos] = min(int(series_count), 0xFFFFFFFF)
+        self._transitions[pos] = min(int(transitions), 0xFFFF)
+        self._errors[pos] = 1 if error else 0
+        
+        self._pos = (pos + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+        self.total_evals += 1
+        if error:
+            self.total_errors += 1
+            self.last_error = error
+    
+    def _ordered(self, values: array) -> List[Any]:
+        """按时间顺序返回缓冲区中的有效数据"""
+        if self._count < self.capacity:
+            return list(values[:self._count])
+        return list(values[self._pos:]) + list(values[:self._pos])
+    
+    def summary(self) -> Dict[str, Any]:
+        """汇总统计"""
+        count = self._count
+        latencies = sorted(self._ordered(self._latency_ms))
+        timestamps = self._ordered(self._timestamps)
+        response_bytes = self._ordered(self._response_bytes)
+        series = self._ordered(self._series)
+        errors = sum(self._ordered(self._errors))
+        
+        avg_latency = sum(latencies) / count if count else 0.0
+        span = timestamps[-1] - timestamps[0] if count > 1 else 0
+        evals_per_minute = (count - 1) / span * 60 if span > 0 else 0.0
+        
+        return {
+            "rule_id": self.rule_id,
+            "rule_name": self.rule_name,
+            "tenant_id": self.tenant_id,
+            "project_id": self.project_id,
+            "window": count,
+            "total_evals": self.total_evals,
+            "total_errors": self.total_errors,
+            "last_eval_at": int(timestamps[-1]) if count else None,
+            "last_error": self.last_error,
+            "latency_ms": {
+                "avg": round(avg_latency, 2),
+                "p50": round(latencies[count // 2], 2) if count else 0.0,
+                "p95": round(latencies[min(int(count * 0.95), count - 1)], 2) if count else 0.0,
+                "max": round(latencies[-1], 2) if count else 0.0,
+            },
+            "response_bytes": {
+                "avg": int(sum(response_bytes) / count) if count else 0,
+                "max": max(response_bytes, default=0),
+            },
+            "series": {
+                "avg": round(sum(series) / count, 2) if count else 0.0,
+                "max": max(series, default=0),
+            },
+            "transitions": sum(self._ordered(self._transitions)),
+            "errors": errors,
+            "error_rate": round(errors / count, 4) if count else 0.0,
+            "evals_per_minute": round(evals_per_minute, 3),
+            # 每分钟占用数据源的查询时间，用于「最耗资源」排序
+            "load_ms_per_minute": round(avg_latency * evals_per_minute, 2),
+        }
+    
+    def recent(self) -> List[Dict[str, Any]]:
+        """最近 N 次评估明细（按时间顺序）"""
+        return [
+            {
+                "timestamp": int(ts),
+                "latency_ms": round(latency, 2),
+                "response_bytes": nbytes,
+                "series": series,
+                "transitions": transitions,
+                "error": bool(error),
+            }
+            for ts, latency, nbytes, series, transitions, error in zip(
+                self._ordered(self._timestamps),
+                self._ordered(self._latency_ms),
+                self._ordered(self._response_bytes),
+                self._ordered(self._series),
+                self._ordered(self._transitions),
+                self._ordered(self._errors),
+            )
+        ]
+
+
+class EvalStatsRegistry:
+    """规则评估统计注册表（进程内）
+    
+    Attributes:
+        stats: rule_id -> RuleEvalStats
+        _dirty: 自上次写入 Redis 后有更新的规则 ID
+        _removed: 待从 Redis 删除的规则 ID（租户 ID -> 规则 ID 集合）
+        _active_ids: 最近一次 prune 时的启用规则 ID，用于清理 Redis 中的残留汇总
+    """
+    
+    REDIS_KEY_PREFIX = "alert:eval_stats:tenant"
+    REDIS_TTL = 86400
+    # 按启用规则清理 Redis 汇总的间隔（秒）：清理评估进程停机期间删除的规则、已退出进程写入的规则
+    SWEEP_INTERVAL = 300
+    SORT_KEYS = {
+        "load": lambda s: s["load_ms_per_minute"],
+        "latency": lambda s: s["latency_ms"]["avg"],
+        "bytes": lambda s: s["response_bytes"]["avg"],
+        "series": lambda s: s["series"]["avg"],
+        "errors": lambda s: s["errors"],
+    }
+    
+    def __init__(self, capacity: int = 60):
+        self.capacity = capacity
+        self.stats: Dict[int, RuleEvalStats] = {}
+        self._dirty: set = set()
+        self._removed: Dict[int, set] = {}
+        self._active_ids: Optional[set] = None
+        self._swept_at = 0.0
+    
+    def record(
+        self,
+        rule,
+        latency: float,
+        response_bytes: int,
+        series_count: int,
+        transitions: int,
+        error: Optional[str] = None
+    ):
+        """记录规则的一次评估"""
+        entry = self.stats.get(rule.id)
+        if entry is None:
+            entry = RuleEvalStats(rule.id, rule.tenant_id, rule.project_id, rule.name, self.capacity)
+            self.stats[rule.id] = entry
+        entry.rule_name = rule.name
+        entry.record(latency, response_bytes, series_count, transitions, error)
+        self._dirty.add(rule.id)
+        self._removed.get(rule.tenant_id, set()).discard(rule.id)
+    
+    def prune(self, active_rule_ids: set):
+        """移除已删除或禁用规则的统计（Redis 中的汇总在下次写入时删除）"""
+        for rule_id in list(self.stats):
+            if rule_id not in active_rule_ids:
+                entry = self.stats.pop(rule_id)
+                self._dirty.discard(rule_id)
+                self._removed.setdefault(entry.tenant_id, set()).add(rule_id)
+        self._active_ids = set(active_rule_ids)
+    
+    async def flush_to_redis(self):
+        """把有更新的规则汇总写入 Redis，并删除已移除规则的汇总（每个租户一个 hash，一次 pipeline）"""
+        from app.db.redis_client import RedisClient
+        
+        if self._active_ids is not None and time.time() - self._swept_at >= self.SWEEP_INTERVAL:
+            self._swept_at = time.time()
+            try:
+                await self._sweep_redis(await RedisClient.get_client(), self._active_ids)
+            except Exception as e:
+                logger.debug(f"清理评估统计失败: {str(e)}")
+        
+        if not self._dirty and not self._removed:
+            return
+        
+        dirty, self._dirty = self._dirty, set()
+        removed, self._removed = self._removed, {}
+        try:
+            redis_client = await RedisClient.get_client()
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for tenant_id, rule_ids in removed.items():
+                    if rule_ids:
+                        pipe.hdel(f"{self.REDIS_KEY_PREFIX}:{tenant_id}", *map(str, rule_ids))
+                tenants = set()
+                for rule_id in dirty:
+                    entry = self.stats.get(rule_id)
+                    if entry is None:
+                        continue
+                    key = f"{self.REDIS_KEY_PREFIX}:{entry.tenant_id}"
+                    pipe.hset(key, str(rule_id), json.dumps(entry.summary()))
+                    tenants.add(key)
+                for key in tenants:
+                    pipe.expire(key, self.REDIS_TTL)
+                await pipe.execute()
+        except Exception as e:
+            # 写入失败的更新和删除留到下次重试（期间产生的新记录已在新集合中）
+            self._dirty |= {rule_id for rule_id in dirty if rule_id in self.stats}
+            for tenant_id, rule_ids in removed.items():
+                self._removed.setdefault(tenant_id, set()).update(
+                    rule_id for rule_id in rule_ids if rule_id not in self.stats
+                )
+            logger.debug(f"写入评估统计失败: {str(e)}")
+    
+    async def _sweep_redis(self, redis_client, active_ids: set):
+        """删除 Redis 中规则已不在启用集合内的汇总（本进程未评估过、prune 无法覆盖的规则）"""
+        keys = [key async for key in redis_client.scan_iter(match=f"{self.REDIS_KEY_PREFIX}:*", count=100)]
+        if not keys:
+            return
+        
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hkeys(key)
+            fields = await pipe.execute()
+        
+        stale = {
+            key: [rule_id for rule_id in rule_ids if int(rule_id) not in active_ids]
+            for key, rule_ids in zip(keys, fields)
+        }
+        stale = {key: rule_ids for key, rule_ids in stale.items() if rule_ids}
+        if not stale:
+            return
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for key, rule_ids in stale.items():
+                pipe.hdel(key, *rule_ids)
+            await pipe.execute()
+        logger.debug(f"已清理评估统计残留: {sum(len(rule_ids) for rule_ids in stale.values())} 条")
+    
+    async def get_tenant_summaries(self, tenant_id: int) -> Dict[int, Dict[str, Any]]:
+        """获取租户下所有规则的汇总（Redis 数据 + 本进程最新数据）
+        
+        超过 REDIS_TTL 未再评估的汇总视为残留（规则已删除或禁用、尚未被清理），不返回。
+        """
+        from app.db.redis_client import RedisClient
+        
+        summaries: Dict[int, Dict[str, Any]] = {}
+        stale_before = time.time() - self.REDIS_TTL
+        try:
+            redis_client = await RedisClient.get_client()
+            data = await redis_client.hgetall(f"{self.REDIS_KEY_PREFIX}:{tenant_id}")
+            for rule_id, raw in data.items():
+                summary = json.loads(raw)
+                if (summary.get("last_eval_at") or 0) < stale_before:
+                    continue
+                summaries[int(rule_id)] = summary
+        except Exception as e:
+            logger.debug(f"读取评估统计失败: {str(e)}")
+        
+        for rule_id, entry in self.stats.items():
+            if entry.tenant_id == tenant_id:
+                summaries[rule_id] = entry.summary()
+        return summaries
+    
+    async def get_rule_stats(self, tenant_id: int, rule_id: int) -> Optional[Dict[str, Any]]:
+        """获取单条规则的统计（本进程有数据时附带最近评估明细）"""
+        entry = self.stats.get(rule_id)
+        if entry is not None and entry.tenant_id == tenant_id:
+            return {**entry.summary(), "recent": entry.recent()}
+        
+        summaries = await self.get_tenant_summaries(tenant_id)
+        return summaries.get(rule_id)
+    
+    async def top(
+        self,
+        tenant_id: int,
+        limit: int = 10,
+        sort_by: str = "load",
+        project_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """租户内最耗资源的规则"""
+        summaries = list((await self.get_tenant_summaries(tenant_id)).values())
+        if project_id is not None:
+            summaries = [s for s in summaries if s.get("project_id") == project_id]
+        key = self.SORT_KEYS.get(sort_by, self.SORT_KEYS["load"])
+        return sorted(summaries, key=key, reverse=True)[:limit]
+
+
+# 全局评估统计注册表
+eval_stats_registry = EvalStatsRegistry()
@@ -2,7 +2,6 @@
 import time
 import hashlib
 import asyncio
-import httpx
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from loguru import logger
@@ -11,74 +10,45 @@ from sqlalchemy import select
 from app.models.alert import AlertRule, AlertEvent, AlertEventHistory
 from app.models.datasource import DataSource
 from app.services.alert_manager import AlertManager
+from app.services.datasource_client import DatasourceClient, DatasourceQueryError
+from app.services.eval_stats import eval_stats_registry
+from app.services.flap_detector import FlapState, flap_detector
+from app.services.silence_engine import silence_engine
 
 
 class RuleEvaluator:
-    """规则评估器"""
+    """规则评估器
+    
+    Attributes:
+        last_query: 最近一次查询的统计（latency / response_bytes / series / error），供评估统计使用
+    """
     
     def __init__(self, db: AsyncSession, alert_manager: AlertManager):
         self.db = db
         self.alert_manager = alert_manager
+        self.datasource_client = DatasourceClient()
+        self.last_query: Dict[str, Any] = {}
     
     async def query_datasource(self, datasource: DataSource, query: str) -> List[Dict[str, Any]]:
         """查询数据源"""
+        meta: Dict[str, Any] = {}
+        self.last_query = {"latency": 0.0, "response_bytes": 0, "series": 0, "error": None}
+        start = time.perf_counter()
         try:
-            # 构建请求头
-            headers = {}
-            auth = None
-            
-            if datasource.auth_config:
-                auth_type = datasource.auth_config.get('type')
-                if auth_type == 'token':
-                    token = datasource.auth_config.get('token', '')
-                    if token and not token.startswith('Bearer '):
-                        headers['Authorization'] = f'Bearer {token}'
-                    else:
-                        headers['Authorization'] = token
-                elif auth_type == 'basic':
-                    auth = (
-                        datasource.auth_config.get('username', ''),
-                        datasource.auth_config.get('password', '')
-                    )
-            
-            # 构建查询 URL
-            base_url = datasource.url.rstrip('/')
-            
-            # 统一添加 /api/v1/query 路径
-            if base_url.endswith('/api/v1'):
-                query_url = f"{base_url}/query"
-            else:
-                query_url = f"{base_url}/api/v1/query"
-            
-            logger.info(f"查询数据源: url={query_url}, query={query}")
-            
-            # 发送查询
-            verify_ssl = datasource.http_config.get('verify_ssl', True)
-            timeout = datasource.http_config.get('timeout', 30)
-            
-            async with httpx.AsyncClient(verify=verify_ssl, timeout=timeout) as client:
-                response = await client.get(
-                    query_url,
-                    params={"query": query},
-                    headers=headers,
-                    auth=auth
-                )
-            
-            if response.status_code != 200:
-                logger.error(f"数据源查询失败: status={response.status_code}, text={response.text}")
-                return []
-            
-            result = response.json()
-            
-            if result.get('status') == 'success':
-                return result.get('data', {}).get('result', [])
-            else:
-                logger.error(f"查询失败: {result.get('error', '未知错误')}")
-                return []
-                
+            result = await self.datasource_client.query(datasource, query, meta=meta)
+            self.last_query["series"] = len(result)
+            return result
+        except DatasourceQueryError as e:
+            logger.error(f"查询失败: {e.message}")
+            self.last_query["error"] = f"{e.error_type}: {e.message}"
+            return []
         except Exception as e:
             logger.error(f"查询异常: {str(e)}")
+            self.last_query["error"] = str(e)
             return []
+        finally:
+            self.last_query["latency"] = time.perf_counter() - start
+            self.last_query["response_bytes"] = meta.get('response_bytes', 0)
     
     async def evaluate_rule(self, rule: AlertRule) -> List[Dict[str, Any]]:
         """评估单个规则"""
@@ -93,6 +63,7 @@ class RuleEvaluator:
             
             if not datasource:
                 logger.warning(f"数据源不可用: rule_id={rule.id}")
+                self.last_query = {"error": "datasource unavailable"}
                 return []
             
             # 查询数据
@@ -144,6 +115,7 @@ class RuleEvaluator:
             
         except Exception as e:
             logger.error(f"规则评估失败: rule_id={rule.id}, error={str(e)}")
+            self.last_query["error"] = str(e)
             return []
     
     @staticmethod
@@ -174,9 +146,20 @@ class RuleEvaluator:
         
         return rendered
     
-    async def process_alert_events(self, rule: AlertRule, alert_data_list: List[Dict[str, Any]]):
-        """处理告警事件（状态管理）"""
+    @staticmethod
+    def _apply_flap_state(alert: AlertEvent, flap_state: Optional[FlapState]):
+        """把抖动状态写入告警（无历史时视为未抖动）"""
+        alert.is_flapping = bool(flap_state and flap_state.flapping)
+        alert.flap_rate = round(flap_state.rate, 3) if flap_state else 0.0
+    
+    async def process_alert_events(self, rule: AlertRule, alert_data_list: List[Dict[str, Any]]) -> int:
+        """处理告警事件（状态管理）
+        
+        Returns:
+            int: 本次评估发生的状态转换数（新增 pending、pending → firing、恢复、重新激活）
+        """
         current_time = int(time.time())
+        transitions = 0
         
         # 获取当前该规则的所有告警（包括所有状态）
         stmt = select(AlertEvent).where(AlertEvent.rule_id == rule.id)
@@ -186,6 +169,19 @@ class RuleEvaluator:
         # 当前触发的告警指纹
         current_fingerprints = {alert['fingerprint'] for alert in alert_data_list}
         
+        # 记录本次评估结果，计算各告警的抖动状态
+        flap_states = await flap_detector.record(
+            rule.id,
+            current_fingerprints,
+            [fp for fp, alert in all_alerts.items() if alert.status in ['pending', 'firing']]
+        )
+        
+        # 静默状态：这里只标记新匹配到静默的告警；解除静默（及随后的通知）统一由静默调度器处理
+        silence_snapshot = await silence_engine.get_snapshot(rule.tenant_id)
+        
+        # 本轮从 pending 转为 firing 的告警，循环结束后批量交给告警管理器
+        newly_firing: List[AlertEvent] = []
+        
         # 处理新告警和更新
         for alert_data in alert_data_list:
             fingerprint = alert_data['fingerprint']
@@ -195,24 +191,35 @@ class RuleEvaluator:
                 existing_alert = all_alerts[fingerprint]
                 existing_alert.last_eval_at = current_time
                 existing_alert.value = alert_data['value']
+                self._apply_flap_state(existing_alert, flap_states.get(fingerprint))
+                if not existing_alert.is_silenced and silence_snapshot.match(alert_data['labels'] or {}):
+                    existing_alert.is_silenced = True
                 
                 # 如果告警之前已经 resolved，重新激活
                 if existing_alert.status == 'resolved':
                     existing_alert.status = 'pending'
                     existing_alert.started_at = current_time
+                    transitions += 1
                 
                 # 检查是否应该从 pending 转为 firing
                 if existing_alert.status == 'pending':
                     duration = current_time - existing_alert.started_at
                     if duration >= rule.for_duration:
                         existing_alert.status = 'firing'
-                        # 发送告警通知
-                        await self.alert_manager.send_alert(existing_alert, rule)
+                        transitions += 1
+                        newly_firing.append(existing_alert)
                 
             else:
                 # 创建新告警
                 new_alert = AlertEvent(**alert_data)
+                self._apply_flap_state(new_alert, flap_states.get(fingerprint))
+                new_alert.is_silenced = silence_snapshot.match(alert_data['labels'] or {}) is not None
                 self.db.add(new_alert)
+                transitions += 1
+        
+        # 批量发送告警通知
+        if newly_firing:
+            await self.alert_manager.send_alerts_batch(newly_firing, rule)
         
         # 处理已恢复的告警（只处理之前是 pending 或 firing 的）
         active_alerts = {fp: alert for fp, alert in all_alerts.items() 
@@ -224,8 +231,17 @@ class RuleEvaluator:
         
         for fingerprint in resolved_fingerprints:
             alert = active_alerts[fingerprint]
+            flap_state = flap_states.get(fingerprint)
+            self._apply_flap_state(alert, flap_state)
+            
+            # 抖动中的 firing 告警保持触发，不恢复、不发送恢复通知
+            if alert.status == 'firing' and flap_state and flap_state.flapping:
+                alert.last_eval_at = current_time
+                continue
+            
             alert.status = 'resolved'
             alert.last_eval_at = current_time
+            transitions += 1
             
             # 发送恢复通知
             await self.alert_manager.send_recovery(alert, rule)
@@ -268,13 +284,30 @@ class RuleEvaluator:
         # 提交归档操作
         if alerts_to_archive:
             await self.db.commit()
+        
+        return transitions
 
 
 class AlertEvaluationScheduler:
-    """告警评估调度器"""
+    """告警评估调度器
+    
+    按规则自身的 eval_interval 调度，并结合规则的查询成本（cost_score / cost_detail）：
+    - 准入：每个调度周期有成本预算，超出预算的规则顺延到下个周期（越迟越优先）
+    - 节流：medium / heavy 规则的实际评估间隔不低于对应下限，heavy 规则并发受限
+    - 错峰：medium / heavy 规则首次调度按 id 散列到评估间隔内的不同偏移
+    """
+    
+    TICK_INTERVAL = 5  # 调度周期（秒）
+    MIN_EVAL_INTERVAL = 15  # 最小评估间隔（秒）
+    LEVEL_MIN_INTERVAL = {"light": 15, "medium": 60, "heavy": 300}  # 各成本等级的最小评估间隔（秒）
+    TICK_COST_BUDGET = 2e7  # 每个调度周期准入的样本预算（samples_per_eval 之和）
+    MAX_CONCURRENT_HEAVY = 2  # heavy 规则最大并发评估数
     
     def __init__(self):
         self.running = False
+        self._next_eval_at: Dict[int, float] = {}  # rule_id -> 下次评估时间
+        self._inflight: Dict[int, asyncio.Task] = {}  # rule_id -> 正在执行的评估任务
+        self._heavy_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_HEAVY)
     
     async def start(self):
         """启动调度器"""
@@ -283,20 +316,46 @@ class AlertEvaluationScheduler:
         
         while self.running:
             try:
-                await self.evaluate_all_rules()
+                await self.evaluate_due_rules()
+                # 上个周期完成的评估统计写入 Redis，供 API 查询
+                await eval_stats_registry.flush_to_redis()
             except Exception as e:
                 logger.error(f"评估周期出错: {str(e)}")
             
-            # 等待下一个评估周期
-            await asyncio.sleep(15)  # 默认15秒
+            # 等待下一个调度周期
+            await asyncio.sleep(self.TICK_INTERVAL)
     
     async def stop(self):
         """停止调度器"""
         self.running = False
+        for task in self._inflight.values():
+            task.cancel()
         logger.info("告警评估调度器已停止")
     
-    async def evaluate_all_rules(self):
-        """评估所有启用的规则"""
+    @staticmethod
+    def get_cost_level(rule: AlertRule) -> str:
+        """获取规则成本等级（未分析过的规则视为 light）"""
+        return (rule.cost_detail or {}).get('level', 'light')
+    
+    @staticmethod
+    def get_eval_cost(rule: AlertRule) -> float:
+        """获取规则单次评估的估算样本数"""
+        return float((rule.cost_detail or {}).get('samples_per_eval', 0) or 0)
+    
+    def get_effective_interval(self, rule: AlertRule) -> int:
+        """计算规则实际评估间隔（规则配置与成本等级下限取大）"""
+        level_min = self.LEVEL_MIN_INTERVAL.get(self.get_cost_level(rule), self.MIN_EVAL_INTERVAL)
+        return max(rule.eval_interval or 0, self.MIN_EVAL_INTERVAL, level_min)
+    
+    def _initial_eval_at(self, rule: AlertRule, interval: int, now: float) -> float:
+        """规则首次调度时间：light 立即评估，其余按 id 散列错峰"""
+        if self.get_cost_level(rule) == 'light':
+            return now
+        offset = (rule.id * 2654435761 % 2 ** 32) / 2 ** 32 * interval
+        return now + offset
+    
+    async def evaluate_due_rules(self):
+        """评估所有到期的规则（带成本准入）"""
         from app.db.database import AsyncSessionLocal
         
         # 查询所有启用的规则
@@ -305,27 +364,66 @@ class AlertEvaluationScheduler:
             result = await db.execute(stmt)
             rules = result.scalars().all()
         
-        logger.info(f"开始评估 {len(rules)} 条规则")
+        now = time.time()
+        active_ids = {rule.id for rule in rules}
+        for rule_id in list(self._next_eval_at):
+            if rule_id not in active_ids:
+                self._next_eval_at.pop(rule_id, None)
+        eval_stats_registry.prune(active_ids)
+        flap_detector.prune(active_ids)
         
-        # 并发评估规则 - 每个规则使用独立的数据库会话
-        tasks = []
+        # 收集到期且未在执行中的规则
+        due = []
         for rule in rules:
-            task = self.evaluate_single_rule(rule)
-            tasks.append(task)
+            interval = self.get_effective_interval(rule)
+            next_at = self._next_eval_at.setdefault(rule.id, self._initial_eval_at(rule, interval, now))
+            if next_at <= now and rule.id not in self._inflight:
+                due.append((next_at, rule, interval))
+        
+        if not due:
+            return
+        
+        # 越迟的规则越优先；预算不足的规则保留原到期时间，顺延到下个周期
+        due.sort(key=lambda item: item[0])
+        budget = self.TICK_COST_BUDGET
+        admitted = 0
+        deferred = 0
+        for next_at, rule, interval in due:
+            cost = self.get_eval_cost(rule)
+            if admitted and cost > budget:
+                deferred += 1
+                continue
+            budget -= cost
+            admitted += 1
+            self._next_eval_at[rule.id] = now + interval
+            task = asyncio.create_task(self._run_rule(rule))
+            self._inflight[rule.id] = task
+            task.add_done_callback(lambda _, rule_id=rule.id: self._inflight.pop(rule_id, None))
         
-        await asyncio.gather(*tasks, return_exceptions=True)
+        if deferred:
+            logger.info(f"开始评估 {admitted} 条规则（共 {len(rules)} 条，超出成本预算顺延 {deferred} 条）")
+        else:
+            logger.debug(f"开始评估 {admitted} 条规则（共 {len(rules)} 条）")
+    
+    async def _run_rule(self, rule: AlertRule):
+        """执行单条规则评估，heavy 规则受并发限制"""
+        if self.get_cost_level(rule) == 'heavy':
+            async with self._heavy_semaphore:
+                await self.evaluate_single_rule(rule)
+        else:
+            await self.evaluate_single_rule(rule)
     
     async def evaluate_single_rule(self, rule: AlertRule):
         """评估单条规则（使用独立的数据库会话）"""
         from app.db.database import AsyncSessionLocal
-        import app.main as main_module
+        import app.worker as worker_module
         
         try:
             # 每个规则使用独立的数据库会话，避免并发冲突
             async with AsyncSessionLocal() as db:
                 # 使用全局的 alert_manager（重要！确保告警添加到同一个分组器）
-                if main_module.alert_manager:
-                    alert_manager = main_module.alert_manager
+                if worker_module.alert_manager:
+                    alert_manager = worker_module.alert_manager
                 else:
                     # 如果全局 alert_manager 未初始化，创建临时的
                     alert_manager = AlertManager()
@@ -337,8 +435,20 @@ class AlertEvaluationScheduler:
                 alert_data_list = await evaluator.evaluate_rule(rule)
                 
                 # 处理告警事件
-                await evaluator.process_alert_events(rule, alert_data_list)
-            
+                transitions = await evaluator.process_alert_events(rule, alert_data_list)
+                
+                # 记录评估统计
+                stats = evaluator.last_query
+                eval_stats_registry.record(
+                    rule,
+                    latency=stats.get("latency", 0.0),
+                    response_bytes=stats.get("response_bytes", 0),
+                    series_count=stats.get("series", 0),
+                    transitions=transitions,
+                    error=stats.get("error")
+                )
+        
         except Exception as e:
             logger.error(f"规则评估失败: rule_id={rule.id}, error={str(e)}")
+            eval_stats_registry.record(rule, 0.0, 0, 0, 0, error=str(e))
 
@@ -0,0 +1,160 @@
+"""告警抖动检测
+
+在阈值附近波动的告警每隔几个评估周期就会产生一次触发 / 恢复，
+每次都要写数据库、写分组器并发送两条通知。抖动检测为每个告警指纹记录最近
+window 次评估的结果（位图，1 表示本次评估命中，0 表示未命中），按相邻两次评估
+结果不同的比例计算状态变化率：
+- 变化率达到 flap_start 时进入抖动状态：告警保持 firing，不恢复、不发送恢复通知
+- 变化率降到 flap_end 以下时退出抖动状态，之后未命中的告警正常恢复
+
+位图按规则保存在 Redis HASH（指纹 -> "位图:评估次数:抖动标记"）中，
+多个评估进程共享同一份历史；Redis 不可用时使用进程内存。
+"""
+from typing import Dict, Iterable, NamedTuple, Optional, Set, Tuple
+from loguru import logger
+
+
+class FlapState(NamedTuple):
+    """单个告警指纹的抖动状态"""
+    history: int  # 最近 window 次评估的命中位图，最低位为最近一次
+    length: int  # 已记录的评估次数（不超过 window）
+    flapping: bool
+    rate: float  # 状态变化率
+
+
+def transition_rate(history: int, length: int) -> float:
+    """位图中相邻两次评估结果不同的比例"""
+    if length < 2:
+        return 0.0
+    changes = (history ^ (history >> 1)) & ((1 << (length - 1)) - 1)
+    return bin(changes).count("1") / (length - 1)
+
+
+class FlapDetector:
+    """告警抖动检测器
+    
+    Attributes:
+        window: 记录的评估次数
+        flap_start: 进入抖动状态的变化率
+        flap_end: 退出抖动状态的变化率
+        min_history: 判定抖动所需的最少评估次数
+    """
+    
+    KEY_PREFIX = "alert:flap"
+    KEY_TTL = 86400  # 规则长时间未评估时历史自动过期（秒）
+    
+    def __init__(
+        self,
+        window: int = 20,
+        flap_start: float = 0.3,
+        flap_end: float = 0.15,
+        min_history: int = 8
+    ):
+        self.window = window
+        self.flap_start = flap_start
+        self.flap_end = flap_end
+        self.min_history = min_history
+        self._mask = (1 << window) - 1
+        self._memory: Dict[int, Dict[str, FlapState]] = {}  # rule_id -> 指纹 -> 抖动状态
+    
+    def _key(self, rule_id: int) -> str:
+        return f"{self.KEY_PREFIX}:{rule_id}"
+    
+    @staticmethod
+    def _encode(state: FlapState) -> str:
+        return f"{state.history}:{state.length}:{int(state.flapping)}"
+    
+    @staticmethod
+    def _decode(value: str) -> Optional[Tuple[int, int, bool]]:
+        try:
+            history, length, flapping = value.split(":")
+            return int(history), int(length), flapping == "1"
+        except (AttributeError, ValueError):
+            return None
+    
+    def _advance(self, previous: Optional[Tuple[int, int, bool]], hit: bool) -> FlapState:
+        """追加一次评估结果并更新抖动状态（带回差，避免在阈值附近来回切换）"""
+        history, length, flapping = previous or (0, 0, False)
+        history = ((history << 1) | int(hit)) & self._mask
+        length = min(length + 1, self.window)
+        rate = transition_rate(history, length)
+        if flapping:
+            flapping = rate >= self.flap_end
+        else:
+            flapping = length >= self.min_history and rate >= self.flap_start
+        return FlapState(history, length, flapping, rate)
+    
+    async def _load(self, rule_id: int) -> Tuple[Dict[str, Tuple[int, int, bool]], bool]:
+        """读取规则的历史，返回 (历史, 是否来自 Redis)"""
+        try:
+            from app.db.redis_client import RedisClient
+            redis_client = await RedisClient.get_client()
+            raw = await redis_client.hgetall(self._key(rule_id))
+            return {fp: decoded for fp, value in raw.items() if (decoded := self._decode(value))}, True
+        except Exception as e:
+            logger.debug(f"读取抖动历史失败，使用内存: rule_id={rule_id}, error={str(e)}")
+            memory = self._memory.get(rule_id, {})
+            return {fp: (state.history, state.length, state.flapping) for fp, state in memory.items()}, False
+    
+    async def _save(self, rule_id: int, states: Dict[str, FlapState], dropped: Set[str], use_redis: bool):
+        if use_redis:
+            try:
+                from app.db.redis_client import RedisClient
+                redis_client = await RedisClient.get_client()
+                key = self._key(rule_id)
+                async with redis_client.pipeline(transaction=False) as pipe:
+                    if states:
+                        pipe.hset(key, mapping={fp: self._encode(state) for fp, state in states.items()})
+                        pipe.expire(key, self.KEY_TTL)
+                    if dropped:
+                        pipe.hdel(key, *dropped)
+                    await pipe.execute()
+                return
+            except Exception as e:
+                logger.warning(f"保存抖动历史失败，使用内存: rule_id={rule_id}, error={str(e)}")
+        
+        self._memory[rule_id] = states
+    
+    async def record(self, rule_id: int, hits: Set[str], tracked: Iterable[str] = ()) -> Dict[str, FlapState]:
+        """
+        记录规则一次评估的结果
+        
+        Args:
+            rule_id: 规则 ID
+            hits: 本次评估命中的告警指纹
+            tracked: 未命中但仍需记录的告警指纹（如当前 pending / firing 的告警）
+        
+        Returns:
+            指纹 -> 抖动状态（包含命中、tracked 和已有历史的全部指纹）
+        """
+        previous, use_redis = await self._load(rule_id)
+        fingerprints = set(previous) | set(hits) | set(tracked)
+        
+        states: Dict[str, FlapState] = {}
+        dropped: Set[str] = set()
+        for fingerprint in fingerprints:
+            old = previous.get(fingerprint)
+            state = self._advance(old, fingerprint in hits)
+            if old and old[2] != state.flapping:
+                action = "进入" if state.flapping else "退出"
+                logger.info(f"告警{action}抖动状态: rule_id={rule_id}, fingerprint={fingerprint}, 变化率={state.rate:.2f}")
+            
+            # 整个窗口内都未命中的告警不再记录
+            if state.history == 0 and not state.flapping:
+                if old:
+                    dropped.add(fingerprint)
+                continue
+            states[fingerprint] = state
+        
+        await self._save(rule_id, states, dropped, use_redis)
+        return states
+    
+    def prune(self, active_rule_ids: Set[int]):
+        """清理已删除或禁用规则的内存历史（Redis 中的历史按 TTL 过期）"""
+        for rule_id in list(self._memory):
+            if rule_id not in active_rule_ids:
+                self._memory.pop(rule_id, None)
+
+
+# 全局抖动检测器
+flap_detector = FlapDetector()
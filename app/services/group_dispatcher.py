@@ -0,0 +1,288 @@
+"""告警分组并发派发器
+
+分组工作器把就绪分组交给派发器后立即返回，由派发器在后台并发发送：
+- 全局并发上限：避免瞬时大量分组耗尽连接和数据库会话
+- 按优先级获取发送槽位：critical 分组优先于 warning / info 分组，
+  等待超过 starvation_after 秒的低优先级分组提前获得槽位，不会被持续饿死
+- 同一分组键串行：分组仍在发送时再次就绪会被跳过，恢复分组排在同名 firing 分组之后
+- 渠道发送先获取渠道并发许可、再获取发送槽位：分组发送到各渠道期间让出自己的槽位，
+  每个渠道的发送在拿到渠道许可后单独占用槽位，等待慢渠道的分组不会占满全局槽位
+- 按优先级记录从就绪到发送完成的延迟，并与延迟目标（SLO）比较
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+from loguru import logger
+from app.services.notification_priority import (
+    PRIORITIES, PRIORITY_RANK, LOWEST_PRIORITY, PriorityLatencyTracker, normalize_priority
+)
+
+
+class _DispatchSlot:
+    """派发任务持有的发送槽位"""
+    
+    __slots__ = ('dispatcher', 'priority', 'held')
+    
+    def __init__(self, dispatcher: "GroupDispatcher", priority: str):
+        self.dispatcher = dispatcher
+        self.priority = priority
+        self.held = False
+    
+    async def acquire(self):
+        await self.dispatcher._acquire(self.priority)
+        self.held = True
+    
+    def release(self):
+        if self.held:
+            self.held = False
+            self.dispatcher._release()
+
+
+# 当前派发任务的发送槽位（发送协程及其子任务可见）
+_current_slot: ContextVar[Optional[_DispatchSlot]] = ContextVar('dispatch_slot', default=None)
+
+
+@asynccontextmanager
+async def released_dispatch_slot():
+    """让出当前派发任务的发送槽位，退出时重新获取（不在派发任务中时无操作）"""
+    slot = _current_slot.get()
+    if slot is None or not slot.held:
+        yield
+        return
+    slot.release()
+    try:
+        yield
+    finally:
+        await slot.acquire()
+
+
+@asynccontextmanager
+async def channel_dispatch_slot():
+    """为单个渠道的发送按当前分组的优先级获取发送槽位（调用方应已持有渠道并发许可）"""
+    slot = _current_slot.get()
+    if slot is None:
+        yield
+        return
+    channel_slot = _DispatchSlot(slot.dispatcher, slot.priority)
+    await channel_slot.acquire()
+    try:
+        yield
+    finally:
+        channel_slot.release()
+
+
+class GroupDispatcher:
+    """告警分组并发派发器
+    
+    Attributes:
+        max_concurrent: 同时发送的分组数上限
+        starvation_after: 等待超过该时间（秒）的分组不再按优先级排队，按等待时间先后获得槽位
+        _pending: (group_key, is_recovery) -> 派发任务（排队或发送中）
+        _chains: 基础分组键 -> 最后一个派发任务（用于同一分组键串行）
+        _waiting: 优先级 -> 等待发送槽位的 (开始等待时间, Future) 队列
+        _latencies: 最近的就绪 -> 发送完成延迟（秒）
+    """
+    
+    RECOVERY_PREFIX = "recovery:"
+    
+    def __init__(self, max_concurrent: int = 20, latency_window: int = 1000, starvation_after: float = 30):
+        self.max_concurrent = max_concurrent
+        self.starvation_after = starvation_after
+        self._active = 0
+        self._waiting: Dict[str, Deque[Tuple[float, asyncio.Future]]] = {priority: deque() for priority in PRIORITIES}
+        self._capacity = asyncio.Event()
+        self._pending: Dict[Tuple[str, bool], asyncio.Task] = {}
+        self._chains: Dict[str, asyncio.Task] = {}
+        self._latencies: Deque[float] = deque(maxlen=latency_window)
+        self.priority_latency = PriorityLatencyTracker(window=latency_window)
+        self.dispatched = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.promoted = 0  # 因等待超时而提前获得槽位的次数
+    
+    def _base_key(self, group_key: str, is_recovery: bool) -> str:
+        """恢复分组与对应 firing 分组共用基础分组键"""
+        if is_recovery and group_key.startswith(self.RECOVERY_PREFIX):
+            return group_key[len(self.RECOVERY_PREFIX):]
+        return group_key
+    
+    def is_pending(self, group_key: str, is_recovery: bool) -> bool:
+        """分组是否正在排队或发送"""
+        return (group_key, is_recovery) in self._pending
+    
+    @property
+    def free_slots(self) -> int:
+        """还可以提交而不排队的分组数（排队中的分组也占用名额）"""
+        return max(self.max_concurrent - len(self._pending), 0)
+    
+    async def wait_for_capacity(self):
+        """等待到有空闲名额（用于从通知队列读取前的背压，避免在派发器内堆积大量低优先级分组）"""
+        while self.free_slots <= 0:
+            self._capacity.clear()
+            await self._capacity.wait()
+    
+    async def _acquire(self, priority: str):
+        """按优先级获取发送槽位"""
+        if self._active < self.max_concurrent and not any(self._waiting.values()):
+            self._active += 1
+            return
+        
+        future = asyncio.get_running_loop().create_future()
+        entry = (time.time(), future)
+        self._waiting[priority].append(entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已获得槽位后被取消，交还槽位
+                self._release()
+            elif entry in self._waiting[priority]:
+                self._waiting[priority].remove(entry)
+            raise
+    
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        """选择下一个获得槽位的等待者：等待超时的最早者优先，其次按优先级先来先得"""
+        now = time.time()
+        starved = None
+        for priority in PRIORITIES:
+            queue = self._waiting[priority]
+            if queue and now - queue[0][0] >= self.starvation_after:
+                if starved is None or queue[0][0] < self._waiting[starved][0][0]:
+                    starved = priority
+        if starved is not None:
+            if PRIORITY_RANK[starved] > 0:
+                self.promoted += 1
+            return self._waiting[starved].popleft()[1]
+        
+        for priority in PRIORITIES:
+            if self._waiting[priority]:
+                return self._waiting[priority].popleft()[1]
+        return None
+    
+    def _release(self):
+        """释放发送槽位：直接转交给下一个等待者，没有等待者时归还"""
+        while True:
+            future = self._next_waiter()
+            if future is None:
+                self._active -= 1
+                return
+            if not future.done():
+                future.set_result(None)
+                return
+    
+    def dispatch(
+        self,
+        group_key: str,
+        is_recovery: bool,
+        send: Callable[[], Awaitable[Any]],
+        ready_at: Optional[float] = None,
+        priority: str = LOWEST_PRIORITY
+    ) -> bool:
+        """
+        提交分组发送任务
+        
+        Args:
+            group_key: 分组键
+            is_recovery: 是否为恢复分组
+            send: 执行发送的协程函数，返回 False 表示发送失败
+            ready_at: 分组被判定就绪的时间，用于统计派发延迟
+            priority: 通知优先级（critical / warning / info）
+        
+        Returns:
+            bool: 是否提交成功（分组已在排队或发送中时返回 False）
+        """
+        key = (group_key, is_recovery)
+        if key in self._pending:
+            self.skipped += 1
+            logger.debug(f"分组正在发送中，跳过: {group_key}, is_recovery={is_recovery}")
+            return False
+        
+        base_key = self._base_key(group_key, is_recovery)
+        previous = self._chains.get(base_key)
+        priority = normalize_priority(priority) or LOWEST_PRIORITY
+        task = asyncio.create_task(
+            self._run(key, base_key, previous, send, ready_at or time.time(), priority)
+        )
+        self._pending[key] = task
+        self._chains[base_key] = task
+        self.dispatched += 1
+        return True
+    
+    async def _run(
+        self,
+        key: Tuple[str, bool],
+        base_key: str,
+        previous: Optional[asyncio.Task],
+        send: Callable[[], Awaitable[Any]],
+        ready_at: float,
+        priority: str
+    ):
+        """等待同一分组键的前序任务，再按优先级获取发送槽位并发送"""
+        try:
+            if previous is not None and not previous.done():
+                await asyncio.wait({previous})
+            
+            slot = _DispatchSlot(self, priority)
+            await slot.acquire()
+            token = _current_slot.set(slot)
+            try:
+                result = await send()
+            finally:
+                _current_slot.reset(token)
+                slot.release()
+            
+            latency = time.time() - ready_at
+            self._latencies.append(latency)
+            self.priority_latency.record(priority, latency)
+            if result is False:
+                self.failed += 1
+            else:
+                self.succeeded += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"❌ 分组派发失败: group={key[0]}, is_recovery={key[1]}, error={str(e)}")
+        finally:
+            self._pending.pop(key, None)
+            if self._chains.get(base_key) is asyncio.current_task():
+                self._chains.pop(base_key, None)
+            self._capacity.set()
+    
+    async def close(self, timeout: float = 10):
+        """等待进行中的派发完成，超时后取消"""
+        tasks = list(self._pending.values())
+        if not tasks:
+            return
+        
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"分组派发器关闭时取消了 {len(pending)} 个未完成的发送")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """派发统计（延迟基于最近的派发记录）"""
+        latencies = sorted(self._latencies)
+        count = len(latencies)
+        return {
+            "in_flight": len(self._pending),
+            "sending": self._active,
+            "waiting": {priority: len(queue) for priority, queue in self._waiting.items()},
+            "max_concurrent": self.max_concurrent,
+            "dispatched": self.dispatched,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "promoted": self.promoted,
+            "latency_seconds": {
+                "p50": round(latencies[count // 2], 3) if count else 0.0,
+                "p95": round(latencies[min(int(count * 0.95), count - 1)], 3) if count else 0.0,
+                "max": round(latencies[-1], 3) if count else 0.0,
+            },
+            "priorities": self.priority_latency.get_stats(),
+        }
@@ -0,0 +1,92 @@
+"""通知优先级
+
+分组通知按优先级发送，优先级取值与告警等级一致（critical > warning > info）：
+- 规则 route_config 中配置了 priority 时使用规则的配置
+- 否则取分组内告警的最高等级，未知等级按 info 处理
+
+并按优先级统计从分组就绪到发送完成的延迟，与各优先级的延迟目标（SLO）比较。
+"""
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional
+from app.models.alert import AlertRule
+
+
+PRIORITIES = ("critical", "warning", "info")  # 从高到低
+PRIORITY_RANK = {priority: rank for rank, priority in enumerate(PRIORITIES)}
+LOWEST_PRIORITY = PRIORITIES[-1]
+
+# 各优先级的发送延迟目标（秒）
+PRIORITY_LATENCY_SLO = {"critical": 5, "warning": 30, "info": 120}
+
+
+def normalize_priority(value: Any) -> Optional[str]:
+    """规范化优先级名称，无法识别时返回 None"""
+    if not isinstance(value, str):
+        return None
+    value = value.strip().lower()
+    return value if value in PRIORITY_RANK else None
+
+
+def rule_priority(rule: Optional[AlertRule]) -> Optional[str]:
+    """规则 route_config 中配置的优先级（未配置时返回 None）"""
+    if rule is None:
+        return None
+    return normalize_priority((rule.route_config or {}).get("priority"))
+
+
+def group_priority(severities: Iterable[Any], configured: Optional[str] = None) -> str:
+    """
+    计算分组的通知优先级
+    
+    Args:
+        severities: 组内告警的等级
+        configured: 规则配置的优先级，优先使用
+    """
+    configured = normalize_priority(configured)
+    if configured:
+        return configured
+    
+    rank = PRIORITY_RANK[LOWEST_PRIORITY]
+    for severity in severities:
+        priority = normalize_priority(severity)
+        if priority is not None and PRIORITY_RANK[priority] < rank:
+            rank = PRIORITY_RANK[priority]
+            if rank == 0:
+                break
+    return PRIORITIES[rank]
+
+
+class PriorityLatencyTracker:
+    """按优先级统计发送延迟（最近 window 条记录）和 SLO 达成情况"""
+    
+    def __init__(self, window: int = 1000, slo: Optional[Dict[str, float]] = None):
+        self.slo = {**PRIORITY_LATENCY_SLO, **(slo or {})}
+        self._latencies: Dict[str, Deque[float]] = {priority: deque(maxlen=window) for priority in PRIORITIES}
+        self.counts = dict.fromkeys(PRIORITIES, 0)
+        self.breaches = dict.fromkeys(PRIORITIES, 0)
+    
+    def record(self, priority: str, latency: float):
+        """记录一次发送延迟（秒）"""
+        priority = normalize_priority(priority) or LOWEST_PRIORITY
+        self._latencies[priority].append(latency)
+        self.counts[priority] += 1
+        if latency > self.slo[priority]:
+            self.breaches[priority] += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """各优先级的延迟分位数、SLO 目标和达成率"""
+        stats = {}
+        for priority in PRIORITIES:
+            latencies = sorted(self._latencies[priority])
+            count = len(latencies)
+            total = self.counts[priority]
+            stats[priority] = {
+                "count": total,
+                "p50": round(latencies[count // 2], 3) if count else 0.0,
+                "p95": round(latencies[min(int(count * 0.95), count - 1)], 3) if count else 0.0,
+                "max": round(latencies[-1], 3) if count else 0.0,
+                "slo_seconds": self.slo[priority],
+                "slo_breaches": self.breaches[priority],
+                "slo_attainment": round(1 - self.breaches[priority] / total, 4) if total else 1.0,
+            }
+        return stats
@@ -0,0 +1,338 @@
+"""告警分组通知队列（Redis Streams）
+
+分组工作器把就绪分组按通知优先级写入对应的 Stream（每个优先级一个），所有实例以同一个消费者组消费：
+- XREADGROUP 把每条消息只投递给一个消费者，发送负载在实例间均摊
+- 读取时先按保底份额读取低优先级（防止饿死），剩余名额按优先级从高到低读取
+- 所有渠道发送成功后 XACK + XDEL；有渠道失败或实例崩溃时消息留在 PEL（待确认列表），
+  已成功的渠道记录在消息的已送达集合中，重试时跳过
+- 发送期间定期以 XCLAIM JUSTID 刷新消息的空闲时间，慢渠道不会让消息被其他消费者重复接管
+- 空闲超过 claim_idle 的消息由其他消费者通过 XAUTOCLAIM 接管重试，
+  投递次数超过 max_deliveries 后丢弃并记录日志
+
+投递语义为至少一次：消费者在发送成功、确认之前崩溃时，消息会被重新投递。
+"""
+import asyncio
+import json
+import os
+import socket
+import uuid
+from typing import Any, Dict, List, Optional, Set, Tuple
+from loguru import logger
+import redis.asyncio as redis
+from app.services.notification_priority import PRIORITIES, LOWEST_PRIORITY, normalize_priority
+
+
+class NotificationStreamQueue:
+    """基于 Redis Streams 的分组通知队列
+    
+    Attributes:
+        stream_key: Stream 键前缀，各优先级的 Stream 为 {stream_key}:{priority}
+        streams: 优先级 -> Stream 键
+        group_name: 消费者组名称
+        consumer_name: 当前实例的消费者名称
+        claim_idle: 消息空闲多久（秒）后可被其他消费者接管
+        max_deliveries: 单条消息最大投递次数
+        delivered_prefix: 消息已送达渠道集合的键前缀
+        min_share: 优先级 -> 每次读取中保底的名额比例（有积压时累计，防止低优先级饿死）
+    """
+    
+    PRIORITY_MIN_SHARE = {"critical": 0.0, "warning": 0.15, "info": 0.05}
+    
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        stream_key: str = "alert:notify:stream",
+        group_name: str = "notifiers",
+        consumer_name: Optional[str] = None,
+        claim_idle: int = 60,
+        max_deliveries: int = 3,
+        max_len: int = 10000
+    ):
+        self.redis = redis_client
+        self.stream_key = stream_key
+        self.streams = {priority: f"{stream_key}:{priority}" for priority in PRIORITIES}
+        self.min_share = dict(self.PRIORITY_MIN_SHARE)
+        self.group_name = group_name
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.claim_idle = claim_idle
+        self.max_deliveries = max_deliveries
+        self.max_len = max_len
+        self._claim_cursors = {priority: "0-0" for priority in PRIORITIES}
+        self._credits = dict.fromkeys(PRIORITIES, 0.0)  # 各优先级累计的保底名额
+        self._held: Dict[str, Set[str]] = {priority: set() for priority in PRIORITIES}  # 发送中的消息
+        self.delivered_prefix = f"{stream_key}:delivered:"
+        self.published = 0
+        self.acked = 0
+        self.reclaimed = 0
+        self.dropped = 0
+    
+    @property
+    def publish_lease(self) -> int:
+        """就绪分组发布后的租约（秒）：覆盖全部重试窗口，期间不会被重复发布"""
+        return self.claim_idle * (self.max_deliveries + 1)
+    
+    @property
+    def claim_refresh_interval(self) -> float:
+        """发送中消息的空闲时间刷新间隔（秒），远小于 claim_idle"""
+        return max(self.claim_idle / 3, 1)
+    
+    async def ensure_group(self):
+        """为每个优先级的 Stream 创建消费者组（Stream 不存在时一并创建）"""
+        for stream in self.streams.values():
+            try:
+                await self.redis.xgroup_create(stream, self.group_name, id="0", mkstream=True)
+                logger.info(f"通知队列消费者组已创建: stream={stream}, group={self.group_name}")
+            except redis.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+    
+    async def publish(self, ready_groups: List[tuple]) -> int:
+        """
+        发布就绪分组（一次 Pipeline），按分组的 priority 字段写入对应优先级的 Stream
+        
+        Args:
+            ready_groups: List[(group_data, is_recovery)]，group_data 为 Redis 分组器返回的字典
+        
+        Returns:
+            int: 发布的消息数
+        """
+        if not ready_groups:
+            return 0
+        
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for group, is_recovery in ready_groups:
+                priority = normalize_priority(group.get("priority")) or LOWEST_PRIORITY
+                pipe.xadd(
+                    self.streams[priority],
+                    {
+                        "group_key": group["group_key"],
+                        "is_recovery": "1" if is_recovery else "0",
+                        "group": json.dumps(group),
+                    },
+                    maxlen=self.max_len,
+                    approximate=True
+                )
+            await pipe.execute()
+        
+        self.published += len(ready_groups)
+        return len(ready_groups)
+    
+    @staticmethod
+    def _decode(entries, priority: str) -> List[Tuple[str, dict, bool, str]]:
+        """把 Stream 消息解码为 (消息 ID, 分组字典, 是否恢复分组, 优先级)"""
+        decoded = []
+        for entry_id, fields in entries:
+            if not fields:
+                # 已被删除的消息（XAUTOCLAIM 可能返回空字段）
+                continue
+            decoded.append((entry_id, json.loads(fields["group"]), fields.get("is_recovery") == "1", priority))
+        return decoded
+    
+    @staticmethod
+    def entry_time(entry_id: str) -> float:
+        """消息 ID 中的写入时间（秒），即分组发布的时间"""
+        return int(entry_id.split("-", 1)[0]) / 1000
+    
+    async def _delivery_counts(self, stream: str, entry_ids: List[str]) -> Dict[str, int]:
+        """查询消息的投递次数（entry_ids 按 ID 升序，一次 XPENDING 取回整个区间）
+        
+        只查询本消费者的待确认消息；区间内本消费者仍在发送的其他消息可能占用名额，
+        未取到的消息按 0 次处理，在之后的接管中再检查。
+        """
+        if not entry_ids:
+            return {}
+        
+        wanted = set(entry_ids)
+        pending = await self.redis.xpending_range(
+            stream, self.group_name, min=entry_ids[0], max=entry_ids[-1],
+            count=len(entry_ids), consumername=self.consumer_name
+        )
+        return {
+            item["message_id"]: int(item["times_delivered"])
+            for item in pending
+            if item["message_id"] in wanted
+        }
+    
+    async def reclaim(self, count: int = 50) -> List[Tuple[str, dict, bool, str]]:
+        """按优先级从高到低接管空闲超时的消息（其他消费者崩溃或发送失败未确认）"""
+        retry = []
+        for priority in PRIORITIES:
+            if len(retry) >= count:
+                break
+            stream = self.streams[priority]
+            result = await self.redis.xautoclaim(
+                stream, self.group_name, self.consumer_name,
+                min_idle_time=self.claim_idle * 1000, start_id=self._claim_cursors[priority],
+                count=count - len(retry)
+            )
+            self._claim_cursors[priority] = result[0] or "0-0"
+            entries = self._decode(result[1], priority)
+            if not entries:
+                continue
+            
+            counts = await self._delivery_counts(stream, [entry[0] for entry in entries])
+            exhausted = []
+            for entry in entries:
+                entry_id, group = entry[0], entry[1]
+                if counts.get(entry_id, 0) > self.max_deliveries:
+                    exhausted.append(entry_id)
+                    logger.error(f"❌ 分组通知重试次数耗尽，丢弃: group={group.get('group_key')}, id={entry_id}")
+                else:
+                    retry.append(entry)
+            
+            if exhausted:
+                await self.ack(exhausted, priority)
+                self.dropped += len(exhausted)
+        
+        self.reclaimed += len(retry)
+        return retry
+    
+    async def _read(self, priority: str, count: int) -> List[Tuple[str, dict, bool, str]]:
+        """非阻塞读取一个优先级的新消息"""
+        result = await self.redis.xreadgroup(
+            self.group_name, self.consumer_name, {self.streams[priority]: ">"}, count=count
+        )
+        if not result:
+            return []
+        return self._decode(result[0][1], priority)
+    
+    async def consume(self, count: int = 20, block_ms: int = 2000) -> List[Tuple[str, dict, bool, str]]:
+        """
+        读取待发送的分组：先接管超时消息，再按优先级读取新消息，都没有时阻塞等待
+        
+        新消息分两轮读取：
+        1. 各优先级按保底份额读取（份额在有积压时逐次累计，不足 1 条的部分留到下次），
+           保证 critical 持续积压时低优先级仍有进展
+        2. 剩余名额按优先级从高到低读取
+        
+        Returns:
+            List[(消息 ID, 分组字典, 是否恢复分组, 优先级)]
+        """
+        entries = await self.reclaim(count)
+        if entries:
+            return entries
+        
+        for priority in PRIORITIES:
+            share = self.min_share.get(priority, 0)
+            if share <= 0:
+                continue
+            self._credits[priority] = min(self._credits[priority] + count * share, count)
+            quota = min(int(self._credits[priority]), count - len(entries))
+            if quota <= 0:
+                continue
+            read = await self._read(priority, quota)
+            entries.extend(read)
+            # 没有积压时不累计保底名额
+            self._credits[priority] = 0.0 if len(read) < quota else self._credits[priority] - len(read)
+        
+        for priority in PRIORITIES:
+            if len(entries) >= count:
+                break
+            entries.extend(await self._read(priority, count - len(entries)))
+        
+        if entries:
+            return entries
+        
+        result = await self.redis.xreadgroup(
+            self.group_name, self.consumer_name,
+            {stream: ">" for stream in self.streams.values()}, count=count, block=block_ms
+        )
+        priorities = {stream: priority for priority, stream in self.streams.items()}
+        for stream, stream_entries in result or []:
+            entries.extend(self._decode(stream_entries, priorities[stream]))
+        return entries
+    
+    async def ack(self, entry_ids: List[str], priority: str):
+        """确认并删除消息（连同已送达渠道集合）"""
+        if not entry_ids:
+            return
+        stream = self.streams[priority]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xack(stream, self.group_name, *entry_ids)
+            pipe.xdel(stream, *entry_ids)
+            pipe.delete(*[self.delivered_prefix + entry_id for entry_id in entry_ids])
+            await pipe.execute()
+        self.acked += len(entry_ids)
+    
+    async def get_delivered(self, entry_id: str) -> Set[int]:
+        """消息此前已发送成功的渠道 ID（重试时跳过）"""
+        members = await self.redis.smembers(self.delivered_prefix + entry_id)
+        return {int(member) for member in members}
+    
+    async def add_delivered(self, entry_id: str, channel_ids: Set[int]):
+        """记录消息已发送成功的渠道，保留到重试窗口结束"""
+        if not channel_ids:
+            return
+        key = self.delivered_prefix + entry_id
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.sadd(key, *channel_ids)
+            pipe.expire(key, self.publish_lease)
+            await pipe.execute()
+    
+    def hold(self, entry_id: str, priority: str):
+        """标记消息发送中（期间由 refresh_claims 刷新空闲时间）"""
+        self._held[priority].add(entry_id)
+    
+    def release(self, entry_id: str, priority: str):
+        """发送结束，停止刷新消息的空闲时间"""
+        self._held[priority].discard(entry_id)
+    
+    async def refresh_claims(self):
+        """刷新本消费者发送中消息的空闲时间（XCLAIM JUSTID 不增加投递次数）
+        
+        先按 XPENDING 确认消息仍归本消费者所有，已被其他消费者接管的消息不再抢回。
+        """
+        for priority, held in self._held.items():
+            if not held:
+                continue
+            stream = self.streams[priority]
+            entry_ids = list(held)
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for entry_id in entry_ids:
+                    pipe.xpending_range(
+                        stream, self.group_name, min=entry_id, max=entry_id,
+                        count=1, consumername=self.consumer_name
+                    )
+                results = await pipe.execute()
+            owned = [entry_id for entry_id, pending in zip(entry_ids, results) if pending]
+            if owned:
+                await self.redis.xclaim(
+                    stream, self.group_name, self.consumer_name,
+                    min_idle_time=0, message_ids=owned, justid=True
+                )
+    
+    async def run_claim_refresher(self):
+        """后台任务：定期刷新发送中消息的空闲时间"""
+        while True:
+            try:
+                await asyncio.sleep(self.claim_refresh_interval)
+                await self.refresh_claims()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.warning(f"刷新通知消息空闲时间失败: {str(e)}")
+    
+    async def get_stats(self) -> Dict[str, Any]:
+        """队列统计（含当前 Stream 长度和待确认消息数）"""
+        stats = {
+            "consumer": self.consumer_name,
+            "published": self.published,
+            "acked": self.acked,
+            "reclaimed": self.reclaimed,
+            "dropped": self.dropped,
+        }
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for stream in self.streams.values():
+                    pipe.xlen(stream)
+                    pipe.xpending(stream, self.group_name)
+                results = await pipe.execute()
+            stats["priorities"] = {
+                priority: {"length": length, "pending": pending["pending"] if pending else 0}
+                for priority, length, pending in zip(PRIORITIES, results[::2], results[1::2])
+            }
+            stats["length"] = sum(item["length"] for item in stats["priorities"].values())
+            stats["pending"] = sum(item["pending"] for item in stats["priorities"].values())
+        except Exception as e:
+            logger.debug(f"获取通知队列统计失败: {str(e)}")
+        return stats
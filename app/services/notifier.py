@@ -5,11 +5,12 @@
 import time
 import json
 import re
+import asyncio
 import httpx
 import aiosmtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Set, TYPE_CHECKING
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
@@ -18,6 +19,10 @@ from app.models.alert import AlertEvent, AlertRule
 from app.models.notification import NotificationChannel, NotificationRecord
 from app.models.settings import SystemSettings
 from app.db.database import DatabaseSessionManager
+from app.services.group_dispatcher import released_dispatch_slot, channel_dispatch_slot
+
+if TYPE_CHECKING:
+    from app.services.storm_detector import StormDetector, StormState, StormSummary
 
 
 class NotificationService:
@@ -32,11 +37,22 @@ class NotificationService:
     
     Attributes:
         db_manager: 数据库会话管理器
+        storm_detector: 告警风暴检测器（未设置时不做风暴检测，逐个分组发送）
+        _channel_semaphores: 渠道 ID -> 并发信号量（进程内共享，限制单个渠道的并发发送数）
     """
     
-    def __init__(self):
+    # 单个通知渠道的最大并发发送数（避免慢 Webhook 被并发打满或触发限流）
+    CHANNEL_MAX_CONCURRENT = 4
+    
+    # 通知记录每次提交的条数（大分组的记录分块写入）
+    RECORD_INSERT_CHUNK = 500
+    
+    _channel_semaphores: Dict[int, asyncio.Semaphore] = {}
+    
+    def __init__(self, storm_detector: Optional["StormDetector"] = None):
         """初始化通知服务"""
         self.db_manager = DatabaseSessionManager()
+        self.storm_detector = storm_detector
     
     @staticmethod
     def render_template(template: str, alert: AlertEvent) -> str:
@@ -97,25 +113,117 @@ class NotificationService:
         self, 
         alerts: List[AlertEvent], 
         rule: AlertRule, 
-        is_recovery: bool = False
-    ):
-        """发送批量告警通知（支持告警合并）"""
+        is_recovery: bool = False,
+        new_group: bool = False,
+        skip_channels: Optional[Set[int]] = None
+    ) -> Dict[int, bool]:
+        """
+        发送批量告警通知（支持告警合并）
+        
+        Args:
+            alerts: 同一分组的告警
+            rule: 告警规则
+            is_recovery: 是否为恢复通知
+            new_group: 是否为首次发送的 firing 分组（计入告警风暴检测的速率）
+            skip_channels: 已发送成功的渠道 ID（重试时跳过）
+        
+        Returns:
+            Dict[int, bool]: 本次处理的渠道 ID -> 是否成功（计入风暴摘要的渠道视为成功）
+        """
         if not alerts:
-            return
+            return {}
         
         # 使用第一个告警来获取通知渠道（所有告警应该在同一个分组中）
         first_alert = alerts[0]
         
         # 根据规则路由配置获取通知渠道
         channels = await self.get_notification_channels(first_alert, rule)
+        if skip_channels:
+            channels = [channel for channel in channels if channel.id not in skip_channels]
         
         if not channels:
-            logger.warning(f"无可用通知渠道: rule={rule.name}")
+            if not skip_channels:
+                logger.warning(f"无可用通知渠道: rule={rule.name}")
+            return {}
+        
+        results: Dict[int, bool] = {}
+        
+        # 处于告警风暴的渠道不再逐个发送，计入风暴摘要（不写通知记录）
+        if self.storm_detector is not None:
+            normal_channels = []
+            for channel in channels:
+                if self.storm_detector.observe(first_alert.tenant_id, channel, new_group and not is_recovery):
+                    self.storm_detector.absorb(first_alert.tenant_id, channel, alerts, is_recovery)
+                    results[channel.id] = True
+                else:
+                    normal_channels.append(channel)
+            channels = normal_channels
+        
+        # 并发发送到所有渠道（每个渠道受并发上限约束）
+        # 期间让出分组的派发槽位，各渠道拿到渠道许可后再占用槽位，等待慢渠道时不占用全局并发
+        async with released_dispatch_slot():
+            sent = await asyncio.gather(*[
+                self._send_with_channel_limit(channel, alerts, rule, is_recovery)
+                for channel in channels
+            ])
+        results.update(zip((channel.id for channel in channels), sent))
+        return results
+    
+    @classmethod
+    def _get_channel_semaphore(cls, channel_id: int) -> asyncio.Semaphore:
+        """获取渠道的并发信号量"""
+        semaphore = cls._channel_semaphores.get(channel_id)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(cls.CHANNEL_MAX_CONCURRENT)
+            cls._channel_semaphores[channel_id] = semaphore
+        return semaphore
+    
+    async def _send_with_channel_limit(
+        self,
+        channel: NotificationChannel,
+        alerts: List[AlertEvent],
+        rule: Optional[AlertRule],
+        is_recovery: bool
+    ) -> bool:
+        """在渠道并发上限内发送（先获取渠道许可，再获取派发槽位），返回是否成功"""
+        async with self._get_channel_semaphore(channel.id):
+            async with channel_dispatch_slot():
+                return await self.send_batch_to_channel(channel, alerts, rule, is_recovery)
+    
+    async def flush_storm_summaries(self):
+        """发送到达发送时间的告警风暴摘要"""
+        if self.storm_detector is None:
+            return
+        
+        due = self.storm_detector.collect_due()
+        if not due:
             return
         
-        # 发送到所有渠道
-        for channel in channels:
-            await self.send_batch_to_channel(channel, alerts, rule, is_recovery)
+        async def send(state: "StormState", summary: "StormSummary", ended: bool):
+            logger.info(f"发送告警风暴摘要: channel={state.channel.name}, 分组数={summary.groups}, 结束={ended}")
+            try:
+                async with self._get_channel_semaphore(state.channel.id):
+                    sent = await self.send_storm_summary(state.tenant_id, state.channel, summary, ended)
+            except Exception as e:
+                logger.error(f"发送告警风暴摘要失败: channel={state.channel.name}, error={str(e)}")
+                sent = False
+            if not sent:
+                # 摘要已从检测器取出，放回后由下一次 flush 重新发送
+                self.storm_detector.requeue(state, summary, ended)
+        
+        await asyncio.gather(*[send(state, summary, ended) for state, summary, ended in due])
+    
+    async def send_storm_summary(
+        self,
+        tenant_id: int,
+        channel: NotificationChannel,
+        summary: "StormSummary",
+        ended: bool
+    ) -> bool:
+        """发送告警风暴摘要（作为一条合成告警走渠道发送流程，写入通知记录），返回是否成功"""
+        top_labels = self.storm_detector.top_labels if self.storm_detector else 5
+        alert = summary.to_alert(tenant_id, channel, ended, top_labels)
+        return await self.send_batch_to_channel(channel, [alert], None, False)
     
     async def get_notification_channels(
         self, 
@@ -199,10 +307,16 @@ class NotificationService:
         alerts: List[AlertEvent],
         rule: Optional[AlertRule],
         is_recovery: bool
-    ):
-        """发送批量告警到指定渠道"""
+    ) -> bool:
+        """发送批量告警到指定渠道
+        
+        发送异常在此捕获并写入失败的通知记录，通过返回值告知调用方，由调用方决定是否重试。
+        
+        Returns:
+            bool: 是否发送成功（不支持的渠道类型返回 True，重试也不会成功）
+        """
         if not alerts:
-            return
+            return True
         
         try:
             # 根据渠道类型选择发送方法
@@ -218,17 +332,23 @@ class NotificationService:
                 await self.send_webhook_batch(channel, alerts, is_recovery)
             else:
                 logger.warning(f"不支持的通知类型: {channel.type}")
-                return
-            
-            # 记录通知（为每个告警记录）
-            for alert in alerts:
-                await self.record_notification(channel, alert, 'success', None)
+                return True
             
         except Exception as e:
             logger.error(f"发送通知失败: channel={channel.name}, error={str(e)}")
             # 记录失败
-            for alert in alerts:
-                await self.record_notification(channel, alert, 'failed', str(e))
+            try:
+                await self.record_notifications(channel, alerts, 'failed', str(e))
+            except Exception as record_error:
+                logger.error(f"写入通知记录失败: channel={channel.name}, error={str(record_error)}")
+            return False
+        
+        # 记录通知（为每个告警记录）；已送达后记录失败不影响结果，避免重复发送
+        try:
+            await self.record_notifications(channel, alerts, 'success', None)
+        except Exception as e:
+            logger.error(f"写入通知记录失败: channel={channel.name}, error={str(e)}")
+        return True
     
     async def send_feishu(self, channel: NotificationChannel, alert: AlertEvent, is_recovery: bool):
         """发送飞书通知"""
@@ -570,6 +690,40 @@ class NotificationService:
         error_message: Optional[str]
     ):
         """记录通知"""
+        await self.record_notifications(channel, [alert], status, error_message)
+    
+    async def record_notifications(
+        self,
+        channel: NotificationChannel,
+        alerts: List[AlertEvent],
+        status: str,
+        error_message: Optional[str]
+    ):
+        """批量记录一次渠道发送的通知（每个告警一条记录）
+        
+        在一个会话中每 RECORD_INSERT_CHUNK 条 add_all 后提交一次，不再逐条开会话提交。
+        """
+        if not alerts:
+            return
+        
+        sent_at = int(time.time())
+        records = [self._build_record(channel, alert, status, error_message, sent_at) for alert in alerts]
+        
+        # 使用独立的数据库会话保存记录
+        async with self.db_manager.session() as db:
+            for i in range(0, len(records), self.RECORD_INSERT_CHUNK):
+                db.add_all(records[i:i + self.RECORD_INSERT_CHUNK])
+                await db.commit()
+    
+    @staticmethod
+    def _build_record(
+        channel: NotificationChannel,
+        alert: AlertEvent,
+        status: str,
+        error_message: Optional[str],
+        sent_at: int
+    ) -> NotificationRecord:
+        """构建单个告警的通知记录"""
         # 构建可序列化的告警内容（去除 datetime 对象）
         content = {
             "fingerprint": alert.fingerprint,
@@ -596,14 +750,10 @@ class NotificationService:
             status=status,
             error_message=error_message,
             content=content,
-            sent_at=int(time.time()),
+            sent_at=sent_at,
             tenant_id=alert.tenant_id
         )
-        
-        # 使用独立的数据库会话保存记录
-        async with self.db_manager.session() as db:
-            db.add(record)
-            await db.commit()
+        return record
     
     # ===== 批量告警发送方法 =====
     
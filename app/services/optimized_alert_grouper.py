@@ -1,11 +1,256 @@
-"""优化的基于 Redis 的分布式告警分组器 - 使用 Pipeline 和异步处理"""
+"""优化的基于 Redis 的分布式告警分组器 - 使用 Pipeline 和异步处理
+
+存储结构（每个分组两个 hash）：
+- alert:group:{firing|recovery}:{group_key}          分组元数据（HASH）
+- alert:group:members:{firing|recovery}:{group_key}  分组成员（HASH: 指纹 -> 告警快照 JSON）
+- alert:group:index:due:{slot}                        到期时间索引（ZSET: 元数据键 -> 下次到期时间），按槽位分片
+- alert:group:index:fingerprint                       指纹索引（HASH: 指纹 -> firing 分组元数据键）
+- alert:group:stats                                   统计计数（HASH: firing_groups / recovery_groups / sent_groups / total_alerts）
+- alert:group:stats:counted                           已计入统计的分组（HASH: 元数据键 -> 类型:是否已发送:告警数，不过期）
+
+分组键按 CRC32 映射到固定数量的槽位（恢复分组与对应 firing 分组同槽），每个槽位一个到期索引，
+分组工作器只读取自己持有租约的槽位（见 app.core.slot_lease）。
+所有修改分组的操作都由服务端 Lua 脚本完成，单次往返、原子执行，并同步维护统计计数；
+统计按每个分组已计入的值增减，分组因 TTL 过期后由 READY_GROUPS_SCRIPT 按记录扣减；
+添加一个告警只传输该告警本身，与分组大小无关。
+脚本会访问元数据中记录的成员键，需部署在单实例 / 主从 Redis 上（非 Cluster）。
+"""
 import json
 import time
 import asyncio
-from typing import List, Dict, Optional, Set
+from typing import Any, List, Dict, Optional, Set
 from loguru import logger
 import redis.asyncio as redis
 from app.models.alert import AlertEvent, AlertRule
+from app.services.alert_snapshot import AlertSnapshot
+from app.services.alert_grouper import resolve_group_timing
+from app.services.notification_priority import group_priority, rule_priority
+from app.core.lru_cache import LRUCache
+from app.core.slot_lease import DEFAULT_SLOTS, slot_of
+
+
+# Lua 公共函数：根据分组元数据计算下次到期时间
+# - 未发送：created_at + group_wait
+# - 已发送且之后有新告警加入：last_sent_at + group_interval
+# - 已发送且无变化：last_sent_at + repeat_interval
+# 时间参数优先使用元数据中按规则保存的值，缺失时（旧分组）使用传入的全局配置
+_LUA_NEXT_DUE = """
+local function next_due(meta_key, group_wait, group_interval, repeat_interval)
+    local f = redis.call('HMGET', meta_key, 'sent', 'created_at', 'last_updated_at', 'last_sent_at',
+        'group_wait', 'group_interval', 'repeat_interval')
+    if f[1] ~= '1' then
+        return tonumber(f[2]) + (tonumber(f[5]) or group_wait)
+    end
+    local last_sent_at = tonumber(f[4])
+    if tonumber(f[3]) > last_sent_at then
+        return last_sent_at + (tonumber(f[6]) or group_interval)
+    end
+    return last_sent_at + (tonumber(f[7]) or repeat_interval)
+end
+"""
+
+# Lua 公共函数：更新分组计入统计的值，按与上次记录的差值增减统计计数
+# 记录保存在不过期的 counted_key 中，分组因 TTL 过期后仍可按记录扣减；kind 为 false 表示分组已删除
+_LUA_COUNT_GROUP = """
+local function count_group(stats_key, counted_key, meta_key, kind, sent, size)
+    local deltas = {firing_groups = 0, recovery_groups = 0, sent_groups = 0, total_alerts = 0}
+    local old = redis.call('HGET', counted_key, meta_key)
+    if old then
+        local old_kind, old_sent, old_size = string.match(old, '^(%a+):(%d):(%d+)$')
+        deltas[old_kind .. '_groups'] = -1
+        deltas['sent_groups'] = -tonumber(old_sent)
+        deltas['total_alerts'] = -tonumber(old_size)
+    end
+    if kind then
+        deltas[kind .. '_groups'] = deltas[kind .. '_groups'] + 1
+        deltas['sent_groups'] = deltas['sent_groups'] + (sent == '1' and 1 or 0)
+        deltas['total_alerts'] = deltas['total_alerts'] + size
+        redis.call('HSET', counted_key, meta_key, kind .. ':' .. (sent == '1' and '1' or '0') .. ':' .. size)
+    elseif old then
+        redis.call('HDEL', counted_key, meta_key)
+    end
+    for field, delta in pairs(deltas) do
+        if delta ~= 0 then
+            redis.call('HINCRBY', stats_key, field, delta)
+        end
+    end
+end
+"""
+
+# Lua 脚本：向分组追加告警（分组不存在时创建）
+# KEYS[1]=元数据键 KEYS[2]=成员键 KEYS[3]=分组所在槽位的到期索引 KEYS[4]=指纹索引 KEYS[5]=统计计数
+# KEYS[6]=已计入统计的分组
+# ARGV[1]=当前时间 ARGV[2]=最短 TTL（只延长） ARGV[3..5]=该分组（按规则解析）的 group_wait/group_interval/repeat_interval
+# ARGV[6]=分组键 ARGV[7]=分组标签 JSON ARGV[8]=规则 ID ARGV[9]=规则名称
+# ARGV[10]=分组类型（firing 分组登记指纹索引 / recovery） ARGV[11]=规则配置的通知优先级（未配置为空）
+# ARGV[12..]=指纹, 快照 JSON 成对出现
+# 返回 {新增告警数, 是否新建分组}
+ADD_ALERTS_SCRIPT = _LUA_NEXT_DUE + _LUA_COUNT_GROUP + """
+local created = redis.call('HSETNX', KEYS[1], 'created_at', ARGV[1])
+if created == 1 then
+    redis.call('HSET', KEYS[1],
+        'group_key', ARGV[6], 'group_labels', ARGV[7],
+        'rule_id', ARGV[8], 'rule_name', ARGV[9], 'kind', ARGV[10],
+        'members_key', KEYS[2], 'sent', 0, 'last_sent_at', 0,
+        'last_updated_at', ARGV[1])
+end
+-- 每次追加都刷新时间参数，规则修改后对已有分组生效
+redis.call('HSET', KEYS[1], 'group_wait', ARGV[3], 'group_interval', ARGV[4], 'repeat_interval', ARGV[5],
+    'due_key', KEYS[3], 'priority', ARGV[11])
+
+local added = 0
+for i = 12, #ARGV, 2 do
+    if redis.call('HSETNX', KEYS[2], ARGV[i], ARGV[i + 1]) == 1 then
+        added = added + 1
+        if ARGV[10] == 'firing' then
+            redis.call('HSET', KEYS[4], ARGV[i], KEYS[1])
+        end
+    end
+end
+
+if added > 0 then
+    redis.call('HSET', KEYS[1], 'last_updated_at', ARGV[1])
+end
+-- 同名分组过期后重建时，按旧记录扣减后重新计入
+if added > 0 or created == 1 then
+    count_group(KEYS[5], KEYS[6], KEYS[1], ARGV[10], redis.call('HGET', KEYS[1], 'sent'), redis.call('HLEN', KEYS[2]))
+end
+-- 只延长过期时间，不覆盖 MARK_SENT_SCRIPT 按下一次重复发送设置的更长 TTL
+for k = 1, 2 do
+    if redis.call('TTL', KEYS[k]) < tonumber(ARGV[2]) then
+        redis.call('EXPIRE', KEYS[k], ARGV[2])
+    end
+end
+redis.call('ZADD', KEYS[3], next_due(KEYS[1], tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5])), KEYS[1])
+return {added, created}
+"""
+
+# Lua 脚本：取出一个槽位中所有已到期的分组，顺带清理已过期 / 为空的分组
+# KEYS[1]=槽位到期索引 KEYS[2]=统计计数 KEYS[3]=已计入统计的分组 ARGV[1]=当前时间 ARGV[2..4]=group_wait/group_interval/repeat_interval
+# ARGV[5]=租约（秒）：大于 0 时把取出的分组到期时间推后到 当前时间 + 租约，租约内不会被再次取出
+# 返回 {{元数据键, 元数据(HGETALL), 成员快照列表}, ...}
+READY_GROUPS_SCRIPT = _LUA_NEXT_DUE + _LUA_COUNT_GROUP + """
+local now = tonumber(ARGV[1])
+local ready = {}
+for _, meta_key in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])) do
+    local members_key = redis.call('HGET', meta_key, 'members_key')
+    if (not members_key) or redis.call('HLEN', members_key) == 0 then
+        count_group(KEYS[2], KEYS[3], meta_key, false)
+        redis.call('DEL', meta_key)
+        redis.call('ZREM', KEYS[1], meta_key)
+    else
+        local due = next_due(meta_key, tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4]))
+        if due <= now then
+            table.insert(ready, {meta_key, redis.call('HGETALL', meta_key), redis.call('HVALS', members_key)})
+            if tonumber(ARGV[5]) > 0 then
+                redis.call('ZADD', KEYS[1], now + tonumber(ARGV[5]), meta_key)
+            end
+        else
+            redis.call('ZADD', KEYS[1], due, meta_key)
+        end
+    end
+end
+return ready
+"""
+
+# Lua 脚本：标记分组已发送，并把到期时间推后到下一次发送
+# 分组保留到其中的告警全部恢复为止，过期时间延长到下一次重复发送之后
+# KEYS[1]=元数据键 KEYS[2]=槽位到期索引 KEYS[3]=统计计数 KEYS[4]=已计入统计的分组
+# ARGV[1]=当前时间 ARGV[2..4]=group_wait/group_interval/repeat_interval ARGV[5]=基础 TTL
+MARK_SENT_SCRIPT = _LUA_NEXT_DUE + _LUA_COUNT_GROUP + """
+local f = redis.call('HMGET', KEYS[1], 'sent', 'members_key', 'kind')
+local sent = f[1]
+if not sent then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'sent', 1, 'last_sent_at', ARGV[1])
+if sent ~= '1' and f[2] and f[3] then
+    count_group(KEYS[3], KEYS[4], KEYS[1], f[3], '1', redis.call('HLEN', f[2]))
+end
+local due = next_due(KEYS[1], tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4]))
+redis.call('ZADD', KEYS[2], due, KEYS[1])
+local ttl = math.ceil(due - tonumber(ARGV[1])) + tonumber(ARGV[5])
+redis.call('EXPIRE', KEYS[1], ttl)
+if f[2] then
+    redis.call('EXPIRE', f[2], ttl)
+end
+return 1
+"""
+
+# Lua 脚本：按指纹索引从所属 firing 分组中移除告警，分组为空时一并删除
+# KEYS[1]=指纹索引 KEYS[2]=统计计数 KEYS[3]=已计入统计的分组 ARGV[1]=指纹
+# 分组所在槽位的到期索引从元数据的 due_key 读取；元数据已不存在时留给 READY_GROUPS_SCRIPT 清理
+# 返回 {状态, 元数据键}：0=未找到 1=已移除 2=已移除且分组被删除
+REMOVE_ALERT_SCRIPT = _LUA_COUNT_GROUP + """
+local meta_key = redis.call('HGET', KEYS[1], ARGV[1])
+if not meta_key then
+    return {0, ''}
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+
+local f = redis.call('HMGET', meta_key, 'members_key', 'due_key', 'kind', 'sent')
+local members_key = f[1]
+if not members_key then
+    return {0, meta_key}
+end
+if redis.call('HDEL', members_key, ARGV[1]) == 0 then
+    return {0, meta_key}
+end
+local size = redis.call('HLEN', members_key)
+if size == 0 then
+    count_group(KEYS[2], KEYS[3], meta_key, false)
+    redis.call('DEL', meta_key)
+    if f[2] then
+        redis.call('ZREM', f[2], meta_key)
+    end
+    return {2, meta_key}
+end
+count_group(KEYS[2], KEYS[3], meta_key, f[3] or 'firing', f[4], size)
+return {1, meta_key}
+"""
+
+# Lua 脚本：删除分组，同时清理指纹索引和到期索引
+# KEYS[1]=元数据键 KEYS[2]=指纹索引 KEYS[3]=槽位到期索引 KEYS[4]=统计计数 KEYS[5]=已计入统计的分组
+CLEAR_GROUP_SCRIPT = _LUA_COUNT_GROUP + """
+local members_key = redis.call('HGET', KEYS[1], 'members_key')
+count_group(KEYS[4], KEYS[5], KEYS[1], false)
+if members_key then
+    for _, fingerprint in ipairs(redis.call('HKEYS', members_key)) do
+        if redis.call('HGET', KEYS[2], fingerprint) == KEYS[1] then
+            redis.call('HDEL', KEYS[2], fingerprint)
+        end
+    end
+    redis.call('DEL', members_key)
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[3], KEYS[1])
+return 1
+"""
+
+# Lua 脚本：按已计入统计的分组记录重算统计计数（原子执行，不受并发增减影响）
+# 元数据已不存在的记录一并清理（正常情况下由 READY_GROUPS_SCRIPT 在到期时清理）
+# KEYS[1]=统计计数 KEYS[2]=已计入统计的分组
+# 返回 {firing_groups, recovery_groups, sent_groups, total_alerts, 清理的记录数}
+RECONCILE_STATS_SCRIPT = """
+local totals = {firing_groups = 0, recovery_groups = 0, sent_groups = 0, total_alerts = 0}
+local pruned = 0
+local flat = redis.call('HGETALL', KEYS[2])
+for i = 1, #flat, 2 do
+    if redis.call('EXISTS', flat[i]) == 0 then
+        redis.call('HDEL', KEYS[2], flat[i])
+        pruned = pruned + 1
+    else
+        local kind, sent, size = string.match(flat[i + 1], '^(%a+):(%d):(%d+)$')
+        totals[kind .. '_groups'] = totals[kind .. '_groups'] + 1
+        totals['sent_groups'] = totals['sent_groups'] + tonumber(sent)
+        totals['total_alerts'] = totals['total_alerts'] + tonumber(size)
+    end
+end
+redis.call('HSET', KEYS[1],
+    'firing_groups', totals['firing_groups'], 'recovery_groups', totals['recovery_groups'],
+    'sent_groups', totals['sent_groups'], 'total_alerts', totals['total_alerts'])
+return {totals['firing_groups'], totals['recovery_groups'], totals['sent_groups'], totals['total_alerts'], pruned}
+"""
 
 
 class OptimizedAlertGrouper:
@@ -17,8 +262,16 @@ class OptimizedAlertGrouper:
     3. 并发控制 - 使用信号量限制并发
     4. 批量读写 - 减少 Redis 操作次数
     5. 内存缓存 - 减少重复读取
+    6. 到期时间索引 - 分组按下次到期时间登记在有序集合中，就绪检查只读取已到期的分组
+    7. 指纹反向索引 - 告警恢复时直接定位所属分组，Lua 脚本一次往返完成移除
+    8. 元数据 + 成员 hash 存储 - 添加告警为 O(1)，并发写入不会互相覆盖
+    9. 增量统计计数 - 统计查询一次往返，按已计入的分组记录定期校准
+    10. 槽位分片 - 到期索引按槽位分片，多个工作器各自处理持有租约的槽位，互不竞争
     """
     
+    # 缓存分组时，每个分组除成员快照外的估算开销（字节）
+    CACHE_GROUP_OVERHEAD = 512
+    
     def __init__(self, redis_client: redis.Redis, max_concurrent: int = 100):
         self.redis = redis_client
         self.group_wait = 10  # 分组等待时间（秒）
@@ -28,6 +281,17 @@ class OptimizedAlertGrouper:
         # Redis 键前缀
         self.firing_prefix = "alert:group:firing"
         self.recovery_prefix = "alert:group:recovery"
+        self.members_prefix = "alert:group:members"
+        self.due_index_prefix = "alert:group:index:due"  # ZSET（按槽位分片）: 分组 Redis 键 -> 下次到期时间
+        self.legacy_due_index_key = self.due_index_prefix  # 分片前的单一到期索引，重建时迁移
+        self.num_slots = DEFAULT_SLOTS
+        self.fingerprint_index_key = "alert:group:index:fingerprint"  # HASH: 指纹 -> firing 分组 Redis 键
+        self.stats_key = "alert:group:stats"  # HASH: 增量维护的分组统计计数
+        self.stats_counted_key = "alert:group:stats:counted"  # HASH: 分组 Redis 键 -> 计入统计的 类型:是否已发送:告警数
+        self.group_ttl = 7200  # 分组过期时间（秒）
+        self.stats_reconcile_interval = 600  # 统计计数校准间隔（秒），由分组工作器执行
+        self.stats_reconcile_lock_key = "alert:group:stats:reconcile"  # 校准租约，每个间隔只由一个实例执行
+        self._stats_reconciled_at = 0.0
         
         # 性能优化配置
         self.max_concurrent = max_concurrent
@@ -36,10 +300,17 @@ class OptimizedAlertGrouper:
         self.batch_queue: List[tuple] = []  # 批处理队列
         self.batch_lock = asyncio.Lock()
         
-        # 内存缓存（减少 Redis 读取）
-        self.group_cache: Dict[str, dict] = {}
+        # 内存缓存（减少 Redis 读取），按条目数 / 字节数 / TTL 限制，长期运行内存不增长
         self.cache_ttl = 5  # 缓存 TTL（秒）
-        self.cache_timestamps: Dict[str, float] = {}
+        self.group_cache = LRUCache(max_entries=2000, max_bytes=32 * 1024 * 1024, ttl=self.cache_ttl)
+        
+        # Lua 脚本（EVALSHA，脚本未缓存时自动回退到 EVAL）
+        self._add_alerts_script = self.redis.register_script(ADD_ALERTS_SCRIPT)
+        self._ready_groups_script = self.redis.register_script(READY_GROUPS_SCRIPT)
+        self._mark_sent_script = self.redis.register_script(MARK_SENT_SCRIPT)
+        self._remove_alert_script = self.redis.register_script(REMOVE_ALERT_SCRIPT)
+        self._clear_group_script = self.redis.register_script(CLEAR_GROUP_SCRIPT)
+        self._reconcile_stats_script = self.redis.register_script(RECONCILE_STATS_SCRIPT)
         
         logger.info(f"✨ 优化告警分组器初始化: max_concurrent={max_concurrent}, batch_size={self.batch_size}")
     
@@ -48,6 +319,22 @@ class OptimizedAlertGrouper:
         prefix = self.recovery_prefix if is_recovery else self.firing_prefix
         return f"{prefix}:{group_key}"
     
+    def _get_due_key(self, group_key: str) -> str:
+        """分组所在槽位的到期索引键（恢复分组与对应 firing 分组同槽）"""
+        if group_key.startswith("recovery:"):
+            group_key = group_key[len("recovery:"):]
+        return f"{self.due_index_prefix}:{slot_of(group_key, self.num_slots)}"
+    
+    def _all_due_keys(self, slots: Optional[Set[int]] = None) -> List[str]:
+        """指定槽位（默认全部槽位）的到期索引键"""
+        if slots is None:
+            slots = range(self.num_slots)
+        return [f"{self.due_index_prefix}:{slot}" for slot in sorted(slots)]
+    
+    def _get_members_key(self, redis_key: str) -> str:
+        """根据分组元数据键生成成员键"""
+        return f"{self.members_prefix}:{redis_key[len('alert:group:'):]}"
+    
     def _generate_group_key(self, alert: AlertEvent, rule: AlertRule) -> tuple:
         """
         生成分组键
@@ -68,88 +355,281 @@ class OptimizedAlertGrouper:
         group_key = "|".join(group_parts)
         return group_key, group_labels
     
-    def _is_cache_valid(self, redis_key: str) -> bool:
-        """检查缓存是否有效"""
-        if redis_key not in self.cache_timestamps:
-            return False
-        return (time.time() - self.cache_timestamps[redis_key]) < self.cache_ttl
+    @staticmethod
+    def _alert_snapshot(alert: AlertEvent) -> dict:
+        """生成分组中保存的告警快照（包含发送通知所需的全部字段）"""
+        return AlertSnapshot.from_alert(alert).to_dict()
+    
+    @staticmethod
+    def _parse_group(meta: Dict[str, str], members: List[str]) -> dict:
+        """把元数据 hash 和成员快照组装为分组字典"""
+        alerts = [json.loads(member) for member in members]
+        alerts.sort(key=lambda a: (a.get("started_at") or 0, a["fingerprint"]))
+        return {
+            "group_key": meta.get("group_key"),
+            "group_labels": json.loads(meta.get("group_labels") or "{}"),
+            "rule_id": int(meta["rule_id"]) if meta.get("rule_id") else None,
+            "rule_name": meta.get("rule_name"),
+            "alerts": alerts,
+            "priority": group_priority((a.get("severity") for a in alerts), meta.get("priority")),
+            "created_at": float(meta.get("created_at") or 0),
+            "last_updated_at": float(meta.get("last_updated_at") or 0),
+            "last_sent_at": float(meta.get("last_sent_at") or 0),
+            "sent": meta.get("sent") == "1",
+            "group_wait": int(meta["group_wait"]) if meta.get("group_wait") else None,
+            "group_interval": int(meta["group_interval"]) if meta.get("group_interval") else None,
+            "repeat_interval": int(meta["repeat_interval"]) if meta.get("repeat_interval") else None
+        }
+    
+    def _timing_args(self, rule: Optional[AlertRule] = None) -> List[Any]:
+        """Lua 脚本使用的分组时间参数（传入规则时按规则解析，否则为全局配置）"""
+        return list(resolve_group_timing(rule, self.group_wait, self.group_interval, self.repeat_interval))
+    
+    def _cache_group(self, redis_key: str, group: dict, members: List[str]):
+        """缓存分组，按成员快照 JSON 长度估算占用字节数"""
+        size = sum(len(member) for member in members) + self.CACHE_GROUP_OVERHEAD
+        self.group_cache.set(redis_key, group, size=size)
     
     async def _get_group_from_cache_or_redis(self, redis_key: str) -> Optional[dict]:
         """从缓存或 Redis 获取分组数据"""
         # 检查内存缓存
-        if self._is_cache_valid(redis_key):
-            return self.group_cache.get(redis_key)
+        group = self.group_cache.get(redis_key)
+        if group is not None:
+            return group
         
-        # 从 Redis 读取
-        group_data = await self.redis.get(redis_key)
-        if group_data:
-            group = json.loads(group_data)
+        # 从 Redis 读取（元数据 + 成员一次往返）
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(redis_key)
+            pipe.hvals(self._get_members_key(redis_key))
+            meta, members = await pipe.execute()
+        
+        if meta and members:
+            group = self._parse_group(meta, members)
             # 更新缓存
-            self.group_cache[redis_key] = group
-            self.cache_timestamps[redis_key] = time.time()
+            self._cache_group(redis_key, group, members)
             return group
         
         return None
     
     def _invalidate_cache(self, redis_key: str):
         """使缓存失效"""
-        self.group_cache.pop(redis_key, None)
-        self.cache_timestamps.pop(redis_key, None)
+        self.group_cache.pop(redis_key)
+    
+    def _update_cached_group(self, redis_key: str, snapshots: List[dict], current_time: float):
+        """已缓存的分组就地追加新成员（未缓存的不主动加载）"""
+        group = self.group_cache.peek(redis_key)
+        if group is None:
+            return
+        existing = {a["fingerprint"] for a in group["alerts"]}
+        new_alerts = [a for a in snapshots if a["fingerprint"] not in existing]
+        if new_alerts:
+            group["alerts"].extend(new_alerts)
+            group["last_updated_at"] = current_time
+            self.group_cache.add_size(redis_key, sum(len(json.dumps(a)) for a in new_alerts))
+    
+    def _compute_next_due(self, group: dict) -> float:
+        """
+        计算分组下次到期时间（与 Lua 脚本中的 next_due 一致）
+        
+        - 未发送：created_at + group_wait
+        - 已发送且之后有新告警加入：last_sent_at + group_interval
+        - 已发送且无变化：last_sent_at + repeat_interval
+        """
+        group_wait = self.group_wait if group.get("group_wait") is None else group["group_wait"]
+        group_interval = self.group_interval if group.get("group_interval") is None else group["group_interval"]
+        repeat_interval = self.repeat_interval if group.get("repeat_interval") is None else group["repeat_interval"]
+        
+        if not group.get("sent"):
+            return group["created_at"] + group_wait
+        
+        last_sent_at = group.get("last_sent_at", group["last_updated_at"])
+        if group["last_updated_at"] > last_sent_at:
+            return last_sent_at + group_interval
+        return last_sent_at + repeat_interval
+    
+    async def _queue_add(
+        self,
+        pipe,
+        redis_key: str,
+        group_key: str,
+        group_labels: dict,
+        rule: AlertRule,
+        snapshots: List[dict],
+        current_time: float,
+        is_recovery: bool
+    ):
+        """在 Pipeline 中排入一次分组追加（ADD_ALERTS_SCRIPT）"""
+        timing = self._timing_args(rule)
+        args = [
+            current_time, self.group_ttl + timing[0], *timing,
+            group_key, json.dumps(group_labels), rule.id, rule.name,
+            "recovery" if is_recovery else "firing", rule_priority(rule) or "",
+        ]
+        for snapshot in snapshots:
+            args.extend([snapshot["fingerprint"], json.dumps(snapshot)])
+        
+        await self._add_alerts_script(
+            keys=[
+                redis_key, self._get_members_key(redis_key), self._get_due_key(group_key),
+                self.fingerprint_index_key, self.stats_key, self.stats_counted_key
+            ],
+            args=args,
+            client=pipe
+        )
+    
+    async def rebuild_due_index(self):
+        """
+        重建到期时间索引和指纹索引（启动时执行一次）
+        
+        - 升级前以 JSON 字符串保存的分组转换为元数据 + 成员 hash
+        - 所有分组登记到所在槽位的到期索引，分片前的单一到期索引迁移后删除
+        - 清理到期索引中已过期的分组
+        """
+        keys = []
+        async for key in self.redis.scan_iter(match=f"{self.firing_prefix}:*", count=100):
+            keys.append(key)
+        async for key in self.redis.scan_iter(match=f"{self.recovery_prefix}:*", count=100):
+            keys.append(key)
+        
+        due_keys = self._all_due_keys()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for due_key in due_keys:
+                pipe.zrange(due_key, 0, -1)
+            indexed = await pipe.execute()
+        existing = set(keys)
+        stale = {
+            due_key: [key for key in members if key not in existing]
+            for due_key, members in zip(due_keys, indexed)
+        }
+        
+        if keys:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.type(key)
+                key_types = await pipe.execute()
+            
+            legacy_keys = [key for key, key_type in zip(keys, key_types) if key_type == "string"]
+            hash_keys = [key for key, key_type in zip(keys, key_types) if key_type == "hash"]
+            
+            if legacy_keys:
+                await self._convert_legacy_groups(legacy_keys)
+            
+            if hash_keys:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for key in hash_keys:
+                        pipe.hgetall(key)
+                        pipe.hkeys(self._get_members_key(key))
+                    results = await pipe.execute()
+                
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for key, meta, fingerprints in zip(hash_keys, results[::2], results[1::2]):
+                        if not meta or not fingerprints:
+                            pipe.delete(key)
+                            continue
+                        group = self._parse_group(meta, [])
+                        due_key = self._get_due_key(group["group_key"] or "")
+                        if meta.get("due_key") not in (None, due_key):
+                            pipe.zrem(meta["due_key"], key)
+                        pipe.hset(key, "due_key", due_key)
+                        pipe.zadd(due_key, {key: self._compute_next_due(group)})
+                        # 升级前的分组补登统计记录（已有记录由 Lua 脚本维护，不覆盖）
+                        pipe.hsetnx(self.stats_counted_key, key, self._counted_value(meta, len(fingerprints)))
+                        if key.startswith(f"{self.firing_prefix}:"):
+                            pipe.hset(self.fingerprint_index_key, mapping={fp: key for fp in fingerprints})
+                    await pipe.execute()
+        
+        stale = {due_key: members for due_key, members in stale.items() if members}
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for due_key, members in stale.items():
+                pipe.zrem(due_key, *members)
+            pipe.delete(self.legacy_due_index_key)
+            await pipe.execute()
+        
+        await self.reconcile_stats()
+        cleaned = sum(len(members) for members in stale.values())
+        logger.info(f"分组到期索引已重建: 分组数={len(keys)}, 槽位数={self.num_slots}, 清理={cleaned}")
+    
+    async def _convert_legacy_groups(self, legacy_keys: List[str]):
+        """把旧版 JSON 字符串分组转换为元数据 + 成员 hash"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in legacy_keys:
+                pipe.get(key)
+            results = await pipe.execute()
+        
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for key, group_data in zip(legacy_keys, results):
+                pipe.delete(key)
+                if not group_data:
+                    continue
+                group = json.loads(group_data)
+                if not group.get("alerts"):
+                    continue
+                
+                members_key = self._get_members_key(key)
+                due_key = self._get_due_key(group["group_key"])
+                pipe.hset(key, mapping={
+                    "group_key": group["group_key"],
+                    "group_labels": json.dumps(group.get("group_labels", {})),
+                    "rule_id": group.get("rule_id") or "",
+                    "rule_name": group.get("rule_name") or "",
+                    "kind": "firing" if key.startswith(f"{self.firing_prefix}:") else "recovery",
+                    "members_key": members_key,
+                    "due_key": due_key,
+                    "created_at": group["created_at"],
+                    "last_updated_at": group["last_updated_at"],
+                    "last_sent_at": group.get("last_sent_at", 0),
+                    "sent": 1 if group.get("sent") else 0,
+                })
+                pipe.hset(members_key, mapping={a["fingerprint"]: json.dumps(a) for a in group["alerts"]})
+                pipe.expire(key, self.group_ttl)
+                pipe.expire(members_key, self.group_ttl)
+                pipe.hset(self.stats_counted_key, key, self._counted_value(
+                    {"kind": "firing" if key.startswith(f"{self.firing_prefix}:") else "recovery",
+                     "sent": "1" if group.get("sent") else "0"},
+                    len({a["fingerprint"] for a in group["alerts"]})
+                ))
+                pipe.zadd(due_key, {key: self._compute_next_due(group)})
+                if key.startswith(f"{self.firing_prefix}:"):
+                    pipe.hset(self.fingerprint_index_key, mapping={a["fingerprint"]: key for a in group["alerts"]})
+            await pipe.execute()
+        
+        logger.info(f"已转换旧版分组数据: {len(legacy_keys)} 个")
+    
+    async def get_next_due_time(self, slots: Optional[Set[int]] = None) -> Optional[float]:
+        """获取指定槽位（默认全部槽位）中最早到期的分组时间，无分组时返回 None"""
+        due_keys = self._all_due_keys(slots)
+        if not due_keys:
+            return None
+        
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for due_key in due_keys:
+                pipe.zrange(due_key, 0, 0, withscores=True)
+            results = await pipe.execute()
+        
+        due_times = [float(earliest[0][1]) for earliest in results if earliest]
+        return min(due_times) if due_times else None
     
     async def add_alert(self, alert: AlertEvent, rule: AlertRule) -> str:
         """
-        添加告警到分组（优化版本）
+        添加告警到分组（Lua 脚本原子追加，只传输该告警的快照）
         
         返回: group_key
         """
         async with self.semaphore:  # 并发控制
             group_key, group_labels = self._generate_group_key(alert, rule)
             redis_key = self._get_group_key(group_key, is_recovery=False)
-            
-            # 从缓存或 Redis 获取现有分组数据
-            group = await self._get_group_from_cache_or_redis(redis_key)
+            snapshot = self._alert_snapshot(alert)
             current_time = time.time()
             
-            if not group:
-                # 创建新分组
-                group = {
-                    "group_key": group_key,
-                    "group_labels": group_labels,
-                    "rule_id": rule.id,
-                    "rule_name": rule.name,
-                    "alerts": [],
-                    "created_at": current_time,
-                    "last_updated_at": current_time,
-                    "sent": False
-                }
-                logger.debug(f"创建新的告警分组: {group_key}")
+            async with self.redis.pipeline(transaction=False) as pipe:
+                await self._queue_add(pipe, redis_key, group_key, group_labels, rule, [snapshot], current_time, False)
+                (added, created), = await pipe.execute()
             
-            # 添加告警（避免重复）
-            alert_fingerprints = {a["fingerprint"] for a in group["alerts"]}
-            if alert.fingerprint not in alert_fingerprints:
-                group["alerts"].append({
-                    "fingerprint": alert.fingerprint,
-                    "rule_name": alert.rule_name,
-                    "severity": alert.severity,
-                    "value": alert.value,
-                    "labels": alert.labels,
-                    "annotations": alert.annotations,
-                    "started_at": alert.started_at,
-                    "expr": alert.expr,
-                    "tenant_id": alert.tenant_id
-                })
-                group["last_updated_at"] = current_time
-                
-                # 使用 Pipeline 批量写入
-                async with self.redis.pipeline(transaction=True) as pipe:
-                    pipe.setex(redis_key, 7200, json.dumps(group))
-                    await pipe.execute()
-                
-                # 更新缓存
-                self.group_cache[redis_key] = group
-                self.cache_timestamps[redis_key] = current_time
-                
-                logger.debug(f"告警添加到分组: {group_key}, 当前告警数: {len(group['alerts'])}")
+            if created:
+                logger.debug(f"创建新的告警分组: {group_key}")
+            if added:
+                self._update_cached_group(redis_key, [snapshot], current_time)
+                logger.debug(f"告警添加到分组: {group_key}")
             
             return group_key
     
@@ -157,6 +637,8 @@ class OptimizedAlertGrouper:
         """
         批量添加告警到分组（高性能版本）
         
+        同一分组的告警合并为一次脚本调用，所有分组在一个 Pipeline 中提交。
+        
         参数:
             alerts_with_rules: List[(alert, rule)]
         
@@ -170,8 +652,6 @@ class OptimizedAlertGrouper:
         
         # 按分组键分组告警
         groups_map: Dict[str, dict] = {}
-        redis_keys_to_fetch: Set[str] = set()
-        
         for alert, rule in alerts_with_rules:
             group_key, group_labels = self._generate_group_key(alert, rule)
             redis_key = self._get_group_key(group_key, is_recovery=False)
@@ -180,82 +660,24 @@ class OptimizedAlertGrouper:
                 groups_map[redis_key] = {
                     "group_key": group_key,
                     "group_labels": group_labels,
-                    "rule_id": rule.id,
-                    "rule_name": rule.name,
-                    "alerts": [],
-                    "redis_key": redis_key
+                    "rule": rule,
+                    "snapshots": {}
                 }
-                redis_keys_to_fetch.add(redis_key)
-        
-        # 批量从 Redis 读取现有分组（使用 Pipeline）
-        if redis_keys_to_fetch:
-            async with self.redis.pipeline(transaction=False) as pipe:
-                for redis_key in redis_keys_to_fetch:
-                    # 先检查缓存
-                    if not self._is_cache_valid(redis_key):
-                        pipe.get(redis_key)
-                
-                results = await pipe.execute()
-                
-                # 处理结果
-                result_idx = 0
-                for redis_key in redis_keys_to_fetch:
-                    if self._is_cache_valid(redis_key):
-                        # 使用缓存数据
-                        cached_group = self.group_cache.get(redis_key)
-                        if cached_group:
-                            groups_map[redis_key].update(cached_group)
-                    elif result_idx < len(results) and results[result_idx]:
-                        # 使用 Redis 数据
-                        existing_group = json.loads(results[result_idx])
-                        groups_map[redis_key].update(existing_group)
-                        # 更新缓存
-                        self.group_cache[redis_key] = existing_group
-                        self.cache_timestamps[redis_key] = time.time()
-                        result_idx += 1
-        
-        # 添加告警到对应分组
-        current_time = time.time()
-        for alert, rule in alerts_with_rules:
-            group_key, _ = self._generate_group_key(alert, rule)
-            redis_key = self._get_group_key(group_key, is_recovery=False)
-            group = groups_map[redis_key]
-            
-            # 初始化时间戳（如果是新分组）
-            if "created_at" not in group:
-                group["created_at"] = current_time
-                group["last_updated_at"] = current_time
-                group["sent"] = False
-            
-            # 添加告警（避免重复）
-            alert_fingerprints = {a["fingerprint"] for a in group["alerts"]}
-            if alert.fingerprint not in alert_fingerprints:
-                group["alerts"].append({
-                    "fingerprint": alert.fingerprint,
-                    "rule_name": alert.rule_name,
-                    "severity": alert.severity,
-                    "value": alert.value,
-                    "labels": alert.labels,
-                    "annotations": alert.annotations,
-                    "started_at": alert.started_at,
-                    "expr": alert.expr,
-                    "tenant_id": alert.tenant_id
-                })
-                group["last_updated_at"] = current_time
+            groups_map[redis_key]["snapshots"].setdefault(alert.fingerprint, self._alert_snapshot(alert))
         
         # 批量写入 Redis（使用 Pipeline）
-        async with self.redis.pipeline(transaction=True) as pipe:
+        current_time = time.time()
+        async with self.redis.pipeline(transaction=False) as pipe:
             for redis_key, group in groups_map.items():
-                # 移除临时字段
-                group_to_save = {k: v for k, v in group.items() if k != "redis_key"}
-                pipe.setex(redis_key, 7200, json.dumps(group_to_save))
-                
-                # 更新缓存
-                self.group_cache[redis_key] = group_to_save
-                self.cache_timestamps[redis_key] = current_time
-            
+                await self._queue_add(
+                    pipe, redis_key, group["group_key"], group["group_labels"], group["rule"],
+                    list(group["snapshots"].values()), current_time, False
+                )
             await pipe.execute()
         
+        for redis_key, group in groups_map.items():
+            self._update_cached_group(redis_key, list(group["snapshots"].values()), current_time)
+        
         elapsed = time.time() - start_time
         logger.info(f"✅ 批量添加完成: {len(alerts_with_rules)} 个告警, {len(groups_map)} 个分组, 耗时 {elapsed:.3f}s")
         
@@ -263,7 +685,7 @@ class OptimizedAlertGrouper:
     
     async def add_recovery_alert(self, alert: AlertEvent, rule: AlertRule) -> str:
         """
-        添加恢复告警到分组（优化版本）
+        添加恢复告警到分组（Lua 脚本原子追加）
         
         返回: group_key
         """
@@ -271,247 +693,167 @@ class OptimizedAlertGrouper:
             group_key, group_labels = self._generate_group_key(alert, rule)
             recovery_key = f"recovery:{group_key}"
             redis_key = self._get_group_key(recovery_key, is_recovery=True)
-            
-            # 从缓存或 Redis 获取现有分组数据
-            group = await self._get_group_from_cache_or_redis(redis_key)
+            snapshot = self._alert_snapshot(alert)
             current_time = time.time()
             
-            if not group:
-                # 创建新恢复分组
-                group = {
-                    "group_key": recovery_key,
-                    "group_labels": group_labels,
-                    "rule_id": rule.id,
-                    "rule_name": rule.name,
-                    "alerts": [],
-                    "created_at": current_time,
-                    "last_updated_at": current_time,
-                    "sent": False
-                }
-                logger.debug(f"创建新的恢复告警分组: {recovery_key}")
+            async with self.redis.pipeline(transaction=False) as pipe:
+                await self._queue_add(pipe, redis_key, recovery_key, group_labels, rule, [snapshot], current_time, True)
+                (added, created), = await pipe.execute()
             
-            # 添加恢复告警
-            alert_fingerprints = {a["fingerprint"] for a in group["alerts"]}
-            if alert.fingerprint not in alert_fingerprints:
-                group["alerts"].append({
-                    "fingerprint": alert.fingerprint,
-                    "rule_name": alert.rule_name,
-                    "severity": alert.severity,
-                    "value": alert.value,
-                    "labels": alert.labels,
-                    "annotations": alert.annotations,
-                    "started_at": alert.started_at,
-                    "expr": alert.expr,
-                    "tenant_id": alert.tenant_id
-                })
-                group["last_updated_at"] = current_time
-                
-                # 使用 Pipeline 写入
-                async with self.redis.pipeline(transaction=True) as pipe:
-                    pipe.setex(redis_key, 7200, json.dumps(group))
-                    await pipe.execute()
-                
-                # 更新缓存
-                self.group_cache[redis_key] = group
-                self.cache_timestamps[redis_key] = current_time
-                
-                logger.debug(f"恢复告警添加到分组: {recovery_key}, 当前告警数: {len(group['alerts'])}")
+            if created:
+                logger.debug(f"创建新的恢复告警分组: {recovery_key}")
+            if added:
+                self._update_cached_group(redis_key, [snapshot], current_time)
+                logger.debug(f"恢复告警添加到分组: {recovery_key}")
             
             return recovery_key
     
-    async def get_ready_groups(self) -> List[tuple]:
+    async def get_ready_groups(self, lease: float = 0, slots: Optional[Set[int]] = None) -> List[tuple]:
         """
-        获取准备好发送的分组（优化版本）
+        获取准备好发送的分组（基于到期时间索引）
+        
+        由 Lua 脚本读取索引中已到期的分组及其成员，开销与就绪分组数成正比，
+        与分组总数无关。每个槽位一次脚本调用，所有槽位在一个 Pipeline 中提交。
+        
+        参数:
+            lease: 租约（秒），大于 0 时取出的分组在租约内不会被任何实例再次取出
+                （用于发布到通知队列，避免多实例重复发布）；0 表示发送完成前每轮都会返回
+            slots: 只读取这些槽位（当前工作器持有租约的槽位），None 表示全部槽位
         
         返回: List[tuple(group_data, is_recovery)]
         """
         ready_groups = []
         current_time = time.time()
+        self.group_cache.purge_expired()
         
-        # 使用 Pipeline 批量读取
-        firing_keys = []
-        recovery_keys = []
-        
-        # 收集所有键
-        async for key in self.redis.scan_iter(match=f"{self.firing_prefix}:*", count=100):
-            firing_keys.append(key)
+        due_keys = self._all_due_keys(slots)
+        if not due_keys:
+            return ready_groups
         
-        async for key in self.redis.scan_iter(match=f"{self.recovery_prefix}:*", count=100):
-            recovery_keys.append(key)
+        args = [current_time, *self._timing_args(), lease]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for due_key in due_keys:
+                await self._ready_groups_script(
+                    keys=[due_key, self.stats_key, self.stats_counted_key], args=args, client=pipe
+                )
+            results = await pipe.execute()
         
-        # 批量读取 firing 分组
-        if firing_keys:
-            async with self.redis.pipeline(transaction=False) as pipe:
-                for key in firing_keys:
-                    pipe.get(key)
-                results = await pipe.execute()
-                
-                for group_data in results:
-                    if group_data:
-                        group = json.loads(group_data)
-                        if self._is_group_ready(group, current_time):
-                            ready_groups.append((group, False))
-                            logger.debug(f"✅ firing 分组准备就绪: {group['group_key']}, 告警数: {len(group['alerts'])}")
-        
-        # 批量读取 recovery 分组
-        if recovery_keys:
-            async with self.redis.pipeline(transaction=False) as pipe:
-                for key in recovery_keys:
-                    pipe.get(key)
-                results = await pipe.execute()
-                
-                for group_data in results:
-                    if group_data:
-                        group = json.loads(group_data)
-                        if self._is_group_ready(group, current_time):
-                            ready_groups.append((group, True))
-                            logger.debug(f"✅ recovery 分组准备就绪: {group['group_key']}, 告警数: {len(group['alerts'])}")
+        for redis_key, meta_flat, members in (group for slot_groups in results for group in slot_groups):
+            meta = dict(zip(meta_flat[::2], meta_flat[1::2]))
+            group = self._parse_group(meta, members)
+            is_recovery = redis_key.startswith(f"{self.recovery_prefix}:")
+            
+            self._cache_group(redis_key, group, members)
+            
+            ready_groups.append((group, is_recovery))
+            status_text = "recovery" if is_recovery else "firing"
+            logger.debug(f"✅ {status_text} 分组准备就绪: {group['group_key']}, 告警数: {len(group['alerts'])}")
         
         return ready_groups
     
-    def _is_group_ready(self, group: dict, current_time: float) -> bool:
-        """检查分组是否准备好发送"""
-        if not group.get("alerts"):
-            return False
-        
-        if group.get("sent"):
-            # 检查是否需要重复发送
-            if (current_time - group["last_updated_at"]) >= self.repeat_interval:
-                return True
-            return False
-        
-        # 检查等待时间
-        wait_time = current_time - group["created_at"]
-        return wait_time >= self.group_wait
+    async def get_group(self, group_key: str, is_recovery: bool = False) -> Optional[dict]:
+        """获取分组数据（优先使用内存缓存）"""
+        return await self._get_group_from_cache_or_redis(self._get_group_key(group_key, is_recovery))
     
     async def mark_group_sent(self, group_key: str, is_recovery: bool = False):
-        """标记分组为已发送（优化版本）"""
+        """标记分组为已发送（Lua 脚本更新状态和到期时间）"""
         redis_key = self._get_group_key(group_key, is_recovery)
+        current_time = time.time()
         
-        # 从缓存或 Redis 获取
-        group = await self._get_group_from_cache_or_redis(redis_key)
+        await self._mark_sent_script(
+            keys=[redis_key, self._get_due_key(group_key), self.stats_key, self.stats_counted_key],
+            args=[current_time, *self._timing_args(), self.group_ttl]
+        )
         
-        if group:
+        # 更新缓存
+        group = self.group_cache.peek(redis_key)
+        if group is not None:
             group["sent"] = True
-            
-            # 使用 Pipeline 写入
-            async with self.redis.pipeline(transaction=True) as pipe:
-                pipe.setex(redis_key, 7200, json.dumps(group))
-                await pipe.execute()
-            
-            # 更新缓存
-            self.group_cache[redis_key] = group
-            self.cache_timestamps[redis_key] = time.time()
+            group["last_sent_at"] = current_time
     
     async def clear_sent_group(self, group_key: str, is_recovery: bool = False):
         """清除已发送的分组"""
         redis_key = self._get_group_key(group_key, is_recovery)
         
-        # 使用 Pipeline 删除
-        async with self.redis.pipeline(transaction=True) as pipe:
-            pipe.delete(redis_key)
-            await pipe.execute()
+        # Lua 脚本删除分组并清理索引
+        await self._clear_group_script(
+            keys=[
+                redis_key, self.fingerprint_index_key, self._get_due_key(group_key),
+                self.stats_key, self.stats_counted_key
+            ]
+        )
         
         # 清除缓存
         self._invalidate_cache(redis_key)
         logger.debug(f"清除已发送分组: {group_key}")
     
     async def remove_alert_from_groups(self, fingerprint: str):
-        """从所有分组中移除指定的告警（优化版本）"""
-        # 收集所有需要更新的键
-        keys_to_update = []
-        
-        async for key in self.redis.scan_iter(match=f"{self.firing_prefix}:*", count=100):
-            keys_to_update.append(key)
-        
-        if not keys_to_update:
-            return
+        """
+        从所属 firing 分组中移除指定的告警（用于告警恢复）
         
-        # 批量读取
-        async with self.redis.pipeline(transaction=False) as pipe:
-            for key in keys_to_update:
-                pipe.get(key)
-            results = await pipe.execute()
+        通过指纹索引定位分组，Lua 脚本在一次往返内完成移除（分组为空时删除分组）。
+        """
+        status, redis_key = await self._remove_alert_script(
+            keys=[self.fingerprint_index_key, self.stats_key, self.stats_counted_key],
+            args=[fingerprint]
+        )
         
-        # 处理并批量写入
-        async with self.redis.pipeline(transaction=True) as pipe:
-            for key, group_data in zip(keys_to_update, results):
-                if group_data:
-                    group = json.loads(group_data)
-                    original_count = len(group["alerts"])
-                    group["alerts"] = [a for a in group["alerts"] if a["fingerprint"] != fingerprint]
-                    
-                    if len(group["alerts"]) < original_count:
-                        if group["alerts"]:
-                            pipe.setex(key, 7200, json.dumps(group))
-                            # 更新缓存
-                            self.group_cache[key] = group
-                            self.cache_timestamps[key] = time.time()
-                        else:
-                            pipe.delete(key)
-                            # 清除缓存
-                            self._invalidate_cache(key)
-            
-            await pipe.execute()
+        if redis_key:
+            self._invalidate_cache(redis_key)
+        if status:
+            logger.debug(f"告警已从分组移除: fingerprint={fingerprint}, group={redis_key}, group_deleted={status == 2}")
     
-    async def get_group_stats(self) -> Dict[str, int]:
-        """获取分组统计信息（优化版本）"""
-        firing_keys = []
-        recovery_keys = []
-        
-        # 收集所有键
-        async for key in self.redis.scan_iter(match=f"{self.firing_prefix}:*", count=100):
-            firing_keys.append(key)
-        
-        async for key in self.redis.scan_iter(match=f"{self.recovery_prefix}:*", count=100):
-            recovery_keys.append(key)
-        
-        total_alerts = 0
-        sent_count = 0
-        pending_count = 0
-        
-        # 批量读取 firing 分组
-        if firing_keys:
-            async with self.redis.pipeline(transaction=False) as pipe:
-                for key in firing_keys:
-                    pipe.get(key)
-                results = await pipe.execute()
-                
-                for group_data in results:
-                    if group_data:
-                        group = json.loads(group_data)
-                        total_alerts += len(group["alerts"])
-                        if group.get("sent"):
-                            sent_count += 1
-                        else:
-                            pending_count += 1
-        
-        # 批量读取 recovery 分组
-        if recovery_keys:
-            async with self.redis.pipeline(transaction=False) as pipe:
-                for key in recovery_keys:
-                    pipe.get(key)
-                results = await pipe.execute()
-                
-                for group_data in results:
-                    if group_data:
-                        group = json.loads(group_data)
-                        total_alerts += len(group["alerts"])
-                        if group.get("sent"):
-                            sent_count += 1
-                        else:
-                            pending_count += 1
+    async def get_group_stats(self) -> Dict[str, Any]:
+        """获取分组统计信息（读取增量计数，一次往返；校准由分组工作器定期执行）"""
+        counters = await self.redis.hgetall(self.stats_key)
+        firing_groups = max(int(counters.get("firing_groups", 0)), 0)
+        recovery_groups = max(int(counters.get("recovery_groups", 0)), 0)
+        sent_groups = max(int(counters.get("sent_groups", 0)), 0)
+        total_groups = firing_groups + recovery_groups
         
         return {
-            "total_groups": len(firing_keys) + len(recovery_keys),
-            "firing_groups": len(firing_keys),
-            "recovery_groups": len(recovery_keys),
-            "total_alerts": total_alerts,
-            "sent_groups": sent_count,
-            "pending_groups": pending_count,
-            "cache_size": len(self.group_cache)
+            "total_groups": total_groups,
+            "firing_groups": firing_groups,
+            "recovery_groups": recovery_groups,
+            "total_alerts": max(int(counters.get("total_alerts", 0)), 0),
+            "sent_groups": sent_groups,
+            "pending_groups": max(total_groups - sent_groups, 0),
+            "cache_size": len(self.group_cache),
+            "cache": self.group_cache.get_stats()
         }
     
+    @staticmethod
+    def _counted_value(meta: Dict[str, str], size: int) -> str:
+        """分组计入统计的记录值（与 Lua count_group 的格式一致）"""
+        return f"{meta.get('kind', 'firing')}:{'1' if meta.get('sent') == '1' else '0'}:{size}"
+    
+    async def reconcile_stats(self):
+        """
+        按已计入统计的分组记录重算统计计数
+        
+        分组的增删、发送和过期都通过 count_group 按差值维护计数和记录，
+        校准在 Lua 脚本中原子执行，直接以记录汇总覆盖计数，不会与并发更新交错；
+        同时清理元数据已不存在、且未经到期索引清理的记录。
+        """
+        firing, recovery, sent, total_alerts, pruned = await self._reconcile_stats_script(
+            keys=[self.stats_key, self.stats_counted_key]
+        )
+        logger.debug(
+            f"分组统计已校准: firing={firing}, recovery={recovery}, sent={sent}, "
+            f"告警数={total_alerts}, 清理记录={pruned}"
+        )
+    
+    async def reconcile_stats_if_due(self):
+        """到达校准间隔时校准统计计数（由分组工作器调用，SET NX 租约保证每个间隔只有一个实例执行）"""
+        if time.time() - self._stats_reconciled_at < self.stats_reconcile_interval:
+            return
+        self._stats_reconciled_at = time.time()
+        acquired = await self.redis.set(
+            self.stats_reconcile_lock_key, "1", nx=True, ex=self.stats_reconcile_interval
+        )
+        if acquired:
+            await self.reconcile_stats()
+    
     def configure(
         self, 
         group_wait: int = 10, 
@@ -530,5 +872,4 @@ class OptimizedAlertGrouper:
     async def clear_cache(self):
         """清除内存缓存"""
         self.group_cache.clear()
-        self.cache_timestamps.clear()
-        logger.info("内存缓存已清除")
\ No newline at end of file
+        logger.info("内存缓存已清除")
@@ -0,0 +1,279 @@
+"""PromQL 静态成本分析
+
+在保存告警规则时对表达式做轻量级静态分析（不依赖完整的 PromQL 解析器）：
+- 提取指标选择器（metric{...}）
+- 提取范围窗口（[5m]）和子查询（[1h:1m]）
+- 计算聚合嵌套深度
+- 可选：对每个选择器执行 count() 探测，估算序列基数
+
+并据此给出规则的成本评分（估算每分钟读取的样本数）和等级，
+调度器用该评分做准入控制和错峰。
+"""
+import re
+from typing import Any, Dict, List, Optional
+from loguru import logger
+
+
+# 成本等级阈值（每分钟估算读取样本数）
+COST_LEVEL_MEDIUM = 5e5
+COST_LEVEL_HEAVY = 5e6
+
+# 未探测基数时假设的每个选择器序列数
+DEFAULT_SERIES_ESTIMATE = 10
+
+# 估算样本数时假设的采集间隔（秒）
+ASSUMED_SCRAPE_INTERVAL = 15
+
+# 最多探测的选择器数量
+MAX_PROBE_SELECTORS = 5
+
+AGGREGATION_OPERATORS = {
+    'sum', 'avg', 'min', 'max', 'count', 'stddev', 'stdvar', 'group',
+    'topk', 'bottomk', 'quantile', 'count_values', 'limitk', 'limit_ratio',
+}
+
+KEYWORDS = {
+    'by', 'without', 'on', 'ignoring', 'group_left', 'group_right', 'bool',
+    'offset', 'and', 'or', 'unless', 'atan2', 'inf', 'nan',
+}
+
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800, 'y': 31536000}
+
+_STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|`[^`]*`')
+_DURATION_PART_RE = re.compile(r'(\d+)(ms|s|m|h|d|w|y)')
+_RANGE_RE = re.compile(r'\[\s*([0-9smhdwy]+)\s*(?::\s*([0-9smhdwy]*)\s*)?\]')
+_GROUPING_RE = re.compile(r'\b(by|without|on|ignoring|group_left|group_right)\s*\([^)]*\)', re.IGNORECASE)
+_OFFSET_RE = re.compile(r'\boffset\s+-?[0-9smhdwy]+', re.IGNORECASE)
+_IDENT_RE = re.compile(r'[a-zA-Z_:][a-zA-Z0-9_:]*')
+
+
+def parse_duration(text: str) -> int:
+    """解析 PromQL 时长（如 1h30m）为秒数，无法解析时返回 0"""
+    parts = _DURATION_PART_RE.findall(text or '')
+    if not parts or ''.join(n + u for n, u in parts) != text:
+        return 0
+    return int(sum(int(num) * DURATION_UNITS[unit] for num, unit in parts))
+
+
+def _mask_strings(expr: str) -> str:
+    """把字符串字面量替换为等长占位符，避免其中的括号和标识符干扰分析"""
+    return _STRING_RE.sub(lambda m: '"' + 'x' * (len(m.group(0)) - 2) + '"', expr)
+
+
+def extract_selectors(expr: str) -> List[str]:
+    """提取表达式中的指标选择器
+    
+    Returns:
+        List[str]: 去重后的选择器，如 ['http_requests_total{job="api"}']
+    """
+    masked = _mask_strings(expr)
+    cleaned = _GROUPING_RE.sub(' ', masked)
+    cleaned = _OFFSET_RE.sub(' ', cleaned)
+    cleaned = _RANGE_RE.sub(' ', cleaned)
+    
+    selectors = []
+    pos = 0
+    while pos < len(cleaned):
+        char = cleaned[pos]
+        if char == '{':
+            # 只有匹配器的选择器：{__name__=~"..."}
+            end = cleaned.find('}', pos)
+            end = len(cleaned) if end < 0 else end + 1
+            selectors.append(expr[pos:end].strip())
+            pos = end
+            continue
+        
+        match = _IDENT_RE.match(cleaned, pos) if (char.isalpha() or char in '_:') else None
+        if not match or (pos > 0 and (cleaned[pos - 1].isalnum() or cleaned[pos - 1] in '_.')):
+            pos += 1
+            continue
+        
+        name = match.group(0)
+        end = match.end()
+        rest = cleaned[end:].lstrip()
+        if rest.startswith('(') or name.lower() in KEYWORDS:
+            # 函数调用、聚合或关键字
+            pos = end
+            continue
+        
+        matchers = ''
+        if rest.startswith('{'):
+            start = cleaned.index('{', end)
+            close = cleaned.find('}', start)
+            close = len(cleaned) if close < 0 else close + 1
+            matchers = expr[start:close]
+            end = close
+        selectors.append(f"{name}{matchers}")
+        pos = end
+    
+    return list(dict.fromkeys(selectors))
+
+
+def extract_ranges(expr: str) -> List[Dict[str, int]]:
+    """提取范围窗口和子查询
+    
+    Returns:
+        List[Dict]: [{"range": 秒数, "step": 子查询步长秒数（0 表示非子查询）, "subquery": bool}]
+    """
+    ranges = []
+    for match in _RANGE_RE.finditer(_mask_strings(expr)):
+        range_seconds = parse_duration(match.group(1))
+        if not range_seconds:
+            continue
+        is_subquery = match.group(2) is not None
+        step = parse_duration(match.group(2)) if match.group(2) else 0
+        ranges.append({"range": range_seconds, "step": step, "subquery": is_subquery})
+    return ranges
+
+
+def aggregation_depth(expr: str) -> int:
+    """计算聚合运算的最大嵌套深度，如 max(sum(rate(x[5m]))) 为 2"""
+    masked = _GROUPING_RE.sub(' ', _mask_strings(expr))
+    stack: List[bool] = []
+    depth = 0
+    max_depth = 0
+    for match in re.finditer(r'([a-zA-Z_][a-zA-Z0-9_]*)?\s*\(|\)', masked):
+        token = match.group(0)
+        if token == ')':
+            if stack and stack.pop():
+                depth -= 1
+            continue
+        is_aggregation = (match.group(1) or '').lower() in AGGREGATION_OPERATORS
+        stack.append(is_aggregation)
+        if is_aggregation:
+            depth += 1
+            max_depth = max(max_depth, depth)
+    return max_depth
+
+
+def analyze_promql(expr: str) -> Dict[str, Any]:
+    """静态分析 PromQL 表达式
+    
+    Returns:
+        Dict: selectors / ranges / max_range / aggregation_depth / has_subquery
+    """
+    selectors = extract_selectors(expr)
+    ranges = extract_ranges(expr)
+    return {
+        "selectors": selectors,
+        "ranges": ranges,
+        "max_range": max((r["range"] for r in ranges), default=0),
+        "aggregation_depth": aggregation_depth(expr),
+        "has_subquery": any(r["subquery"] for r in ranges),
+    }
+
+
+def estimate_cost(
+    analysis: Dict[str, Any],
+    eval_interval: int,
+    series_estimate: Optional[int] = None
+) -> Dict[str, Any]:
+    """根据静态分析结果估算规则成本
+    
+    成本 = 每次评估读取的样本数 × 每分钟评估次数，其中：
+    - 每个选择器读取 序列数 × (窗口 / 采集间隔) 个样本，instant 选择器按 1 个样本计
+    - 子查询把内层表达式放大 窗口 / 步长 倍
+    - 每层聚合额外增加 10% 的计算开销
+    
+    Args:
+        analysis: analyze_promql 的返回值
+        eval_interval: 评估间隔（秒）
+        series_estimate: 探测到的序列总数，为空时使用默认假设
+    
+    Returns:
+        Dict: score / level / samples_per_eval / evals_per_minute / series_estimate / warnings
+    """
+    selectors = analysis.get("selectors", [])
+    ranges = analysis.get("ranges", [])
+    num_selectors = max(len(selectors), 1)
+    
+    if series_estimate is None:
+        series_estimate = DEFAULT_SERIES_ESTIMATE * num_selectors
+    series_estimate = max(int(series_estimate), 1)
+    
+    plain_ranges = [r["range"] for r in ranges if not r["subquery"]]
+    samples_per_series = max(max(plain_ranges, default=0) / ASSUMED_SCRAPE_INTERVAL, 1)
+    
+    subquery_factor = 1.0
+    for r in ranges:
+        if r["subquery"]:
+            step = r["step"] or max(eval_interval, 60)
+            subquery_factor *= max(r["range"] / step, 1)
+    
+    samples_per_eval = series_estimate * samples_per_series * subquery_factor
+    samples_per_eval *= 1 + 0.1 * analysis.get("aggregation_depth", 0)
+    
+    evals_per_minute = 60 / max(eval_interval, 1)
+    score = samples_per_eval * evals_per_minute
+    
+    if score >= COST_LEVEL_HEAVY:
+        level = "heavy"
+    elif score >= COST_LEVEL_MEDIUM:
+        level = "medium"
+    else:
+        level = "light"
+    
+    warnings = []
+    max_range = analysis.get("max_range", 0)
+    if max_range >= 86400 and eval_interval < 300:
+        warnings.append(f"范围窗口 {max_range}s 较大，但评估间隔只有 {eval_interval}s")
+    if analysis.get("has_subquery"):
+        warnings.append("表达式包含子查询，每次评估会执行多次内层查询")
+    if not selectors:
+        warnings.append("未识别到指标选择器")
+    
+    return {
+        "score": round(score, 2),
+        "level": level,
+        "samples_per_eval": round(samples_per_eval, 2),
+        "evals_per_minute": round(evals_per_minute, 4),
+        "series_estimate": series_estimate,
+        "warnings": warnings,
+    }
+
+
+async def probe_cardinality(datasource, selectors: List[str], timeout: float = 5) -> Optional[int]:
+    """对选择器执行 count() 探测，返回序列总数
+    
+    任一探测失败都返回 None，调用方回退到默认估算。
+    """
+    from app.services.datasource_client import DatasourceClient
+    
+    if not selectors:
+        return None
+    
+    client = DatasourceClient()
+    total = 0
+    for selector in selectors[:MAX_PROBE_SELECTORS]:
+        try:
+            result = await client.query_cached(datasource, f"count({selector})", timeout=timeout, ttl=60)
+        except Exception as e:
+            logger.warning(f"基数探测失败: selector={selector}, error={str(e)}")
+            return None
+        if result:
+            total += int(float(result[0].get('value', [0, '0'])[1]))
+    return total
+
+
+async def analyze_rule_cost(
+    expr: str,
+    eval_interval: int,
+    datasource=None,
+    probe: bool = True
+) -> Dict[str, Any]:
+    """分析规则成本（静态分析 + 可选的基数探测）
+    
+    Returns:
+        Dict: 静态分析结果与成本估算合并后的详情，score 字段为成本评分
+    """
+    analysis = analyze_promql(expr)
+    series_estimate = None
+    if probe and datasource is not None:
+        series_estimate = await probe_cardinality(datasource, analysis["selectors"])
+    
+    cost = estimate_cost(analysis, eval_interval, series_estimate)
+    return {
+        **analysis,
+        **cost,
+        "probed": series_estimate is not None,
+    }
@@ -0,0 +1,259 @@
+"""告警规则回测
+
+基于 query_range 的结果，按评估器的状态机语义（pending → firing → resolved，
+firing 需满足 for_duration）计算每个序列在历史窗口内的告警区间和通知次数。
+
+所有计算都在 numpy 数组上完成：先把所有序列的样本一次性散列到
+(序列数 × 步数) 的布尔矩阵，再通过差分找出每段连续触发区间，不按步循环。
+"""
+import math
+from typing import Any, Dict, List, Optional
+import numpy as np
+from loguru import logger
+
+from app.services.downsample import downsample_values
+
+
+# 单次回测允许的最大步数（与 Prometheus query_range 的 11000 点上限一致）
+MAX_BACKTEST_STEPS = 11000
+
+# 单次回测允许的最大矩阵单元数（序列数 × 步数），约 1000 个序列的满步数回测，
+# 避免高基数表达式在请求处理中分配数 GB 内存
+MAX_BACKTEST_CELLS = 11_000_000
+
+
+class BacktestTooLargeError(ValueError):
+    """回测的序列数 × 步数超过上限"""
+
+    def __init__(self, series_count: int, num_steps: int):
+        self.series_count = series_count
+        self.num_steps = num_steps
+        super().__init__(
+            f"回测数据量过大: {series_count} 个序列 × {num_steps} 步超过上限 {MAX_BACKTEST_CELLS}，"
+            f"请缩小时间窗口、增大步长或收窄表达式"
+        )
+
+
+def count_steps(start: int, end: int, step: int) -> int:
+    """回测窗口的总步数"""
+    return int((end - start) // step) + 1
+
+
+def check_backtest_size(series_count: int, num_steps: int):
+    """检查序列数 × 步数是否超过 MAX_BACKTEST_CELLS
+
+    Raises:
+        BacktestTooLargeError: 超过上限
+    """
+    if series_count * num_steps > MAX_BACKTEST_CELLS:
+        raise BacktestTooLargeError(series_count, num_steps)
+
+
+async def probe_backtest_series(
+    datasource,
+    expr: str,
+    start: int,
+    end: int,
+    step: int,
+    timeout: float = 10
+) -> Optional[int]:
+    """拉取 range query 之前，用一次 count 子查询探测窗口内出现过的序列数
+
+    count(last_over_time((expr)[window:step])) 只返回一个数值，
+    高基数表达式在下载和解码完整结果之前即可被拒绝。
+
+    Returns:
+        Optional[int]: 序列数；探测失败时返回 None，由 build_activity_matrix 在解析后兜底检查
+    """
+    from app.services.datasource_client import DatasourceClient
+
+    query = f"count(last_over_time(({expr})[{end - start}s:{step}s]))"
+    try:
+        result = await DatasourceClient().query_cached(datasource, query, timeout=timeout, ttl=60, eval_time=end)
+    except Exception as e:
+        logger.warning(f"回测序列数探测失败: error={str(e)}")
+        return None
+    if not result:
+        return 0
+    return int(float(result[0].get('value', [0, '0'])[1]))
+
+
+def resolve_step(start: int, end: int, step: Optional[int] = None, min_step: int = 15) -> int:
+    """计算回测步长
+
+    未指定时使用 min_step，并保证总步数不超过 MAX_BACKTEST_STEPS。
+
+    Args:
+        start: 开始时间戳（秒）
+        end: 结束时间戳（秒）
+        step: 用户指定的步长（秒）
+        min_step: 默认步长（秒），通常取评估间隔
+
+    Returns:
+        int: 实际使用的步长（秒）
+    """
+    step = max(int(step or min_step), 1)
+    min_allowed = math.ceil((end - start) / (MAX_BACKTEST_STEPS - 1)) if end > start else 1
+    return max(step, min_allowed)
+
+
+def build_activity_matrix(
+    series: List[Dict[str, Any]],
+    start: int,
+    step: int,
+    num_steps: int
+) -> np.ndarray:
+    """把 range query 结果转换为 (序列数 × 步数) 的布尔矩阵
+
+    PromQL 规则中比较运算会过滤掉不满足条件的样本，因此某一步存在
+    非 NaN 样本即视为条件成立。
+
+    Args:
+        series: query_range 返回的 result 列表
+        start: 开始时间戳（秒）
+        step: 步长（秒）
+        num_steps: 总步数
+
+    Returns:
+        np.ndarray: 布尔矩阵，active[i, k] 表示序列 i 在第 k 步条件成立
+
+    Raises:
+        BacktestTooLargeError: 序列数 × 步数超过 MAX_BACKTEST_CELLS
+    """
+    check_backtest_size(len(series), num_steps)
+
+    active = np.zeros((len(series), num_steps), dtype=bool)
+    if not series:
+        return active
+
+    lengths = np.fromiter((len(item.get('values', [])) for item in series), dtype=np.int64, count=len(series))
+    if lengths.sum() == 0:
+        return active
+
+    samples = np.asarray(
+        [sample for item in series for sample in item.get('values', [])],
+        dtype=np.float64
+    ).reshape(-1, 2)
+    rows = np.repeat(np.arange(len(series)), lengths)
+    cols = np.rint((samples[:, 0] - start) / step).astype(np.int64)
+
+    valid = (cols >= 0) & (cols < num_steps) & ~np.isnan(samples[:, 1])
+    active[rows[valid], cols[valid]] = True
+    return active
+
+
+def compute_backtest(
+    series: List[Dict[str, Any]],
+    start: int,
+    end: int,
+    step: int,
+    for_duration: int = 0,
+    repeat_interval: int = 0,
+    max_series: int = 50,
+    max_points: int = 0
+) -> Dict[str, Any]:
+    """计算规则回测结果
+
+    Args:
+        series: query_range 返回的 result 列表
+        start: 开始时间戳（秒）
+        end: 结束时间戳（秒）
+        step: 步长（秒）
+        for_duration: 持续时间（秒），pending 持续该时长后转为 firing
+        repeat_interval: 重复发送间隔（秒），0 表示不重复发送
+        max_series: 返回明细的最大序列数
+        max_points: 每个序列返回的曲线点数（LTTB 降采样），0 表示不返回
+
+    Returns:
+        Dict: 汇总统计和按触发次数排序的序列明细
+
+    Raises:
+        BacktestTooLargeError: 序列数 × 步数超过 MAX_BACKTEST_CELLS
+    """
+    num_steps = count_steps(start, end, step)
+    timestamps = start + np.arange(num_steps, dtype=np.int64) * step
+    active = build_activity_matrix(series, start, step, num_steps)
+
+    # 差分找出每段连续区间：+1 为开始，-1 为结束（结束索引为区间后第一个不成立的步）
+    padded = np.zeros((active.shape[0], num_steps + 2), dtype=np.int8)
+    padded[:, 1:-1] = active
+    edges = np.diff(padded, axis=1)
+    run_rows, run_starts = np.nonzero(edges == 1)
+    _, run_ends = np.nonzero(edges == -1)
+
+    # 从 pending 到 firing 需要经过的步数
+    fire_offset = math.ceil(for_duration / step) if for_duration > 0 else 0
+    fired = (run_starts + fire_offset) < run_ends
+    fire_idx = np.minimum(run_starts + fire_offset, num_steps - 1)
+    resolved = run_ends < num_steps
+
+    pending_at = timestamps[run_starts]
+    firing_at = np.where(fired, timestamps[fire_idx], -1)
+    resolved_at = np.where(resolved, timestamps[np.minimum(run_ends, num_steps - 1)], -1)
+
+    # 通知次数：首次触发 1 次 + 持续期间按 repeat_interval 重复 + 恢复 1 次
+    active_until = np.where(resolved, resolved_at, end)
+    if repeat_interval > 0:
+        repeats = np.where(fired, (active_until - firing_at) // repeat_interval, 0)
+        repeats = np.maximum(repeats, 0)
+    else:
+        repeats = np.zeros_like(run_starts)
+    recoveries = fired & resolved
+
+    num_series = active.shape[0]
+    firing_per_series = np.bincount(run_rows, weights=fired, minlength=num_series).astype(np.int64)
+    pending_per_series = np.bincount(run_rows, minlength=num_series).astype(np.int64)
+    notifications_per_series = np.bincount(
+        run_rows, weights=fired + repeats + recoveries, minlength=num_series
+    ).astype(np.int64)
+    firing_seconds = np.where(fired, active_until - firing_at, 0)
+    firing_seconds_per_series = np.bincount(run_rows, weights=firing_seconds, minlength=num_series).astype(np.int64)
+
+    # 按触发次数、通知次数排序，只返回前 max_series 个序列明细
+    order = np.lexsort((-notifications_per_series, -firing_per_series))
+    order = order[pending_per_series[order] > 0][:max_series]
+    run_bounds = np.searchsorted(run_rows, np.arange(num_series + 1))
+
+    series_details = []
+    for row in order.tolist():
+        lo, hi = run_bounds[row], run_bounds[row + 1]
+        intervals = [
+            {
+                "pending_at": int(p),
+                "firing_at": int(f) if f >= 0 else None,
+                "resolved_at": int(r) if r >= 0 else None,
+            }
+            for p, f, r in zip(pending_at[lo:hi], firing_at[lo:hi], resolved_at[lo:hi])
+        ]
+        detail = {
+            "metric": series[row].get('metric', {}),
+            "pending_count": int(pending_per_series[row]),
+            "firing_count": int(firing_per_series[row]),
+            "notification_count": int(notifications_per_series[row]),
+            "firing_seconds": int(firing_seconds_per_series[row]),
+            "intervals": intervals,
+        }
+        if max_points > 0:
+            detail["points"] = downsample_values(series[row].get('values', []), max_points)
+        series_details.append(detail)
+
+    firing_total = int(fired.sum())
+    repeat_total = int(repeats.sum())
+    recovery_total = int(recoveries.sum())
+
+    return {
+        "start": int(start),
+        "end": int(end),
+        "step": int(step),
+        "series_count": num_series,
+        "pending_count": int(len(run_starts)),
+        "firing_count": firing_total,
+        "resolved_count": int(resolved.sum()),
+        "notifications": {
+            "firing": firing_total,
+            "repeat": repeat_total,
+            "recovery": recovery_total,
+            "total": firing_total + repeat_total + recovery_total,
+        },
+        "series": series_details,
+    }
@@ -0,0 +1,303 @@
+"""静默引擎
+
+按租户在内存中维护静默规则快照，告警的静默检查不再逐条查询数据库：
+- 快照包含已启用且尚未结束的静默规则（生效中和未来生效的），匹配器预先编译
+- 生效中的静默规则按其中一个等值匹配器（label = value）建立索引，检查告警时只需检查
+  告警标签命中的索引项和没有等值匹配器的规则
+- 到达下一个 starts_at / ends_at 边界时用快照中的规则重建索引（无需查询数据库）
+- 静默规则变更时通过 Redis pub/sub 通知所有进程重新加载该租户的快照；
+  Redis 不可用时快照最长 MAX_SNAPSHOT_AGE 秒后重新加载，订阅按指数退避重试
+- 监听器（如静默调度器）在快照加载和静默规则变更时收到回调
+"""
+import asyncio
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+from loguru import logger
+from sqlalchemy import select
+
+from app.db.database import DatabaseSessionManager
+from app.models.silence import SilenceRule
+from app.services.silence_matcher import LabelMatcher, compile_matchers
+
+
+class CompiledSilence:
+    """编译后的静默规则"""
+    
+    __slots__ = ('id', 'name', 'tenant_id', 'project_id', 'starts_at', 'ends_at', 'index_key', 'matchers')
+    
+    def __init__(self, rule: SilenceRule, matchers: List[LabelMatcher]):
+        self.id = rule.id
+        self.name = rule.name
+        self.tenant_id = rule.tenant_id
+        self.project_id = rule.project_id
+        self.starts_at = rule.starts_at
+        self.ends_at = rule.ends_at
+        
+        # 选一个值非空的等值匹配器作为索引键，其余匹配器在命中索引后检查
+        # （值为空的等值匹配器表示标签不存在，不能用于索引）
+        index_matcher = next((m for m in matchers if m.operator == '=' and m.value != ''), None)
+        self.index_key: Optional[Tuple[str, str]] = (
+            (index_matcher.label, index_matcher.value) if index_matcher else None
+        )
+        self.matchers = [m for m in matchers if m is not index_matcher]
+    
+    @classmethod
+    def from_rule(cls, rule: SilenceRule) -> Optional["CompiledSilence"]:
+        """编译静默规则（匹配器为空或无效时返回 None）"""
+        matchers = compile_matchers(rule.matchers)
+        if not matchers:
+            logger.warning(f"静默规则匹配器无效，已忽略: silence_rule={rule.name}")
+            return None
+        return cls(rule, matchers)
+    
+    def is_active(self, now: float) -> bool:
+        return self.starts_at <= now <= self.ends_at
+    
+    def matches(self, labels: Dict[str, Any]) -> bool:
+        """检查告警标签是否匹配（含索引键）"""
+        if self.index_key is not None and labels.get(self.index_key[0]) != self.index_key[1]:
+            return False
+        return all(matcher.matches(labels) for matcher in self.matchers)
+
+
+class TenantSilenceSnapshot:
+    """单个租户的静默规则快照
+    
+    Attributes:
+        silences: 已启用且尚未结束的静默规则
+        loaded_at: 从数据库加载的时间
+        next_boundary: 下一个需要重建索引的时间（最近的 starts_at 或 ends_at 之后）
+    """
+    
+    def __init__(self, tenant_id: int, silences: List[CompiledSilence], now: float):
+        self.tenant_id = tenant_id
+        self.silences = silences
+        self.loaded_at = now
+        self.next_boundary = float('inf')
+        self._index: Dict[Tuple[str, str], List[CompiledSilence]] = {}
+        self._unindexed: List[CompiledSilence] = []
+        self.reindex(now)
+    
+    def reindex(self, now: float):
+        """按当前时间重建生效中静默规则的索引"""
+        index: Dict[Tuple[str, str], List[CompiledSilence]] = defaultdict(list)
+        unindexed = []
+        next_boundary = float('inf')
+        remaining = []
+        for silence in self.silences:
+            if silence.ends_at < now:
+                continue
+            remaining.append(silence)
+            if silence.starts_at > now:
+                next_boundary = min(next_boundary, silence.starts_at)
+                continue
+            # ends_at 当秒仍然生效，下一秒过期
+            next_boundary = min(next_boundary, silence.ends_at + 1)
+            if silence.index_key is not None:
+                index[silence.index_key].append(silence)
+            else:
+                unindexed.append(silence)
+        
+        self.silences = remaining
+        self._index = dict(index)
+        self._unindexed = unindexed
+        self.next_boundary = next_boundary
+    
+    @property
+    def active_count(self) -> int:
+        return sum(len(silences) for silences in self._index.values()) + len(self._unindexed)
+    
+    def match(self, labels: Dict[str, Any], project_id: Optional[int] = None) -> Optional[CompiledSilence]:
+        """
+        查找匹配告警的生效中静默规则
+        
+        Args:
+            labels: 告警标签
+            project_id: 只匹配该项目的静默规则（None 表示不限制）
+        """
+        for silence in self._candidates(labels):
+            if project_id is not None and silence.project_id != project_id:
+                continue
+            if silence.matches(labels):
+                return silence
+        return None
+    
+    def _candidates(self, labels: Dict[str, Any]):
+        if self._index:
+            for item in labels.items():
+                try:
+                    candidates = self._index.get(item)
+                except TypeError:
+                    # 不可哈希的标签值不会命中索引
+                    continue
+                if candidates:
+                    yield from candidates
+        yield from self._unindexed
+
+
+class SilenceListener(Protocol):
+    """静默引擎监听器"""
+    
+    def snapshot_loaded(self, snapshot: TenantSilenceSnapshot):
+        """租户快照从数据库加载完成"""
+    
+    def silences_changed(self, tenant_id: Optional[int]):
+        """租户的静默规则发生变更（tenant_id 为 None 表示所有租户）"""
+
+
+class SilenceEngine:
+    """静默引擎（进程内单例）"""
+    
+    CHANNEL = "silence:changed"  # 静默规则变更通知频道，消息为 {"tenant_id": ...}
+    MAX_SNAPSHOT_AGE = 60  # 快照最长使用时间（秒），兜底丢失的变更通知
+    RESUBSCRIBE_DELAY = 10  # 订阅中断后的重连间隔（秒）
+    MAX_RESUBSCRIBE_DELAY = 300  # 连续订阅失败时的最大重连间隔（秒）
+    
+    def __init__(self):
+        self.db_manager = DatabaseSessionManager()
+        self._snapshots: Dict[int, TenantSilenceSnapshot] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._generation = 0  # 失效次数，加载期间发生失效时丢弃加载结果（只用于本次检查）
+        self._listener_task: Optional[asyncio.Task] = None
+        self._listeners: List[SilenceListener] = []
+        self.loads = 0
+        self.reindexes = 0
+    
+    async def _load(self, tenant_id: int) -> TenantSilenceSnapshot:
+        """从数据库加载租户的静默规则快照"""
+        now = int(time.time())
+        async with self.db_manager.session(auto_commit=False) as db:
+            stmt = select(SilenceRule).where(
+                SilenceRule.tenant_id == tenant_id,
+                SilenceRule.is_enabled == True,
+                SilenceRule.ends_at >= now
+            )
+            result = await db.execute(stmt)
+            rules = list(result.scalars().all())
+        
+        silences = [silence for silence in map(CompiledSilence.from_rule, rules) if silence]
+        snapshot = TenantSilenceSnapshot(tenant_id, silences, now)
+        self.loads += 1
+        for listener in self._listeners:
+            listener.snapshot_loaded(snapshot)
+        logger.debug(f"静默规则快照已加载: tenant={tenant_id}, 规则数={len(silences)}, 生效中={snapshot.active_count}")
+        return snapshot
+    
+    async def get_snapshot(self, tenant_id: int) -> TenantSilenceSnapshot:
+        """获取租户的静默规则快照（过期时重新加载，跨过生效边界时重建索引）"""
+        now = time.time()
+        snapshot = self._snapshots.get(tenant_id)
+        if snapshot is None or now - snapshot.loaded_at >= self.MAX_SNAPSHOT_AGE:
+            lock = self._locks.setdefault(tenant_id, asyncio.Lock())
+            async with lock:
+                # 等待锁期间其他协程可能已完成加载
+                snapshot = self._snapshots.get(tenant_id)
+                if snapshot is None or now - snapshot.loaded_at >= self.MAX_SNAPSHOT_AGE:
+                    generation = self._generation
+                    snapshot = await self._load(tenant_id)
+                    if generation == self._generation:
+                        self._snapshots[tenant_id] = snapshot
+        elif now >= snapshot.next_boundary:
+            snapshot.reindex(now)
+            self.reindexes += 1
+        return snapshot
+    
+    async def match(self, tenant_id: int, labels: Dict[str, Any], project_id: Optional[int] = None) -> Optional[CompiledSilence]:
+        """查找匹配告警标签的生效中静默规则"""
+        snapshot = await self.get_snapshot(tenant_id)
+        return snapshot.match(labels, project_id)
+    
+    def invalidate(self, tenant_id: Optional[int] = None):
+        """使快照失效，下次检查时重新加载（tenant_id 为 None 时清空全部）"""
+        self._generation += 1
+        if tenant_id is None:
+            self._snapshots.clear()
+        else:
+            self._snapshots.pop(tenant_id, None)
+        for listener in self._listeners:
+            listener.silences_changed(tenant_id)
+    
+    def add_listener(self, listener: SilenceListener):
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+    
+    def remove_listener(self, listener: SilenceListener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+    
+    async def notify_changed(self, tenant_id: int):
+        """静默规则变更后调用：使本进程快照失效并通知其他进程"""
+        self.invalidate(tenant_id)
+        try:
+            from app.services.advanced_cache_service import AdvancedCacheService
+            await AdvancedCacheService.publish_message(self.CHANNEL, {"tenant_id": tenant_id})
+        except Exception as e:
+            logger.warning(f"发布静默规则变更通知失败: tenant={tenant_id}, error={str(e)}")
+    
+    async def _on_changed(self, message: Dict[str, Any]):
+        self.invalidate(message.get("tenant_id"))
+    
+    async def _listen(self):
+        """订阅静默规则变更通知
+        
+        订阅建立后中断时清空快照（以免漏掉中断期间的变更），并按 RESUBSCRIBE_DELAY 重连；
+        订阅未能建立（如未部署 Redis）时不清空快照，重连间隔按指数退避到 MAX_RESUBSCRIBE_DELAY，
+        期间依靠 MAX_SNAPSHOT_AGE 定期重新加载。
+        """
+        from app.services.advanced_cache_service import AdvancedCacheService
+        
+        delay = self.RESUBSCRIBE_DELAY
+        while True:
+            subscribed = False
+            
+            def on_subscribed():
+                nonlocal subscribed
+                subscribed = True
+            
+            try:
+                await AdvancedCacheService.subscribe_messages(self.CHANNEL, self._on_changed, on_subscribed)
+                error = "订阅已结束"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = str(e)
+            
+            if subscribed:
+                logger.warning(f"静默规则变更订阅中断，{self.RESUBSCRIBE_DELAY} 秒后重连: {error}")
+                self.invalidate()
+                delay = self.RESUBSCRIBE_DELAY
+            else:
+                logger.warning(f"静默规则变更订阅失败，{delay} 秒后重试: {error}")
+            await asyncio.sleep(delay)
+            if not subscribed:
+                delay = min(delay * 2, self.MAX_RESUBSCRIBE_DELAY)
+    
+    async def start(self):
+        """启动变更订阅（重复调用无副作用）"""
+        if self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen())
+    
+    async def stop(self):
+        """停止变更订阅"""
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """静默引擎统计"""
+        return {
+            "tenants": len(self._snapshots),
+            "silences": sum(len(snapshot.silences) for snapshot in self._snapshots.values()),
+            "active": sum(snapshot.active_count for snapshot in self._snapshots.values()),
+            "loads": self.loads,
+            "reindexes": self.reindexes,
+        }
+
+
+# 全局静默引擎
+silence_engine = SilenceEngine()
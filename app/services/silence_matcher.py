@@ -1,9 +1,80 @@
 """静默规则匹配工具"""
 import re
-from typing import Dict, List, Any
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Pattern
 from loguru import logger
 
 
+ALLOWED_OPERATORS = ('=', '!=', '=~', '!~')
+
+
+@lru_cache(maxsize=4096)
+def compile_regex(pattern: str) -> Pattern:
+    """编译匹配器中的正则表达式（带缓存）"""
+    return re.compile(f"(?:{pattern})")
+
+
+class LabelMatcher:
+    """编译后的标签匹配器
+    
+    正则默认从开头匹配（re.match 语义，"web" 可以匹配 "web-01"）；
+    matcher 中 anchored 为 true 时整体匹配（与 Prometheus / Alertmanager 一致，"web" 只匹配 "web"）。
+    """
+    
+    __slots__ = ('label', 'operator', 'value', 'anchored', 'regex')
+    
+    def __init__(self, label: str, operator: str, value: str, anchored: bool = False):
+        if operator not in ALLOWED_OPERATORS:
+            raise ValueError(f"未知的匹配操作符: {operator}")
+        self.label = label
+        self.operator = operator
+        self.value = value
+        self.anchored = anchored
+        self.regex = compile_regex(value) if operator in ('=~', '!~') else None
+    
+    @classmethod
+    def parse(cls, matcher: Dict[str, str]) -> "LabelMatcher":
+        """从 matcher 字典创建（操作符未知或正则无效时抛出 ValueError）"""
+        try:
+            return cls(
+                matcher.get('label', ''),
+                matcher.get('operator', '='),
+                matcher.get('value', ''),
+                bool(matcher.get('anchored', False))
+            )
+        except re.error as e:
+            raise ValueError(f"正则表达式错误 '{matcher.get('value', '')}': {e}")
+    
+    def matches(self, labels: Dict[str, Any]) -> bool:
+        # 告警中不存在的标签视为空字符串
+        actual = labels.get(self.label, '')
+        if self.operator == '=':
+            return actual == self.value
+        if self.operator == '!=':
+            return actual != self.value
+        if self.anchored:
+            matched = self.regex.fullmatch(str(actual)) is not None
+        else:
+            matched = self.regex.match(str(actual)) is not None
+        return matched if self.operator == '=~' else not matched
+
+
+def compile_matchers(matchers: List[Dict[str, str]]) -> Optional[List[LabelMatcher]]:
+    """
+    编译匹配器列表
+    
+    Returns:
+        编译后的匹配器；matchers 为空或包含无效匹配器时返回 None（视为不匹配任何告警）
+    """
+    if not matchers:
+        return None
+    try:
+        return [LabelMatcher.parse(matcher) for matcher in matchers]
+    except ValueError as e:
+        logger.error(str(e))
+        return None
+
+
 def check_silence_match(alert_labels: Dict[str, str], matchers: List[Dict[str, str]]) -> bool:
     """
     检查告警标签是否匹配静默规则
@@ -12,56 +83,16 @@ def check_silence_match(alert_labels: Dict[str, str], matchers: List[Dict[str, s
         alert_labels: 告警标签字典，如 {"alertname": "HighCPU", "severity": "critical"}
         matchers: 匹配器列表，如 [
             {"label": "alertname", "operator": "=", "value": "HighCPU"},
-            {"label": "severity", "operator": "=~", "value": "warning|critical"}
+            {"label": "severity", "operator": "=~", "value": "warning|critical", "anchored": True}
         ]
     
     Returns:
         bool: 所有 matcher 都匹配返回 True（AND 逻辑），否则返回 False
     """
-    if not matchers:
+    compiled = compile_matchers(matchers)
+    if not compiled:
         return False
-    
-    for matcher in matchers:
-        label_name = matcher.get('label', '')
-        operator = matcher.get('operator', '=')
-        expected_value = matcher.get('value', '')
-        
-        # 获取告警中的标签值（不存在则为空字符串）
-        actual_value = alert_labels.get(label_name, '')
-        
-        # 执行匹配
-        try:
-            if operator == '=':
-                # 精确匹配
-                if actual_value != expected_value:
-                    return False
-                    
-            elif operator == '!=':
-                # 不等于
-                if actual_value == expected_value:
-                    return False
-                    
-            elif operator == '=~':
-                # 正则表达式匹配
-                if not re.match(expected_value, actual_value):
-                    return False
-                    
-            elif operator == '!~':
-                # 正则表达式不匹配
-                if re.match(expected_value, actual_value):
-                    return False
-            else:
-                # 未知操作符，记录警告并认为不匹配
-                logger.warning(f"未知的匹配操作符: {operator}")
-                return False
-                
-        except re.error as e:
-            # 正则表达式错误，记录并认为不匹配
-            logger.error(f"正则表达式错误 '{expected_value}': {e}")
-            return False
-    
-    # 所有 matcher 都匹配
-    return True
+    return all(matcher.matches(alert_labels) for matcher in compiled)
 
 
 def validate_matchers(matchers: List[Dict[str, str]]) -> tuple[bool, str]:
@@ -80,8 +111,6 @@ def validate_matchers(matchers: List[Dict[str, str]]) -> tuple[bool, str]:
     if not isinstance(matchers, list):
         return False, "matchers 必须是列表"
     
-    allowed_operators = ['=', '!=', '=~', '!~']
-    
     for i, matcher in enumerate(matchers):
         if not isinstance(matcher, dict):
             return False, f"matcher[{i}] 必须是字典"
@@ -98,8 +127,11 @@ def validate_matchers(matchers: List[Dict[str, str]]) -> tuple[bool, str]:
         
         # 检查操作符
         operator = matcher['operator']
-        if operator not in allowed_operators:
-            return False, f"matcher[{i}] 操作符 '{operator}' 无效，允许的操作符: {', '.join(allowed_operators)}"
+        if operator not in ALLOWED_OPERATORS:
+            return False, f"matcher[{i}] 操作符 '{operator}' 无效，允许的操作符: {', '.join(ALLOWED_OPERATORS)}"
+        
+        if not isinstance(matcher.get('anchored', False), bool):
+            return False, f"matcher[{i}] 'anchored' 字段必须是布尔值"
         
         # 检查正则表达式
         if operator in ['=~', '!~']:
@@ -133,6 +165,8 @@ def format_matcher_description(matcher: Dict[str, str]) -> str:
     }
     
     op_text = operator_desc.get(operator, operator)
+    if operator in ('=~', '!~') and matcher.get('anchored'):
+        op_text += '（整体匹配）'
     return f"{label} {op_text} '{value}'"
 
 
@@ -0,0 +1,231 @@
+"""静默调度器
+
+静默规则的生效和结束原本只体现在查询时与 starts_at / ends_at 的比较上：
+静默结束后被抑制的告警要等下一次重复发送才会通知，每次读取也都要重新计算静默状态。
+调度器把各租户静默规则的边界时间（starts_at、ends_at 的下一秒）登记在时间轮中：
+- 到达边界或静默规则变更时，重建该租户的静默快照，批量重新计算当前告警的静默状态，
+  以 UPDATE ... WHERE id IN (...) 写回 alert_event.is_silenced
+- 新被静默的 firing 告警从分组器中移除，不再随分组重复发送
+- 静默结束（或被删除、禁用）后仍在 firing 的告警立即交给告警管理器发送通知
+- 没有收到变更通知（如未部署 Redis）时，定期重新加载的快照与上次不同也会触发重新计算
+
+调度器运行在后台任务进程中，与告警管理器共用分组器和去重令牌。
+"""
+import asyncio
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+from loguru import logger
+from sqlalchemy import select, update, distinct, or_
+
+from app.core.timer_wheel import TimerWheel
+from app.db.database import DatabaseSessionManager
+from app.models.alert import AlertEvent, AlertRule
+from app.models.silence import SilenceRule
+from app.services.alert_manager import AlertManager
+from app.services.silence_engine import TenantSilenceSnapshot, silence_engine
+
+
+class SilenceScheduler:
+    """静默边界调度器
+    
+    Attributes:
+        alert_manager: 告警管理器（静默结束后发送通知）
+        wheel: 边界时间轮，任务键为 (租户 ID, 边界时间)
+    """
+    
+    # 批量 UPDATE 每条语句的告警数
+    UPDATE_CHUNK = 500
+    
+    def __init__(self, alert_manager: AlertManager):
+        self.alert_manager = alert_manager
+        self.db_manager = DatabaseSessionManager()
+        self.wheel = TimerWheel(tick=1.0, size=3600)
+        self._tenants: Set[int] = set()  # 已跟踪的租户
+        self._pending: Set[int] = set()  # 待立即重新计算的租户
+        self._signatures: Dict[int, frozenset] = {}  # 租户 -> 上次加载的静默规则签名
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.reevaluations = 0
+        self.silenced = 0
+        self.unsilenced = 0
+    
+    # ===== 静默引擎回调 =====
+    
+    def snapshot_loaded(self, snapshot: TenantSilenceSnapshot):
+        """登记快照中静默规则的边界时间；规则与上次加载的不同时重新计算"""
+        self._tenants.add(snapshot.tenant_id)
+        signature = frozenset(
+            (silence.id, silence.starts_at, silence.ends_at, silence.index_key,
+             tuple((m.label, m.operator, m.value, m.anchored) for m in silence.matchers))
+            for silence in snapshot.silences
+        )
+        if self._signatures.get(snapshot.tenant_id) != signature:
+            self._signatures[snapshot.tenant_id] = signature
+            self._pending.add(snapshot.tenant_id)
+            self._wakeup.set()
+        for silence in snapshot.silences:
+            if silence.starts_at > snapshot.loaded_at:
+                self.wheel.schedule((snapshot.tenant_id, silence.starts_at), silence.starts_at)
+            self.wheel.schedule((snapshot.tenant_id, silence.ends_at + 1), silence.ends_at + 1)
+    
+    def silences_changed(self, tenant_id: Optional[int]):
+        """静默规则变更后立即重新计算"""
+        self._pending.update(self._tenants if tenant_id is None else {tenant_id})
+        self._wakeup.set()
+    
+    # ===== 调度 =====
+    
+    async def start(self):
+        """登记到静默引擎并启动调度循环"""
+        if self._task is not None:
+            return
+        silence_engine.add_listener(self)
+        self._task = asyncio.create_task(self._run())
+        logger.info("静默调度器已启动")
+    
+    async def stop(self):
+        """停止调度循环"""
+        silence_engine.remove_listener(self)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info("静默调度器已停止")
+    
+    async def _initial_tenants(self) -> Set[int]:
+        """启动时需要同步的租户：有未结束的静默规则，或有标记为已静默的告警"""
+        now = int(time.time())
+        async with self.db_manager.session(auto_commit=False) as db:
+            result = await db.execute(
+                select(distinct(SilenceRule.tenant_id)).where(
+                    SilenceRule.is_enabled == True,
+                    SilenceRule.ends_at >= now
+                )
+            )
+            tenants = set(result.scalars().all())
+            result = await db.execute(
+                select(distinct(AlertEvent.tenant_id)).where(AlertEvent.is_silenced == True)
+            )
+            tenants.update(result.scalars().all())
+        return tenants
+    
+    async def _run(self):
+        try:
+            self._pending.update(await self._initial_tenants())
+        except Exception as e:
+            logger.error(f"加载静默租户失败: {str(e)}")
+        
+        while True:
+            try:
+                # 按刻度推进时间轮；静默规则变更时提前唤醒
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.wheel.tick)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                
+                tenants = {tenant_id for tenant_id, _ in self.wheel.advance()}
+                tenants.update(self._pending)
+                self._pending.clear()
+                failed = set()
+                for tenant_id in tenants:
+                    try:
+                        await self.reevaluate_tenant(tenant_id)
+                    except Exception as e:
+                        logger.error(f"重新计算静默状态失败，稍后重试: tenant={tenant_id}, error={str(e)}")
+                        failed.add(tenant_id)
+                
+                # 失败的租户在下一个刻度重试
+                self._pending.update(failed)
+            
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"静默调度出错: {str(e)}")
+                await asyncio.sleep(self.wheel.tick)
+    
+    # ===== 重新计算 =====
+    
+    async def reevaluate_tenant(self, tenant_id: int):
+        """重新计算租户当前告警的静默状态，并为静默结束的 firing 告警发送通知"""
+        self._tenants.add(tenant_id)
+        snapshot = await silence_engine.get_snapshot(tenant_id)
+        self.reevaluations += 1
+        
+        async with self.db_manager.session(auto_commit=False) as db:
+            result = await db.execute(
+                select(AlertEvent).where(
+                    AlertEvent.tenant_id == tenant_id,
+                    or_(AlertEvent.status.in_(['pending', 'firing']), AlertEvent.is_silenced == True)
+                )
+            )
+            alerts = result.scalars().all()
+            
+            newly_silenced: List[int] = []
+            silenced_fingerprints: List[str] = []  # 新被静默的 firing 告警，需移出分组
+            released: List[AlertEvent] = []
+            for alert in alerts:
+                silenced = alert.status != 'resolved' and snapshot.match(alert.labels or {}) is not None
+                if silenced == bool(alert.is_silenced):
+                    continue
+                if silenced:
+                    newly_silenced.append(alert.id)
+                    if alert.status == 'firing':
+                        silenced_fingerprints.append(alert.fingerprint)
+                else:
+                    released.append(alert)
+            
+            for value, ids in ((True, newly_silenced), (False, [alert.id for alert in released])):
+                for i in range(0, len(ids), self.UPDATE_CHUNK):
+                    await db.execute(
+                        update(AlertEvent)
+                        .where(AlertEvent.id.in_(ids[i:i + self.UPDATE_CHUNK]))
+                        .values(is_silenced=value)
+                        .execution_options(synchronize_session=False)
+                    )
+            
+            # 静默结束后仍在 firing 的告警立即进入通知流程（last_sent_at 随本会话提交）
+            firing = [alert for alert in released if alert.status == 'firing']
+            if firing:
+                await self._notify_released(db, firing)
+            
+            await db.commit()
+        
+        # 已在分组中的告警不再重复发送（发送前的 is_silenced 过滤兜底移除失败的情况）
+        for fingerprint in silenced_fingerprints:
+            try:
+                await self.alert_manager.active_grouper.remove_alert_from_groups(fingerprint)
+            except Exception as e:
+                logger.warning(f"从分组移除静默告警失败: fingerprint={fingerprint}, error={str(e)}")
+        
+        if newly_silenced or released:
+            self.silenced += len(newly_silenced)
+            self.unsilenced += len(released)
+            logger.info(
+                f"静默状态已更新: tenant={tenant_id}, 静默={len(newly_silenced)}, "
+                f"解除静默={len(released)}, 其中待通知={len(firing)}"
+            )
+    
+    async def _notify_released(self, db, alerts: List[AlertEvent]):
+        """按规则批量发送解除静默的告警"""
+        by_rule: Dict[int, List[AlertEvent]] = defaultdict(list)
+        for alert in alerts:
+            by_rule[alert.rule_id].append(alert)
+        
+        result = await db.execute(select(AlertRule).where(AlertRule.id.in_(list(by_rule))))
+        for rule in result.scalars().all():
+            await self.alert_manager.send_alerts_batch(by_rule[rule.id], rule)
+    
+    def get_stats(self) -> Dict[str, int]:
+        """调度统计"""
+        return {
+            "tenants": len(self._tenants),
+            "scheduled_boundaries": len(self.wheel),
+            "reevaluations": self.reevaluations,
+            "silenced": self.silenced,
+            "unsilenced": self.unsilenced,
+        }
@@ -0,0 +1,352 @@
+"""告警风暴检测
+
+公共依赖故障时短时间内会产生大量 firing 分组，逐个分组、逐个渠道发送会触发通知渠道的限流。
+风暴检测器按 (租户, 通知渠道) 统计滑动窗口内新 firing 分组的数量：
+- 超过 threshold 时进入风暴模式：该渠道的分组通知不再逐个发送，而是计入摘要
+  （按规则和等级计数、标签的高频取值），按 summary_interval 定期发送一条摘要
+- 窗口内新分组数降到 exit_threshold 以下且持续一个摘要周期后退出风暴模式，
+  发送最后一条摘要并恢复逐个分组发送
+- 摘要转换为一条合成告警，走与普通通知相同的渠道发送流程并写入通知记录
+
+检测在进程内进行，多实例部署时每个实例按各自处理的分组独立判断。
+"""
+import json
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from loguru import logger
+from app.models.alert import AlertEvent
+from app.models.notification import NotificationChannel
+from app.services.alert_snapshot import AlertSnapshot
+from app.services.notification_priority import group_priority
+
+
+class StormSummary:
+    """风暴期间被合并的分组通知摘要"""
+    
+    # 单个标签最多统计的不同取值数，超出的取值计入 OTHER_VALUE
+    MAX_VALUES_PER_LABEL = 1000
+    OTHER_VALUE = "<其他>"
+    ALERT_NAME = "告警风暴摘要"
+    
+    def __init__(self, started_at: float):
+        self.started_at = started_at
+        self.groups = 0
+        self.firing = 0
+        self.resolved = 0
+        self.by_rule: Counter = Counter()  # (规则名称, 等级) -> 告警数
+        self.label_values: Dict[str, Counter] = {}  # 标签键 -> 取值计数
+        self.attempts = 0  # 发送失败次数
+    
+    def __bool__(self) -> bool:
+        return self.groups > 0
+    
+    def add(self, alerts: List[AlertEvent], is_recovery: bool):
+        """计入一个分组的告警"""
+        self.groups += 1
+        if is_recovery:
+            self.resolved += len(alerts)
+        else:
+            self.firing += len(alerts)
+        
+        for alert in alerts:
+            self.by_rule[(alert.rule_name, alert.severity)] += 1
+            for key, value in (alert.labels or {}).items():
+                values = self.label_values.setdefault(key, Counter())
+                if value not in values and len(values) >= self.MAX_VALUES_PER_LABEL:
+                    value = self.OTHER_VALUE
+                values[value] += 1
+    
+    def merge(self, other: "StormSummary"):
+        """并入另一份摘要（发送失败的摘要并入下一次发送）"""
+        self.started_at = min(self.started_at, other.started_at)
+        self.groups += other.groups
+        self.firing += other.firing
+        self.resolved += other.resolved
+        self.by_rule.update(other.by_rule)
+        for key, other_values in other.label_values.items():
+            values = self.label_values.setdefault(key, Counter())
+            for value, count in other_values.items():
+                if value not in values and len(values) >= self.MAX_VALUES_PER_LABEL:
+                    value = self.OTHER_VALUE
+                values[value] += count
+        self.attempts = max(self.attempts, other.attempts)
+    
+    def top_labels(self, limit: int = 5, values_per_label: int = 3) -> Dict[str, List[Tuple[str, int]]]:
+        """出现次数最集中的标签及其高频取值"""
+        ranked = sorted(
+            self.label_values.items(),
+            key=lambda item: item[1].most_common(1)[0][1],
+            reverse=True
+        )
+        return {key: values.most_common(values_per_label) for key, values in ranked[:limit]}
+    
+    def to_dict(self, top_labels: int = 5) -> Dict[str, Any]:
+        return {
+            "started_at": int(self.started_at),
+            "groups": self.groups,
+            "firing": self.firing,
+            "resolved": self.resolved,
+            "by_rule": [
+                {"rule_name": rule_name, "severity": severity, "count": count}
+                for (rule_name, severity), count in self.by_rule.most_common()
+            ],
+            "top_labels": {
+                key: [{"value": value, "count": count} for value, count in values]
+                for key, values in self.top_labels(top_labels).items()
+            },
+        }
+    
+    def to_text(self, channel_name: str, ended: bool, top_labels: int = 5, max_rules: int = 10) -> str:
+        """渲染为文本消息"""
+        period = (
+            f"{time.strftime('%H:%M:%S', time.localtime(self.started_at))} - "
+            f"{time.strftime('%H:%M:%S', time.localtime())}"
+        )
+        lines = [
+            f"【告警风暴摘要】渠道: {channel_name}",
+            f"时间段: {period}",
+            f"分组 {self.groups} 个，告警 {self.firing} 条，恢复 {self.resolved} 条",
+            "",
+            "按规则 / 等级:",
+        ]
+        by_rule = self.by_rule.most_common()
+        for (rule_name, severity), count in by_rule[:max_rules]:
+            lines.append(f"  - {rule_name} [{severity}]: {count}")
+        if len(by_rule) > max_rules:
+            lines.append(f"  ... 还有 {len(by_rule) - max_rules} 项")
+        
+        labels = self.top_labels(top_labels)
+        if labels:
+            lines.extend(["", "高频标签取值:"])
+            for key, values in labels.items():
+                lines.append(f"  {key}: " + ", ".join(f"{value}({count})" for value, count in values))
+        
+        lines.append("")
+        if ended:
+            lines.append("告警风暴已结束，恢复逐条分组通知。")
+        else:
+            lines.append("风暴期间分组通知合并为摘要定期发送。")
+        return "\n".join(lines)
+    
+    def to_alert(self, tenant_id: int, channel: NotificationChannel, ended: bool, top_labels: int = 5) -> AlertSnapshot:
+        """转换为合成告警（等级取摘要中最高的等级，Webhook 可从 storm_summary 注释读取结构化数据）"""
+        return AlertSnapshot(
+            fingerprint=f"storm:{tenant_id}:{channel.id}:{int(self.started_at)}",
+            rule_name=self.ALERT_NAME,
+            status="firing",
+            severity=group_priority(severity for _, severity in self.by_rule),
+            value=self.groups,
+            labels={"alertname": "AlertStorm", "channel": channel.name},
+            annotations={
+                "summary": f"分组 {self.groups} 个，告警 {self.firing} 条，恢复 {self.resolved} 条"
+                           + ("（风暴已结束）" if ended else ""),
+                "description": self.to_text(channel.name, ended, top_labels),
+                "storm_summary": json.dumps({**self.to_dict(top_labels), "ended": ended}, ensure_ascii=False),
+            },
+            started_at=int(self.started_at),
+            last_eval_at=int(time.time()),
+            tenant_id=tenant_id
+        )
+
+
+class StormState:
+    """单个 (租户, 渠道) 的风暴状态"""
+    
+    __slots__ = ('tenant_id', 'channel', 'entered_at', 'next_summary_at', 'summary', 'summaries_sent')
+    
+    def __init__(self, tenant_id: int, channel: NotificationChannel, entered_at: float, first_summary_at: float):
+        self.tenant_id = tenant_id
+        self.channel = channel
+        self.entered_at = entered_at
+        self.next_summary_at = first_summary_at
+        self.summary = StormSummary(entered_at)
+        self.summaries_sent = 0
+
+
+class StormDetector:
+    """告警风暴检测器
+    
+    Attributes:
+        threshold: 窗口内新 firing 分组数达到该值时进入风暴模式
+        exit_threshold: 窗口内新 firing 分组数低于该值时允许退出风暴模式
+        window: 统计窗口（秒）
+        summary_interval: 摘要发送间隔（秒）
+        first_summary_delay: 进入风暴后第一条摘要的延迟（秒）
+    """
+    
+    # 单条摘要最多发送次数，超过后丢弃
+    MAX_SUMMARY_ATTEMPTS = 3
+    
+    def __init__(
+        self,
+        threshold: int = 30,
+        window: float = 60,
+        exit_threshold: Optional[int] = None,
+        summary_interval: float = 60,
+        first_summary_delay: float = 10,
+        top_labels: int = 5
+    ):
+        self.threshold = threshold
+        self.exit_threshold = exit_threshold if exit_threshold is not None else max(threshold // 2, 1)
+        self.window = window
+        self.summary_interval = summary_interval
+        self.first_summary_delay = first_summary_delay
+        self.top_labels = top_labels
+        self._events: Dict[Tuple[int, int], Deque[float]] = {}  # (租户, 渠道) -> 新 firing 分组时间
+        self._storms: Dict[Tuple[int, int], StormState] = {}
+        self._ended_retry: Dict[Tuple[int, int], Tuple[StormState, StormSummary]] = {}  # 发送失败的结束摘要
+        self.storms_started = 0
+        self.groups_summarized = 0
+    
+    def _rate(self, key: Tuple[int, int], now: float) -> int:
+        """窗口内的新 firing 分组数（顺带清理窗口外的记录）"""
+        events = self._events.get(key)
+        if not events:
+            return 0
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        return len(events)
+    
+    def is_storming(self, tenant_id: int, channel: NotificationChannel) -> bool:
+        return (tenant_id, channel.id) in self._storms
+    
+    def observe(
+        self,
+        tenant_id: int,
+        channel: NotificationChannel,
+        new_group: bool,
+        now: Optional[float] = None
+    ) -> bool:
+        """
+        记录一次发往渠道的分组通知，返回该渠道是否处于风暴模式
+        
+        Args:
+            tenant_id: 租户 ID
+            channel: 通知渠道
+            new_group: 是否为新的 firing 分组（重复发送和恢复分组不计入速率）
+        """
+        now = now or time.time()
+        key = (tenant_id, channel.id)
+        if new_group:
+            self._events.setdefault(key, deque()).append(now)
+        
+        if key in self._storms:
+            return True
+        
+        if self._rate(key, now) >= self.threshold:
+            self._storms[key] = StormState(tenant_id, channel, now, now + self.first_summary_delay)
+            self.storms_started += 1
+            logger.warning(
+                f"🌪️ 进入告警风暴模式: tenant={tenant_id}, channel={channel.name}, "
+                f"{self.window:.0f}s 内新分组数 >= {self.threshold}"
+            )
+            return True
+        return False
+    
+    def absorb(self, tenant_id: int, channel: NotificationChannel, alerts: List[AlertEvent], is_recovery: bool):
+        """把分组计入风暴摘要（代替逐个发送）"""
+        state = self._storms.get((tenant_id, channel.id))
+        if state is None:
+            return
+        state.summary.add(alerts, is_recovery)
+        self.groups_summarized += 1
+    
+    def collect_due(self, now: Optional[float] = None) -> List[Tuple[StormState, StormSummary, bool]]:
+        """
+        取出到达发送时间的摘要，并判断风暴是否结束
+        
+        Returns:
+            List[(风暴状态, 摘要, 风暴是否已结束)]；摘要为空且风暴未结束时不返回
+        """
+        now = now or time.time()
+        due = []
+        
+        # 上次发送失败的结束摘要：渠道已再次进入风暴时并入新风暴的摘要
+        for key, (state, summary) in list(self._ended_retry.items()):
+            del self._ended_retry[key]
+            live = self._storms.get(key)
+            if live is not None:
+                live.summary.merge(summary)
+            else:
+                state.summaries_sent += 1
+                due.append((state, summary, True))
+        
+        for key, state in list(self._storms.items()):
+            if now < state.next_summary_at:
+                continue
+            
+            ended = (
+                self._rate(key, now) < self.exit_threshold
+                and now - state.entered_at >= self.summary_interval
+            )
+            summary, state.summary = state.summary, StormSummary(now)
+            state.next_summary_at = now + self.summary_interval
+            if ended:
+                self._storms.pop(key, None)
+                logger.info(
+                    f"✅ 告警风暴结束: tenant={state.tenant_id}, channel={state.channel.name}, "
+                    f"持续 {now - state.entered_at:.0f}s"
+                )
+            if summary or ended:
+                state.summaries_sent += 1
+                due.append((state, summary, ended))
+        
+        # 清理已无记录的渠道
+        for key in [key for key in self._events if key not in self._storms and self._rate(key, now) == 0]:
+            self._events.pop(key, None)
+        return due
+    
+    def requeue(self, state: StormState, summary: StormSummary, ended: bool, now: Optional[float] = None) -> bool:
+        """
+        把发送失败的摘要放回检测器，下一次 collect_due 时重新发送
+        
+        风暴未结束时并入当前摘要并立即到期；已结束的风暴单独保留一条结束摘要。
+        
+        Returns:
+            bool: 是否放回（达到 MAX_SUMMARY_ATTEMPTS 时丢弃）
+        """
+        now = now or time.time()
+        summary.attempts += 1
+        if summary.attempts >= self.MAX_SUMMARY_ATTEMPTS:
+            logger.error(
+                f"❌ 告警风暴摘要发送失败次数耗尽，丢弃: tenant={state.tenant_id}, "
+                f"channel={state.channel.name}, 分组数={summary.groups}"
+            )
+            return False
+        
+        state.summaries_sent = max(state.summaries_sent - 1, 0)
+        key = (state.tenant_id, state.channel.id)
+        live = self._storms.get(key)
+        if live is not None:
+            live.summary.merge(summary)
+            live.next_summary_at = min(live.next_summary_at, now)
+        elif key in self._ended_retry:
+            self._ended_retry[key][1].merge(summary)
+        else:
+            self._ended_retry[key] = (state, summary)
+        return True
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """风暴统计"""
+        now = time.time()
+        return {
+            "threshold": self.threshold,
+            "exit_threshold": self.exit_threshold,
+            "window": self.window,
+            "summary_interval": self.summary_interval,
+            "storms_started": self.storms_started,
+            "groups_summarized": self.groups_summarized,
+            "active": [
+                {
+                    "tenant_id": state.tenant_id,
+                    "channel_id": state.channel.id,
+                    "channel_name": state.channel.name,
+                    "since": int(state.entered_at),
+                    "rate": self._rate(key, now),
+                    "pending_groups": state.summary.groups,
+                    "summaries_sent": state.summaries_sent,
+                }
+                for key, state in self._storms.items()
+            ],
+        }
@@ -0,0 +1,118 @@
+"""后台任务进程入口
+
+    python -m app.worker
+
+只运行告警评估调度器和告警管理器（分组工作器、通知队列消费者、通知发送），不提供 HTTP 接口。
+API 进程设置 RUN_BACKGROUND_TASKS=false 后，后台任务只在 worker 进程中运行，
+API 进程和 worker 进程可以按各自的负载独立扩缩容；多个 worker 进程通过 Redis 分摊分组和通知。
+"""
+import asyncio
+import signal
+from typing import Optional
+from loguru import logger
+
+from app.core.logger import setup_logging
+from app.db.database import engine
+from app.db.redis_client import RedisClient
+from app.services.evaluator import AlertEvaluationScheduler
+from app.services.alert_manager import AlertManager
+from app.services.datasource_client import DatasourceClient
+from app.services.silence_engine import silence_engine
+from app.services.silence_scheduler import SilenceScheduler
+
+
+# 全局调度器和告警管理器（评估告警时通过本模块获取同一个告警管理器）
+scheduler: Optional[AlertEvaluationScheduler] = None
+alert_manager: Optional[AlertManager] = None
+silence_scheduler: Optional[SilenceScheduler] = None
+
+
+async def start_background_tasks():
+    """创建告警评估调度器和告警管理器，并在后台任务中启动"""
+    global scheduler, alert_manager, silence_scheduler
+    
+    # 启动告警评估调度器（不传入会话，让调度器自己管理）
+    scheduler = AlertEvaluationScheduler()
+    
+    # 创建全局告警管理器并启动分组工作器（自动检测使用 Redis 或内存分组器）
+    # 不再传入会话，让 AlertManager 自己管理会话
+    alert_manager = AlertManager()
+    
+    # 配置告警分组参数
+    alert_manager.configure_grouper(
+        group_wait=10,       # 分组等待时间 10 秒
+        group_interval=30,   # 分组间隔 30 秒
+        repeat_interval=3600 # 重复发送间隔 1 小时
+    )
+    
+    # 静默调度器：静默生效 / 结束时批量更新告警静默状态，静默结束后立即通知
+    silence_scheduler = SilenceScheduler(alert_manager)
+    
+    # 在后台任务中启动调度器和分组工作器
+    asyncio.create_task(scheduler.start())
+    asyncio.create_task(alert_manager.start_grouping_worker())
+    await silence_scheduler.start()
+    logger.info("后台任务已启动（告警评估调度器、告警分组工作器、静默调度器）")
+
+
+async def stop_background_tasks():
+    """停止告警评估调度器、静默调度器和告警分组工作器"""
+    if scheduler:
+        await scheduler.stop()
+    if silence_scheduler:
+        await silence_scheduler.stop()
+    if alert_manager:
+        await alert_manager.stop_grouping_worker()
+
+
+async def run():
+    """运行后台任务直到收到 SIGINT / SIGTERM"""
+    logger.info("后台任务进程启动中...")
+    
+    # 初始化 Redis 连接
+    try:
+        await RedisClient.initialize()
+        logger.info("✅ Redis 连接已初始化")
+    except Exception as e:
+        logger.warning(f"⚠️  Redis 连接失败，将使用内存分组器: {str(e)}")
+    
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Windows 事件循环不支持信号处理器，依赖 KeyboardInterrupt 退出
+            pass
+    
+    # 订阅静默规则变更（静默规则在 API 进程中修改）
+    await silence_engine.start()
+    await start_background_tasks()
+    logger.info("后台任务进程启动完成")
+    
+    try:
+        await stop_event.wait()
+    finally:
+        logger.info("后台任务进程关闭中...")
+        await stop_background_tasks()
+        await silence_engine.stop()
+        await engine.dispose()
+        
+        # 关闭数据源连接池
+        await DatasourceClient.close()
+        
+        # 关闭 Redis 连接
+        await RedisClient.close()
+        logger.info("后台任务进程已关闭")
+
+
+def main():
+    setup_logging()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""为 alert_event 添加抖动状态字段（is_flapping / flap_rate）"""
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.db.database import engine
+from sqlalchemy import text
+
+
+async def add_columns():
+    """添加字段"""
+    async with engine.begin() as conn:
+        print("检查 alert_event 表结构...")
+        result = await conn.execute(text("""
+            SELECT COLUMN_NAME
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'alert_event'
+        """))
+        columns = {row[0] for row in result.fetchall()}
+        
+        if 'is_flapping' not in columns:
+            await conn.execute(text("""
+                ALTER TABLE alert_event
+                ADD COLUMN is_flapping BOOLEAN NOT NULL DEFAULT FALSE COMMENT '是否抖动'
+            """))
+            print("✓ 已添加 is_flapping 字段")
+        else:
+            print("✓ is_flapping 字段已存在")
+        
+        if 'flap_rate' not in columns:
+            await conn.execute(text("""
+                ALTER TABLE alert_event
+                ADD COLUMN flap_rate FLOAT DEFAULT 0 COMMENT '状态变化率'
+            """))
+            print("✓ 已添加 flap_rate 字段")
+        else:
+            print("✓ flap_rate 字段已存在")
+
+
+async def main():
+    try:
+        await add_columns()
+    except Exception as e:
+        print(f"\n❌ 错误: {str(e)}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+"""为 alert_event 添加静默状态字段（is_silenced）
+
+添加后由后台任务进程的静默调度器在启动时按当前生效的静默规则回填。
+"""
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.db.database import engine
+from sqlalchemy import text
+
+
+async def add_column():
+    """添加字段和索引"""
+    async with engine.begin() as conn:
+        print("检查 alert_event 表结构...")
+        result = await conn.execute(text("""
+            SELECT COLUMN_NAME
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'alert_event'
+        """))
+        columns = {row[0] for row in result.fetchall()}
+        
+        if 'is_silenced' not in columns:
+            await conn.execute(text("""
+                ALTER TABLE alert_event
+                ADD COLUMN is_silenced BOOLEAN NOT NULL DEFAULT FALSE COMMENT '是否被静默',
+                ADD INDEX idx_alert_event_is_silenced (is_silenced)
+            """))
+            print("✓ 已添加 is_silenced 字段")
+        else:
+            print("✓ is_silenced 字段已存在")
+
+
+async def main():
+    try:
+        await add_column()
+    except Exception as e:
+        print(f"\n❌ 错误: {str(e)}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
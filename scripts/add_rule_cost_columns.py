@@ -0,0 +1,74 @@
+"""为 alert_rule 添加查询成本字段（cost_score / cost_detail）并回填静态评分"""
+import sys
+import json
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.db.database import engine
+from app.services.promql_analyzer import analyze_rule_cost
+from sqlalchemy import text
+
+
+async def add_columns():
+    """添加字段并回填"""
+    async with engine.begin() as conn:
+        print("检查 alert_rule 表结构...")
+        result = await conn.execute(text("""
+            SELECT COLUMN_NAME 
+            FROM INFORMATION_SCHEMA.COLUMNS 
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'alert_rule'
+        """))
+        columns = {row[0] for row in result.fetchall()}
+        
+        if 'cost_score' not in columns:
+            await conn.execute(text("""
+                ALTER TABLE alert_rule 
+                ADD COLUMN cost_score FLOAT DEFAULT 0 COMMENT '查询成本评分'
+            """))
+            print("✓ 已添加 cost_score 字段")
+        else:
+            print("✓ cost_score 字段已存在")
+        
+        if 'cost_detail' not in columns:
+            await conn.execute(text("""
+                ALTER TABLE alert_rule 
+                ADD COLUMN cost_detail JSON COMMENT '查询成本分析详情'
+            """))
+            print("✓ 已添加 cost_detail 字段")
+        else:
+            print("✓ cost_detail 字段已存在")
+        
+        # 回填静态评分（不做基数探测，规则下次保存时会重新探测）
+        result = await conn.execute(text("""
+            SELECT id, name, expr, eval_interval 
+            FROM alert_rule 
+            WHERE cost_detail IS NULL
+        """))
+        rules = result.fetchall()
+        print(f"\n回填 {len(rules)} 条规则的成本评分：")
+        print("-" * 80)
+        
+        for rule_id, name, expr, eval_interval in rules:
+            cost = await analyze_rule_cost(expr, eval_interval or 60, probe=False)
+            await conn.execute(
+                text("UPDATE alert_rule SET cost_score = :score, cost_detail = :detail WHERE id = :id"),
+                {"score": cost["score"], "detail": json.dumps(cost, ensure_ascii=False), "id": rule_id}
+            )
+            print(f"  ID: {rule_id:3d} | {name:40s} | {cost['level']:6s} | score: {cost['score']}")
+
+
+async def main():
+    try:
+        await add_columns()
+    except Exception as e:
+        print(f"\n❌ 错误: {str(e)}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -173,6 +173,8 @@ CREATE TABLE `alert_rule` (
   `labels` JSON COMMENT '标签',
   `annotations` JSON COMMENT '注释',
   `route_config` JSON COMMENT '路由配置',
+  `cost_score` FLOAT DEFAULT 0 COMMENT '查询成本评分',
+  `cost_detail` JSON COMMENT '查询成本分析详情',
   `description` TEXT COMMENT '描述',
   `is_enabled` BOOLEAN DEFAULT TRUE COMMENT '是否启用',
   `datasource_id` INT NOT NULL COMMENT '数据源ID',
@@ -198,6 +200,9 @@ CREATE TABLE `alert_event` (
   `rule_name` VARCHAR(200) NOT NULL COMMENT '规则名称',
   `status` VARCHAR(20) NOT NULL DEFAULT 'pending' COMMENT '状态',
   `severity` VARCHAR(20) NOT NULL COMMENT '严重程度',
+  `is_silenced` BOOLEAN NOT NULL DEFAULT FALSE COMMENT '是否被静默',
+  `is_flapping` BOOLEAN NOT NULL DEFAULT FALSE COMMENT '是否抖动',
+  `flap_rate` FLOAT DEFAULT 0 COMMENT '状态变化率',
   `labels` JSON COMMENT '标签',
   `annotations` JSON COMMENT '注释',
   `expr` TEXT COMMENT '查询表达式',
@@ -211,6 +216,7 @@ CREATE TABLE `alert_event` (
   INDEX `idx_alert_event_rule_id` (`rule_id`),
   INDEX `idx_alert_event_fingerprint` (`fingerprint`),
   INDEX `idx_alert_event_status` (`status`),
+  INDEX `idx_alert_event_is_silenced` (`is_silenced`),
   INDEX `idx_alert_event_tenant_id` (`tenant_id`),
   INDEX `idx_alert_event_started_at` (`started_at`),
   FOREIGN KEY (`tenant_id`) REFERENCES `tenant`(`id`) ON DELETE CASCADE,